@@ -0,0 +1,7 @@
+@rem %USERPROFILE% = C:\Users\%USERNAME%
+call %USERPROFILE%\Anaconda3\Scripts\activate.bat
+call cd..\..
+call activate ephys-analysis-tools-env
+call python src\run_scripts\hct_watch_transcriptomics_reports.py
+call conda deactivate
+@pause
\ No newline at end of file
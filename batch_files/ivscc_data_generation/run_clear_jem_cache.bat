@@ -0,0 +1,6 @@
+@rem %USERPROFILE% = C:\Users\%USERNAME%
+call %USERPROFILE%\Anaconda3\Scripts\activate.bat
+call cd..\..
+call activate ephys-analysis-tools-env
+call python src\run_scripts\clear_jem_cache.py
+call conda deactivate
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+-----------------------------------------------------------------------
+File name: benchmark_json_backend.py
+Maintainer: Ramkumar Rajanbabu
+-----------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: Micro-benchmark of JSON decoding (standard library vs fast
+backend) on JEM files and pipeline output files
+-----------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import sys
+# File imports
+from functions.file_functions import get_jsons
+from functions.json_functions import JSON_BACKEND, benchmark_json_decoding
+
+
+def benchmark_json_backend(extra_paths=None, n_jem_files=200, repeat=5):
+	"""
+	Prints JSON decoding times per file for recent JEM files and other JSON files
+	(ex. EPHYS_FEATURE_EXTRACTION_V3_QUEUE_*_output.json).
+
+	Parameters:
+		extra_paths (list): paths to other JSON files to benchmark.
+		n_jem_files (int): number of JEM files to benchmark.
+		repeat (int): number of times every file is decoded.
+
+	Returns:
+		None
+	"""
+
+	json_dir = "//allen/programs/celltypes/workgroups/279/Patch-Seq/all-metadata-files"
+	file_groups = {"JEM files": get_jsons(dirname=json_dir, expt="PS", delta_days=30)[0:n_jem_files]}
+	if extra_paths:
+		file_groups["Other JSON files"] = extra_paths
+
+	print("Fast JSON backend: %s" %JSON_BACKEND)
+	for group, paths in file_groups.items():
+		if len(paths) == 0:
+			continue
+		timings = benchmark_json_decoding(paths, repeat=repeat)
+		baseline = timings["json (text)"]
+		print("\n%s (%s files)" %(group, len(paths)))
+		for name, seconds in timings.items():
+			print("  %-16s %8.3f ms/file  (x%.1f)" %(name, seconds*1000, baseline/seconds if seconds > 0 else 0))
+
+
+if __name__ == "__main__":
+	benchmark_json_backend(extra_paths=sys.argv[1:])
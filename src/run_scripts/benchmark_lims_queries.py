@@ -0,0 +1,72 @@
+"""
+-----------------------------------------------------------------------
+File name: benchmark_lims_queries.py
+Maintainer: Ramkumar Rajanbabu
+-----------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: Times the LIMS queries on a local Postgres stand-in of LIMS
+(python benchmark_lims_queries.py [n_cells] seeds the stand-in first)
+-----------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import sys
+import time
+from functools import partial
+# File imports
+from functions.lims_functions import (COLLAB_CONTAINER_PREFIXES, HCT_TUBE_NUMBERS, create_collab_transcriptomics_query_to_df,
+                                      create_hct_transcriptomics_query_to_df, create_ivscc_transcriptomics_query_to_df,
+                                      get_lims, get_lims_ephys, get_lims_sweep, get_lims_sweeps, run_lims_queries,
+                                      set_lims_backend)
+from functions.lims_standin import STANDIN_SWEEPS_PER_CELL, create_lims_standin
+
+
+def benchmark_lims_queries(n_cells=None, repeat=3):
+	"""
+	Prints the time of every LIMS query (best of repeat runs) on the local Postgres stand-in.
+
+	Parameters:
+		n_cells (int): number of cells to seed the stand-in with first, or None to use the seeded stand-in.
+		repeat (int): number of runs of every query.
+
+	Returns:
+		None
+	"""
+
+	backend = set_lims_backend("standin")
+	if n_cells is not None:
+		start = time.time()
+		n_rows = create_lims_standin(backend, n_cells=n_cells, sweeps_per_cell=STANDIN_SWEEPS_PER_CELL)
+		print("Seeded the LIMS stand-in (%s) in %.1f s: %s" %(backend.database, time.time() - start, n_rows))
+
+	ephys_df = get_lims_ephys()
+	cell_names = list(ephys_df["cell_name"])
+	queries = {"get_lims (all cells)": partial(get_lims, cache=False),
+			   "get_lims (ivscc daily)": partial(get_lims, date=ephys_df["tube_id"].iloc[0][5:11], exclude_prefixes=COLLAB_CONTAINER_PREFIXES,
+												 exclude_tube_numbers=HCT_TUBE_NUMBERS, cache=False),
+			   "get_lims_ephys": get_lims_ephys,
+			   "get_lims_sweep (1 cell)": partial(get_lims_sweep, cell_names[0]),
+			   "get_lims_sweeps (%s cells)" %len(cell_names): partial(get_lims_sweeps, cell_names=cell_names),
+			   "ivscc transcriptomics query": create_ivscc_transcriptomics_query_to_df,
+			   "hct transcriptomics query": create_hct_transcriptomics_query_to_df,
+			   "collaborator transcriptomics query": create_collab_transcriptomics_query_to_df}
+
+	print("\n%-36s %10s %10s" %("Query", "Seconds", "Rows"))
+	for name, query in queries.items():
+		timings = []
+		for run in range(repeat):
+			start = time.time()
+			df = query()
+			timings.append(time.time() - start)
+		print("%-36s %10.3f %10s" %(name, min(timings), len(df)))
+
+	start = time.time()
+	run_lims_queries(queries)
+	print("%-36s %10.3f" %("All queries (concurrently)", time.time() - start))
+
+
+if __name__ == "__main__":
+	benchmark_lims_queries(n_cells=int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,22 @@
+"""
+-------------------------------------------------------------------------
+File name: clear_jem_cache.py
+Maintainer: Ramkumar Rajanbabu
+-------------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: Delete the local JEM cache so every JEM file is flattened again
+-------------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# File imports
+from functions.jem_cache import JEM_CACHE_PATH, clear_jem_cache
+
+
+if __name__ == "__main__":
+    if clear_jem_cache():
+        print("\nDeleted the JEM cache (%s)." %JEM_CACHE_PATH)
+    else:
+        print("\nNo JEM cache found (%s)." %JEM_CACHE_PATH)
@@ -18,6 +18,8 @@ import os
 import pandas as pd
 from datetime import datetime
 from pathlib import Path, PureWindowsPath
+# File imports
+from functions.file_manifest import scan_dir
 
 
 #-----Functions-----#
@@ -115,12 +117,10 @@ def get_jsons(dirname, expt, delta_days=None):
         oldest_date = datetime(2016,1,1)
         delta_days = (comparison_date - oldest_date).days 
     
-    for jfile in os.listdir(dirname):
-        if fnmatch.fnmatch(jfile,'*%s.json' %expt):
-            jpath = os.path.join(dirname, jfile)
-            created_date = datetime.fromtimestamp(os.path.getctime(jpath))
-            if abs((comparison_date - created_date ).days) < delta_days:
-                json_paths.append(jpath)
+    for jpath, stat in scan_dir(dirname, '*%s.json' %expt):
+        created_date = datetime.fromtimestamp(stat.st_ctime)
+        if abs((comparison_date - created_date ).days) < delta_days:
+            json_paths.append(jpath)
     return json_paths
 
 
@@ -0,0 +1,331 @@
+"""
+---------------------------------------------------------------------
+File name: file_manifest.py
+Maintainer: Ramkumar Rajanbabu
+---------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: Persistent manifest of directory listings (size, mtime and
+ctime of every file) used to discover JEM files
+---------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import fnmatch
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+# File imports
+from functions.json_functions import loads
+
+
+#-----Variables-----#
+# Bump when the manifest file format changes
+MANIFEST_VERSION = 3
+# Local manifest file (kept off the network share on purpose)
+FILE_MANIFEST_PATH = os.path.join(os.path.expanduser("~"), ".ephys-analysis-tools", "file_manifest.json")
+# On Windows the stat data of each directory entry comes with the listing (no extra round trip per file)
+STAT_FROM_LISTING = (os.name == "nt")
+# Threads listing directories in FileManifest.walk
+WALK_THREADS = 16
+# Stat fields kept for every file
+FileStat = namedtuple("FileStat", ["st_size", "st_mtime", "st_ctime"])
+# Stats read from the file system by scans and walks in this process (path: FileStat)
+_scanned_stats = {}
+
+
+#-----Functions-----#
+def get_scanned_stat(path):
+    """
+    Returns the stat of a file read during a directory scan in this process, so
+    callers do not stat the file again.
+
+    Parameters:
+        path (string): path to a file.
+
+    Returns:
+        stat (FileStat): st_size, st_mtime and st_ctime of the file, or None if not scanned.
+    """
+
+    return _scanned_stats.get(path)
+
+
+def _list_dir(dirname, pattern):
+    """
+    Lists a directory with os.scandir, with the stat data of every matching file (from
+    the listing on Windows, one stat per file elsewhere). Safe to run on several threads.
+
+    Parameters:
+        dirname (string): path to a directory.
+        pattern (string): fnmatch pattern of file names.
+
+    Returns:
+        files (dictionary): name: [size, mtime, ctime] of every matching file, in listing order.
+        subdirs (list): (name, mtime) of every subdirectory (mtime is None if not known from the listing).
+        n_statted (int): number of files stat-ed.
+    """
+
+    files = {}
+    subdirs = []
+    n_statted = 0
+    with os.scandir(dirname) as dir_entries:
+        for entry in dir_entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                # (As os.walk, symbolic links to directories are not followed)
+                if not entry.is_symlink():
+                    subdirs.append((entry.name, entry.stat().st_mtime if STAT_FROM_LISTING else None))
+                continue
+            if not fnmatch.fnmatch(entry.name, pattern):
+                continue
+            # (Every file is stat-ed: a file rewritten in place keeps its inode, so a
+            # manifest entry cannot tell whether its size or mtime changed)
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # (Removed since the listing)
+                continue
+            if not STAT_FROM_LISTING:
+                n_statted += 1
+            files[entry.name] = [stat.st_size, stat.st_mtime, stat.st_ctime]
+            _scanned_stats[entry.path] = FileStat(*files[entry.name])
+
+    return files, subdirs, n_statted
+
+
+def scan_dir(dirname, pattern="*"):
+    """
+    Lists the files of a directory matching a pattern, with their stat data.
+
+    Parameters:
+        dirname (string): path to a directory.
+        pattern (string): fnmatch pattern of file names (ex. "*PS.json").
+
+    Returns:
+        files (list): (path, FileStat) of every matching file, in listing order.
+    """
+
+    files, subdirs, n_statted = _list_dir(dirname, pattern)
+
+    return [(os.path.join(dirname, name), FileStat(*info)) for name, info in files.items()]
+
+
+def _walk_dir(dirname, pattern, record=None, mtime=None):
+    """
+    Lists a directory of a tree walk, unless its mtime matches its manifest record
+    (no files or subdirectories were added, removed or renamed since it was listed).
+
+    Parameters:
+        dirname (string): path to a directory.
+        pattern (string): fnmatch pattern of file names.
+        record (dictionary): manifest record of the directory, or None.
+        mtime (float): mtime of the directory if known from its parent's listing, or None.
+
+    Returns:
+        mtime (float): mtime of the directory.
+        files (dictionary): name: [size, mtime, ctime] of every matching file, or None if unchanged.
+        subdirs (list): (name, mtime) of every subdirectory.
+        n_statted (int): number of files stat-ed.
+        Returns None if the directory cannot be listed (skipped, as os.walk does).
+    """
+
+    try:
+        if mtime is None:
+            mtime = os.stat(dirname).st_mtime
+        if (record is not None) and (record["mtime"] == mtime) and (record["pattern"] == pattern):
+            return mtime, None, [(name, None) for name in record["subdirs"]], 0
+        files, subdirs, n_statted = _list_dir(dirname, pattern)
+    except OSError:
+        return None
+
+    return mtime, files, subdirs, n_statted
+
+
+#-----Classes-----#
+class FileManifest(object):
+    """
+    A persistent manifest of directory listings: the size, mtime, ctime (creation time on
+    Windows) and last-seen time of every file, keyed by directory and file name.
+
+    Tree walks list directories with os.scandir (see _list_dir) on a thread pool, keep
+    the mtime and subdirectories of every directory, and skip listing directories whose
+    mtime is unchanged.
+    """
+
+    def __init__(self, manifest_path=FILE_MANIFEST_PATH):
+        """
+        Parameters:
+            manifest_path (string): path to the manifest file (None keeps the manifest in memory only).
+        """
+
+        self.manifest_path = manifest_path
+        self.n_statted = 0
+        self.n_listed = 0
+        self.n_unchanged = 0
+        self._dirs = None
+        self._dirty = False
+
+    def load(self):
+        """
+        Reads the manifest file, discarding it if it cannot be read or has another version.
+
+        Parameters:
+            None
+
+        Returns:
+            n_dirs (int): number of directories in the manifest.
+        """
+
+        self._dirs = {}
+        if self.manifest_path is None or not os.path.exists(self.manifest_path):
+            return 0
+        try:
+            with open(self.manifest_path, "rb") as manifest_file:
+                manifest = loads(manifest_file.read())
+        except (OSError, ValueError):
+            print("File manifest could not be read - rebuilding %s." %self.manifest_path)
+            return 0
+        if manifest.get("version") == MANIFEST_VERSION:
+            self._dirs = manifest["dirs"]
+
+        return len(self._dirs)
+
+    def walk(self, top, pattern="*", threads=WALK_THREADS, preserve_order=True):
+        """
+        Lists the files of a directory tree matching a pattern, listing sibling directories
+        on a thread pool and skipping directories whose mtime is unchanged.
+
+        Parameters:
+            top (string): path to the top directory.
+            pattern (string): fnmatch pattern of file names (ex. "*PS.json").
+            threads (int): number of threads listing directories.
+            preserve_order (boolean): True returns files in os.walk order (top-down, in listing order),
+                False returns them in the order directories were listed.
+
+        Returns:
+            files (list): (path, FileStat) of every matching file.
+        """
+
+        if self._dirs is None:
+            self.load()
+        listed = {}
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+            pending = {executor.submit(_walk_dir, top, pattern, self._dirs.get(top)): top}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dirname = pending.pop(future)
+                    result = future.result()
+                    if result is None:
+                        continue
+                    mtime, files, subdirs, n_statted = result
+                    record = self._get_record(dirname)
+                    if files is None:
+                        self.n_unchanged += 1
+                    else:
+                        self.n_statted += n_statted
+                        self.n_listed += 1
+                        self._update_record(record, pattern, files)
+                        record["files"] = {name: record["files"][name] for name in files}
+                        record["mtime"] = mtime
+                        record["pattern"] = pattern
+                        record["subdirs"] = [name for name, subdir_mtime in subdirs]
+                    listed[dirname] = record
+                    for name, subdir_mtime in subdirs:
+                        subdir = os.path.join(dirname, name)
+                        pending[executor.submit(_walk_dir, subdir, pattern, self._dirs.get(subdir), subdir_mtime)] = subdir
+
+        # Forget directories of the tree that no longer exist
+        prefix = os.path.join(top, "")
+        for dirname in [dirname for dirname in self._dirs if dirname.startswith(prefix) and dirname not in listed]:
+            del self._dirs[dirname]
+        self._dirty = True
+
+        if preserve_order:
+            # Top-down, in listing order (as os.walk)
+            dirnames = []
+            stack = [top]
+            while stack:
+                dirname = stack.pop()
+                if dirname in listed:
+                    dirnames.append(dirname)
+                    stack.extend(reversed([os.path.join(dirname, name) for name in listed[dirname]["subdirs"]]))
+        else:
+            dirnames = list(listed)
+
+        return [(os.path.join(dirname, name), FileStat(*info[0:3])) for dirname in dirnames for name, info in listed[dirname]["files"].items()]
+
+    def _get_record(self, dirname):
+        """
+        Returns the manifest record of a directory, adding an empty record if needed.
+
+        Parameters:
+            dirname (string): path to a directory.
+
+        Returns:
+            record (dictionary): "mtime", "pattern", "subdirs" and "files" of the directory.
+        """
+
+        if self._dirs is None:
+            self.load()
+        record = self._dirs.get(dirname)
+        if record is None:
+            record = {"mtime": None, "pattern": None, "subdirs": [], "files": {}}
+            self._dirs[dirname] = record
+
+        return record
+
+    def _update_record(self, record, pattern, files):
+        """
+        Replaces the matching files of a directory record with newly listed files.
+
+        Parameters:
+            record (dictionary): manifest record of a directory.
+            pattern (string): fnmatch pattern the files were listed with.
+            files (dictionary): name: [size, mtime, ctime] of the listed files.
+
+        Returns:
+            None
+        """
+
+        now = time.time()
+        entries = record["files"]
+        # Forget files that are no longer listed
+        for name in [name for name in entries if name not in files and fnmatch.fnmatch(name, pattern)]:
+            del entries[name]
+        for name, info in files.items():
+            entries[name] = info + [now]
+        self._dirty = True
+
+    def save(self):
+        """
+        Writes the manifest file (written to a temporary file first, so a failed
+        save keeps the previous manifest).
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+
+        if self.manifest_path is None or not self._dirty:
+            return
+        manifest_dir = os.path.dirname(self.manifest_path)
+        if manifest_dir and not os.path.exists(manifest_dir):
+            os.makedirs(manifest_dir)
+        tmp_path = self.manifest_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as manifest_file:
+                json.dump({"version": MANIFEST_VERSION, "dirs": self._dirs}, manifest_file)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError:
+            print("File manifest could not be saved to %s." %self.manifest_path)
+        self._dirty = False
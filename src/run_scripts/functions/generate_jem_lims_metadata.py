@@ -20,6 +20,7 @@ from functions.file_functions import load_data_variables
 from functions.jem_functions import clean_date_field, clean_time_field, clean_num_field, clean_roi_field, \
 replace_value, add_jem_patch_tube_field, add_jem_species_field, get_project_channel, \
 fix_jem_versions
+from functions.jem_warehouse import read_jem_warehouse
 from functions.lims_functions import get_lims
 # Test imports
 import time # To measure program execution time
@@ -45,8 +46,8 @@ def main(file_type):
 	path_output = "//allen/programs/celltypes/workgroups/279/Patch-Seq/ivscc-data-warehouse/data-sources"
 	path_output_view = "//allen/programs/celltypes/workgroups/279/Patch-Seq/ivscc-data-warehouse/view-data-sources"
 
-	# Generate jem_df
-	jem_df = generate_jem_df()
+	# Generate jem_df (only the JEM fields that are renamed or kept)
+	jem_df = generate_jem_df(columns=list(data_variables["jem_dictionary"]) + data_variables["column_order_list"])
 	# Rename columns based on jem_dictionary
 	jem_df.rename(columns=data_variables["jem_dictionary"], inplace=True)
 
@@ -70,7 +71,7 @@ def main(file_type):
 	jem_df = add_jem_species_field(jem_df)
 
 	# Drop columns
-	jem_df.drop(columns=data_variables["drop_list"], inplace=True)
+	jem_df.drop(columns=data_variables["drop_list"], inplace=True, errors="ignore")
 
 	# Add lims_df
 	lims_df = get_lims()
@@ -97,34 +98,35 @@ def main(file_type):
 		jem_lims_df.to_excel(excel_writer=os.path.join(path_output_view, "jem_lims_metadata.xlsx"), index=False)
 
 
-def generate_jem_df():
+def generate_jem_df(columns=None, start_date=None, end_date=None):
 	"""
-	Generates a formatted version of JEM metadata by using csv files from compiled-jem-data. 
+	Generates a formatted version of JEM metadata from the JEM metadata warehouse.
 
 	Parameters:
-		None
+		columns (list): JEM fields to read (None reads every field).
+		start_date (string): first experiment date ("YYYY-MM-DD"), or None for every experiment.
+		end_date (string): last experiment date ("YYYY-MM-DD"), or None for every experiment.
 
 	Returns:
 		jem_df (dataframe): a pandas dataframe.
 	"""
 
-	# Directories
-	jem_raw_data_dir = "//allen/programs/celltypes/workgroups/279/Patch-Seq/ivscc-data-warehouse/data-sources/jem-raw-data-sources"
-	# Read all jem dataframes
-	jem_df = pd.read_csv(os.path.join(jem_raw_data_dir, "jem_metadata.csv"), low_memory=False)
-	jem_na_df = pd.read_csv(os.path.join(jem_raw_data_dir, "NA_jem_metadata.csv"), low_memory=False)
-	jem_fail_df = pd.read_csv(os.path.join(jem_raw_data_dir, "jem_metadata_wFAILURE.csv"), low_memory=False)
+	# Status values
+	success_list = ["SUCCESS", "SUCCESS (high confidence)"]
+	failure_list = ["FAILURE", "NO ATTEMPTS", "Failure"]
+	# Read successful experiments with tubes, successful experiments without tubes and failures
+	jem_df = read_jem_warehouse(columns, start_date, end_date, splits=["tube"], status=success_list)
+	jem_na_df = read_jem_warehouse(columns, start_date, end_date, splits=["na"], status=["SUCCESS"]) # (as filtered from NA_jem_metadata.csv)
+	jem_fail_df = read_jem_warehouse(columns, start_date, end_date, status=failure_list)
 	# Replace status values
-	jem_df["status"] = jem_df["status"].replace({"SUCCESS (high confidence)": "SUCCESS"})
-	jem_fail_df["status"] = jem_fail_df["status"].replace({"SUCCESS (high confidence)": "SUCCESS", "NO ATTEMPTS": "FAILURE", "Failure": "FAILURE"})
-	# Filter dataframe to only FAILURE
-	jem_fail_df = jem_fail_df[jem_fail_df["status"] == "FAILURE"]
-	# Filter tubes and NAs
-	jem_df = jem_df[(jem_df["status"] == "SUCCESS")&(~jem_df["container"].isnull())]
-	jem_na_df = jem_na_df[(jem_na_df["status"] == "SUCCESS")&(jem_na_df["container"].isnull())]
-	# Replace experiments without tubes with NA
-	jem_df["container"] = jem_df["container"].replace({np.nan: "NA"})
-	jem_na_df["container"] = jem_na_df["container"].replace({np.nan: "NA"})
+	for df in [jem_df, jem_na_df, jem_fail_df]:
+		if "status" in df.columns:
+			df["status"] = df["status"].replace({"SUCCESS (high confidence)": "SUCCESS", "NO ATTEMPTS": "FAILURE", "Failure": "FAILURE"})
+	# Filter NAs (read_csv kept the literal "na" containers of NA_jem_metadata.csv, which
+	# were then dropped as not missing) and replace experiments without tubes with NA
+	if "container" in jem_na_df.columns:
+		jem_na_df = jem_na_df[jem_na_df["container"].isnull()].reset_index(drop=True)
+		jem_na_df["container"] = "NA"
 	# Merge all jem dataframes
 	jem_df = pd.concat([jem_df, jem_na_df, jem_fail_df], ignore_index=True, sort=False)
 
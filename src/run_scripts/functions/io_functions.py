@@ -12,16 +12,22 @@ Description: IO related functions
 
 #-----Imports-----#
 # General imports
-import fnmatch
 import os
 import pandas as pd
 from datetime import datetime
+# File imports
+from functions import file_functions
+from functions.file_manifest import FILE_MANIFEST_PATH, WALK_THREADS, FileManifest
 
 
 #-----Functions-----#
-def get_jsons_walk(dirname, expt, delta_days=None):
+def get_jsons_walk(dirname, expt, delta_days=None, threads=WALK_THREADS, preserve_order=True, manifest_path=FILE_MANIFEST_PATH):
     """Return filepaths of metadata files that were created within
     delta_days of today. Searches within subdirectories as well.
+
+    Sibling directories are listed in parallel, and directories whose
+    mtime is unchanged since the last walk are not listed again (see
+    FileManifest.walk).
     
     Parameters
     ----------
@@ -32,6 +38,13 @@ def get_jsons_walk(dirname, expt, delta_days=None):
     delta_days : int
         A number of days in the past. If no number of days is provided, 
         make it approximately the number of days since jsons have been collected.
+    threads : int
+        Number of threads listing directories.
+    preserve_order : boolean
+        True returns filepaths in os.walk order, False in the order
+        directories were listed.
+    manifest_path : string
+        Path to the file manifest (None keeps it in memory only).
 
     Returns
     -------
@@ -40,19 +53,20 @@ def get_jsons_walk(dirname, expt, delta_days=None):
         created within delta_days of today.
     """
     
-    json_paths = []
     comparison_date = datetime.today()
     if delta_days is None:
         oldest_date = datetime(2016,1,1)
         delta_days = (comparison_date - oldest_date).days 
-    
-    for root, directories, jfiles in os.walk(dirname):
-        for jfile in jfiles: 
-            if fnmatch.fnmatch(jfile,'*%s.json' %expt):
-                jpath = os.path.join(root, jfile)
-                created_date = datetime.fromtimestamp(os.path.getctime(jpath))
-                if abs((comparison_date - created_date ).days) < delta_days:
-                    json_paths.append(jpath)
+
+    manifest = FileManifest(manifest_path)
+    jfiles = manifest.walk(dirname, '*%s.json' %expt, threads=threads, preserve_order=preserve_order)
+    manifest.save()
+
+    json_paths = []
+    for jpath, stat in jfiles:
+        created_date = datetime.fromtimestamp(stat.st_ctime)
+        if abs((comparison_date - created_date ).days) < delta_days:
+            json_paths.append(jpath)
     return json_paths
 
 
@@ -241,16 +255,5 @@ def get_jsons(dirname, expt, delta_days=None):
         created within delta_days of today.
     """
 
-    json_paths = []
-    comparison_date = datetime.today()
-    if delta_days is None:
-        oldest_date = datetime(2016,1,1)
-        delta_days = (comparison_date - oldest_date).days 
-    
-    for jfile in os.listdir(dirname):
-        if fnmatch.fnmatch(jfile,'*%s.json' %expt):
-            jpath = os.path.join(dirname, jfile)
-            created_date = datetime.fromtimestamp(os.path.getctime(jpath))
-            if abs((comparison_date - created_date ).days) < delta_days:
-                json_paths.append(jpath)
-    return json_paths
+    # (Same as file_functions.get_jsons, which keeps a file manifest)
+    return file_functions.get_jsons(dirname, expt, delta_days)
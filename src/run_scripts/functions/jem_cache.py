@@ -0,0 +1,464 @@
+"""
+---------------------------------------------------------------------
+File name: jem_cache.py
+Maintainer: Ramkumar Rajanbabu
+---------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: On-disk cache of flattened JEM files
+---------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import hashlib
+import json
+import numpy as np
+import os
+import tempfile
+import time
+# File imports
+from functions.file_functions import load_data_variables
+from functions.jem_data_set import get_ps_user_info_mtime
+# Optional imports (the cache is disabled without pyarrow)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+#-----Variables-----#
+# Bump when the flattened output of JemDataSet changes
+CACHE_VERSION = 3
+# Local cache file (kept off the network share on purpose)
+JEM_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".ephys-analysis-tools", "jem_cache.parquet")
+# Cache size limit, the least recently used files are evicted first
+JEM_CACHE_MAX_BYTES = 1024**3
+# Columns of a cached JEM file (repeated on every row of its attempt records)
+ENTRY_COLUMNS = [("path", "string"), ("size", "int64"), ("mtime", "float64"), ("expt_date", "string"),
+                 ("flattened", "bool_"), ("n_bytes", "int64"), ("last_used", "float64")]
+# Kinds of record values (a missing record value is a field absent from the record, None or NaN)
+VALUE, ABSENT, NONE, NAN = 0, 1, 2, 3
+# Arrow types stored as typed columns (other record fields are stored as JSON text)
+ARROW_TYPE_CHECKS = [pa.types.is_string, pa.types.is_int64, pa.types.is_float64, pa.types.is_boolean,
+                     pa.types.is_timestamp, pa.types.is_null] if pa is not None else []
+_missing = object()
+_no_record = object()
+
+
+#-----Functions-----#
+def get_cache_version():
+    """
+    Generates the cache version from CACHE_VERSION, the jem_dictionary in data_variables.json
+    and the modification time of ps_user_info.csv (flattened records hold the rig operator
+    logins and Patch-seq containers generated from it). ps_user_info.csv is not read here, its
+    modification time is the one get_ps_user_info checks.
+
+    Parameters:
+        None
+
+    Returns:
+        cache_version (string): a version string stored with the cache file.
+    """
+
+    data_variables = load_data_variables()
+    jem_dictionary = json.dumps(data_variables["jem_dictionary"], sort_keys=True)
+    jem_dictionary_hash = hashlib.sha1(jem_dictionary.encode("utf-8")).hexdigest()[0:12]
+    ps_user_info_mtime = get_ps_user_info_mtime()
+
+    return "%s-%s-%s" %(CACHE_VERSION, jem_dictionary_hash, repr(ps_user_info_mtime) if ps_user_info_mtime is not None else "none")
+
+
+def clear_jem_cache(cache_path=JEM_CACHE_PATH):
+    """
+    Deletes the JEM cache file so the next run flattens every file again.
+
+    Parameters:
+        cache_path (string): path to the cache file.
+
+    Returns:
+        removed (boolean): True if a cache file was removed.
+    """
+
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+        return True
+    return False
+
+
+def get_value_kind(value):
+    """
+    Parameters:
+        value: a record value (_missing if the field is absent from the record).
+
+    Returns:
+        kind (int): VALUE, or ABSENT, NONE or NAN for a missing value.
+    """
+
+    if value is _missing:
+        return ABSENT
+    if value is None:
+        return NONE
+    if isinstance(value, float) and value != value:
+        return NAN
+    return VALUE
+
+
+def estimate_records_bytes(records):
+    """
+    Estimates the size of attempt records: the length of text values and 8 bytes for other values.
+
+    Parameters:
+        records (list): attempt records of a JEM file.
+
+    Returns:
+        n_bytes (int): approximate size.
+    """
+
+    n_bytes = 0
+    for record in records:
+        for value in record.values():
+            n_bytes += len(value) if isinstance(value, str) else 8
+
+    return n_bytes
+
+
+def _encode_field(values):
+    """
+    Encodes the values of a record field as a column: a typed column if the values share
+    one scalar type (integers and floats are not mixed), else a column of JSON text.
+
+    Parameters:
+        values (list): value of every row (_missing if absent from the record, _no_record for rows without a record).
+
+    Returns:
+        array (pyarrow array): the values, null where missing.
+        kinds (list): kind of every row (see get_value_kind), None for rows without a record.
+        encoding (string): "arrow" or "json".
+    """
+
+    kinds = [get_value_kind(value) if value is not _no_record else None for value in values]
+    present = [value if kind == VALUE else None for value, kind in zip(values, kinds)]
+    try:
+        array = pa.array(present, from_pandas=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        array = None
+    if array is not None:
+        is_scalar = any(check(array.type) for check in ARROW_TYPE_CHECKS)
+        mixes_numbers = pa.types.is_float64(array.type) and any(isinstance(value, int) for value in present)
+        if is_scalar and not mixes_numbers:
+            return array, kinds, "arrow"
+    array = pa.array([json.dumps(value) if kind == VALUE else None for value, kind in zip(present, kinds)], pa.string())
+
+    return array, kinds, "json"
+
+
+#-----Classes-----#
+class JemCache(object):
+    """
+    A persistent cache of flattened JEM files keyed by file path, size and mtime.
+
+    Each cached file keeps its experiment date and, when the file was inside a
+    flattening window, its flattened attempt records. The parquet file has one row
+    per attempt record (one row for a file without records), with the record fields
+    as columns of a "record" struct. Fields whose values do not share one type are
+    stored as JSON text, and the kind of every missing value (absent, None or NaN)
+    is kept, so that cached and freshly parsed files combine to identical output.
+    """
+
+    def __init__(self, cache_path=JEM_CACHE_PATH, max_bytes=JEM_CACHE_MAX_BYTES):
+        """
+        Parameters:
+            cache_path (string): path to the cache file.
+            max_bytes (int): maximum size of cached slice data before eviction.
+        """
+
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.enabled = pa is not None
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._dirty = False
+
+    def load(self):
+        """
+        Reads the cache file, discarding it if it was written by another cache version.
+
+        Parameters:
+            None
+
+        Returns:
+            n_entries (int): number of cached JEM files.
+        """
+
+        self._entries = {}
+        if not self.enabled:
+            print("pyarrow is not installed - JEM cache disabled.")
+            return 0
+        self.version = get_cache_version()
+        if not os.path.exists(self.cache_path):
+            return 0
+        try:
+            table = pq.read_table(self.cache_path)
+        except (OSError, pa.ArrowInvalid):
+            print("JEM cache could not be read - rebuilding %s." %self.cache_path)
+            self._dirty = True
+            return 0
+        metadata = table.schema.metadata or {}
+        if metadata.get(b"jem_cache_version", b"").decode("utf-8") != self.version:
+            print("JEM cache version changed - rebuilding %s." %self.cache_path)
+            self._dirty = True
+            return 0
+        self._entries = self._read_entries(table)
+
+        return len(self._entries)
+
+    def check_version(self):
+        """
+        Discards the cached entries if the cache version changed since they were loaded
+        (ex. ps_user_info.csv was updated while the cache was in use).
+
+        Parameters:
+            None
+
+        Returns:
+            changed (boolean): True if the entries were discarded.
+        """
+
+        if (not self.enabled) or (self._entries is None):
+            return False
+        version = get_cache_version()
+        if version == self.version:
+            return False
+        print("JEM cache version changed - rebuilding %s." %self.cache_path)
+        self.version = version
+        self._entries = {}
+        self._dirty = True
+        return True
+
+    def get(self, jem_path, stat=None):
+        """
+        Returns the cached entry of a JEM file if its size and mtime are unchanged.
+
+        Parameters:
+            jem_path (string): path to a JEM file.
+            stat (os.stat_result): stat of jem_path, if already known.
+
+        Returns:
+            entry (dictionary): "expt_date", "flattened" and "slice_data" of the file, or None.
+        """
+
+        if self._entries is None:
+            self.load()
+        entry = self._entries.get(jem_path)
+        if entry is not None:
+            if stat is None:
+                stat = os.stat(jem_path)
+            if (entry["size"] == stat.st_size) and (entry["mtime"] == stat.st_mtime):
+                self.hits += 1
+                entry["last_used"] = time.time()
+                self._dirty = True
+                slice_data = [dict(record) for record in entry["slice_data"]] if entry["slice_data"] is not None else None
+                return {"expt_date": entry["expt_date"], "flattened": entry["flattened"], "slice_data": slice_data}
+        self.misses += 1
+        return None
+
+    def put(self, jem_path, expt_date, slice_data=None, flattened=False, stat=None):
+        """
+        Adds or replaces the cached entry of a JEM file.
+
+        Parameters:
+            jem_path (string): path to a JEM file.
+            expt_date (string): experiment date ("YYYY-MM-DD").
+            slice_data (list): attempt records of the file, if the file was flattened.
+            flattened (boolean): True if slice_data holds the flattened file.
+            stat (os.stat_result): stat of jem_path, if already known.
+
+        Returns:
+            None
+        """
+
+        if self._entries is None:
+            self.load()
+        if stat is None:
+            stat = os.stat(jem_path)
+        records = [dict(record) for record in slice_data] if flattened else None
+        self._entries[jem_path] = {"path": jem_path,
+                                   "size": stat.st_size,
+                                   "mtime": stat.st_mtime,
+                                   "expt_date": expt_date,
+                                   "flattened": flattened,
+                                   "slice_data": records,
+                                   "n_bytes": estimate_records_bytes(records) if records is not None else 0,
+                                   "last_used": time.time()}
+        self._dirty = True
+
+    def evict(self):
+        """
+        Evicts the least recently used entries until the cache fits in max_bytes.
+
+        Parameters:
+            None
+
+        Returns:
+            n_evicted (int): number of evicted entries.
+        """
+
+        total_bytes = sum(entry["n_bytes"] for entry in self._entries.values())
+        n_evicted = 0
+        for entry in sorted(self._entries.values(), key=lambda x: x["last_used"]):
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= entry["n_bytes"]
+            del self._entries[entry["path"]]
+            n_evicted += 1
+        if n_evicted > 0:
+            self._dirty = True
+
+        return n_evicted
+
+    def save(self):
+        """
+        Writes the cache file (through a temporary file of its own, so a failed write or
+        another run saving at the same time never corrupts it). A failed write is reported
+        and the cache stays unsaved.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+
+        if (not self.enabled) or (self._entries is None) or (not self._dirty):
+            return
+        self.evict()
+        table = self._write_entries(list(self._entries.values()))
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_path))
+        temp_path = None
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_file, temp_path = tempfile.mkstemp(dir=cache_dir, prefix="jem_cache_", suffix=".tmp")
+            os.close(temp_file)
+            pq.write_table(table, temp_path)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            print("JEM cache could not be saved to %s." %self.cache_path)
+            if temp_path is not None and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            return
+        self._dirty = False
+
+    def _write_entries(self, entries):
+        """
+        Builds the cache table: one row per attempt record, with the record fields in a
+        "record" struct and the kinds of missing values in a "missing" struct (only for
+        fields with more than one kind of missing value, the others are in the metadata).
+
+        Parameters:
+            entries (list): cached entries.
+
+        Returns:
+            table (pyarrow table): the cache table.
+        """
+
+        rows = []
+        for entry in entries:
+            records = entry["slice_data"] if entry["flattened"] else None
+            if records:
+                rows += [(entry, record) for record in records]
+            else:
+                rows.append((entry, None))
+        columns = {name: pa.array([entry[name] for entry, record in rows], getattr(pa, type_name)()) for name, type_name in ENTRY_COLUMNS}
+        columns["has_record"] = pa.array([record is not None for entry, record in rows], pa.bool_())
+
+        fields = list(dict.fromkeys(field for entry, record in rows if record is not None for field in record))
+        field_info = []
+        record_arrays = []
+        missing_arrays = {}
+        for field in fields:
+            array, kinds, encoding = _encode_field([record.get(field, _missing) if record is not None else _no_record for entry, record in rows])
+            missing_kinds = set(kinds) - set([VALUE, None])
+            if len(missing_kinds) > 1:
+                missing_arrays[field] = pa.array(kinds, pa.int8())
+                missing_kind = None
+            else:
+                missing_kind = missing_kinds.pop() if missing_kinds else None
+            record_arrays.append(array)
+            field_info.append([field, encoding, missing_kind])
+        if len(fields) > 0:
+            columns["record"] = pa.StructArray.from_arrays(record_arrays, names=fields)
+        if len(missing_arrays) > 0:
+            columns["missing"] = pa.StructArray.from_arrays(list(missing_arrays.values()), names=list(missing_arrays))
+
+        metadata = {"jem_cache_version": self.version, "jem_cache_fields": json.dumps(field_info)}
+        return pa.table(columns).replace_schema_metadata(metadata)
+
+    def _read_entries(self, table):
+        """
+        Reads the cached entries from a cache table (see _write_entries).
+
+        Parameters:
+            table (pyarrow table): the cache table.
+
+        Returns:
+            entries (dictionary): path: cached entry.
+        """
+
+        metadata = table.schema.metadata or {}
+        field_info = json.loads(metadata.get(b"jem_cache_fields", b"[]").decode("utf-8"))
+        records = [{} if has_record else None for has_record in table.column("has_record").to_pylist()]
+        record_column = table.column("record").combine_chunks() if "record" in table.column_names else None
+        missing_column = table.column("missing").combine_chunks() if "missing" in table.column_names else None
+        missing_fields = set(missing_column.type[idx].name for idx in range(missing_column.type.num_fields)) if missing_column is not None else set()
+        for field, encoding, missing_kind in field_info:
+            values = record_column.field(field).to_pylist()
+            kinds = missing_column.field(field).to_pylist() if field in missing_fields else None
+            for row, (record, value) in enumerate(zip(records, values)):
+                if record is None:
+                    continue
+                if value is not None:
+                    record[field] = json.loads(value) if encoding == "json" else value
+                    continue
+                kind = kinds[row] if kinds is not None else missing_kind
+                if kind == NONE:
+                    record[field] = None
+                elif kind == NAN:
+                    record[field] = np.nan
+
+        entries = {}
+        entry_columns = {name: table.column(name).to_pylist() for name, type_name in ENTRY_COLUMNS}
+        for row, record in enumerate(records):
+            path = entry_columns["path"][row]
+            entry = entries.get(path)
+            if entry is None:
+                entry = {name: entry_columns[name][row] for name, type_name in ENTRY_COLUMNS}
+                entry["slice_data"] = [] if entry["flattened"] else None
+                entries[path] = entry
+            if (record is not None) and (entry["slice_data"] is not None):
+                entry["slice_data"].append(record)
+
+        return entries
+
+    def clear(self):
+        """
+        Deletes every cached entry and the cache file.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+
+        self._entries = None
+        self._dirty = False
+        clear_jem_cache(self.cache_path)
@@ -35,31 +35,277 @@
 #
 import os
 import sys
-import json
 import numpy as np
 import pandas as pd
+import random
 import re
+import time
 from datetime import datetime
 from dateutil import parser
 import pytz
 
 from cerberus import Validator, errors
-import functions.schemas
+from functions import schemas
+from functions.json_functions import loads
 
 
 import logging
 logger = logging.getLogger('jem-validation')
 
+# Experiment date probe: chunk size and maximum number of bytes read before a full parse
+PROBE_CHUNK_BYTES = 4096
+PROBE_MAX_BYTES = 65536
+_probe_token = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+_probe_value = re.compile(r'\s*:\s*("(?:[^"\\]|\\.)*")')
+
+# Validation modes: "off" (no validation), "sampled" (a random fraction of files) or "full" (every file)
+VALIDATION_MODES = ["off", "sampled", "full"]
+# Fraction of files validated in "sampled" mode
+VALIDATION_SAMPLE_FRACTION = 0.1
+# Columns of the validation error table
+VALIDATION_ERROR_COLUMNS = ["file_name", "limsSpecName", "attempt", "level", "field", "message"]
+
+# Patch-seq user info (rig operator name, login and user code)
+PS_USER_INFO_PATH = "//allen/programs/celltypes/workgroups/279/Patch-Seq/all-metadata-files/ps_user_info.csv"
+# Seconds between checks of the ps_user_info.csv modification time
+PS_USER_INFO_CHECK_INTERVAL = 60
+_ps_user_info = {"path": None, "mtime": None, "checked": None, "name_to_login": None, "login_to_p_user": None}
+
+
+def get_ps_user_info(path=None):
+    """Return the rig operator name to login and login to Patch-seq user code maps.
+    
+    The maps are loaded once per process and reloaded only when the modification
+    time of ps_user_info.csv changes (checked at most every PS_USER_INFO_CHECK_INTERVAL seconds).
+    
+    Parameters
+    ----------
+    path : string or None
+           path to ps_user_info.csv (defaults to PS_USER_INFO_PATH)
+           
+    Returns
+    -------
+    name_to_login : dictionary
+    login_to_p_user : dictionary
+    
+    Raises
+    ------
+    IOError : if ps_user_info.csv is not found
+    
+    """
+    
+    if path is None:
+        path = PS_USER_INFO_PATH
+    info = _ps_user_info
+    now = time.time()
+    if (info["path"] != path) or (info["checked"] is None) or (now - info["checked"] >= PS_USER_INFO_CHECK_INTERVAL):
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if (info["path"] != path) or (mtime != info["mtime"]):
+            info["name_to_login"] = None
+            info["login_to_p_user"] = None
+            if mtime is not None:
+                users = pd.read_csv(path)
+                info["name_to_login"] = users.set_index("name").to_dict()["login"]
+                info["login_to_p_user"] = users.set_index("login").to_dict()["p_user"]
+        info["path"] = path
+        info["mtime"] = mtime
+        info["checked"] = now
+    if info["name_to_login"] is None:
+        raise IOError("'ps_user_info.csv' not found: %s" %path)
+    return info["name_to_login"], info["login_to_p_user"]
+
+
+def get_ps_user_info_mtime(path=None):
+    """Return the modification time of the loaded ps_user_info.csv, checked as in
+    get_ps_user_info (the file is only read again when its modification time changes).
+    
+    Parameters
+    ----------
+    path : string or None
+           path to ps_user_info.csv (defaults to PS_USER_INFO_PATH)
+    
+    Returns
+    -------
+    mtime : float or None (if ps_user_info.csv is not found)
+    
+    """
+    
+    try:
+        get_ps_user_info(path)
+    except IOError:
+        pass
+    return _ps_user_info["mtime"]
+
+
+def export_ps_user_info(path=None):
+    """Return the loaded ps_user_info maps so they can be handed to worker processes.
+    
+    Returns
+    -------
+    info : dictionary
+    
+    """
+    
+    try:
+        get_ps_user_info(path)
+    except IOError:
+        pass
+    return dict(_ps_user_info)
+
+
+def set_ps_user_info(info):
+    """Install ps_user_info maps received from another process (e.g. as a Pool initializer),
+    so that worker processes do not read ps_user_info.csv themselves.
+    
+    Parameters
+    ----------
+    info : dictionary
+           output of export_ps_user_info
+    
+    """
+    
+    _ps_user_info.update(info)
+    _ps_user_info["checked"] = time.time()
+
+
+def probe_top_level_fields(text, fields):
+    """Return the string values of top-level fields found in the beginning of a JSON document.
+    
+    Parameters
+    ----------
+    text : string
+           start of a JSON document (may be cut off anywhere)
+    fields : tuple of strings
+           top-level field names to look for
+           
+    Returns
+    -------
+    found : dictionary
+            field name to value, for fields found at the top level of text
+    
+    """
+    
+    found = {}
+    depth = 0
+    for token in _probe_token.finditer(text):
+        t = token.group()
+        if t in ("{", "["):
+            depth += 1
+        elif t in ("}", "]"):
+            depth -= 1
+        elif depth == 1:
+            # Only keys are followed by a colon
+            value = _probe_value.match(text, token.end())
+            if value is not None:
+                try:
+                    key = loads(t)
+                    if key in fields:
+                        found[key] = loads(value.group(1))
+                except ValueError:
+                    continue
+                if len(found) == len(fields):
+                    break
+    return found
+
+
+def _compile_schema_patterns(schema_dict):
+    """Return compiled regular expressions for every 'regex' rule in the cerberus schemas.
+    
+    Parameters
+    ----------
+    schema_dict : dictionary
+           schema name to cerberus schema
+           
+    Returns
+    -------
+    patterns : dictionary
+           pattern string to compiled regular expression
+    
+    """
+    
+    patterns = {}
+    for schema in schema_dict.values():
+        for rules in schema.values():
+            if "regex" in rules:
+                pattern = rules["regex"]["pattern"]
+                patterns[pattern] = re.compile(pattern)
+    return patterns
+
+
+# Regular expressions of schemas.py, compiled once at import
+_schema_patterns = _compile_schema_patterns(schemas.schemas)
+# Reusable validators, one per schema name (see get_validator)
+_validators = {}
+
+
 class sliceValidator(Validator):
     def _validate_regex(self, regex_options, field, value):
         """ {'type': 'dict'} """
         pattern = regex_options['pattern']
         fail_message = regex_options['fail_message']
-        re_obj = re.compile(pattern)
+        re_obj = _schema_patterns.get(pattern)
+        if re_obj is None:
+            re_obj = _schema_patterns.setdefault(pattern, re.compile(pattern))
         if not re_obj.match(value):
             self._error(field, fail_message)
+
+
+def get_validator(schema_name):
+    """Return the reusable validator of a schema in schemas.py (built on first use).
+    
+    Building a cerberus validator checks and normalizes its schema, so validators are
+    built once per process and reused for every file and attempt.
+    
+    Parameters
+    ----------
+    schema_name : string
+           key of schemas.schemas (ex. "met_pipette")
+           
+    Returns
+    -------
+    validator : sliceValidator
+    
+    """
+    
+    validator = _validators.get(schema_name)
+    if validator is None:
+        validator = sliceValidator(schemas.schemas[schema_name])
+        validator.allow_unknown = True
+        _validators[schema_name] = validator
+    return validator
             
 
+def validation_error_rows(file_name, lims_spec_name, attempt, level, error_dict):
+    """Return the errors of one validator as rows of the validation error table.
+    
+    Parameters
+    ----------
+    file_name : string
+    lims_spec_name : string
+    attempt : int or np.nan
+           pipette attempt number (np.nan for slice errors)
+    level : string
+           "slice", "pipette" or "tube"
+    error_dict : dictionary
+           cerberus errors (field to list of messages)
+           
+    Returns
+    -------
+    rows : list of dictionaries
+    
+    """
+    
+    rows = []
+    for field, messages in error_dict.items():
+        for message in messages:
+            rows.append({"file_name": file_name, "limsSpecName": lims_spec_name, "attempt": attempt,
+                         "level": level, "field": field, "message": str(message)})
+    return rows
+
+
 def normalize_dt_format(val, pnw, fmt):
     """Determine whether a value is a string in the correct UTC format, and if not, convert it.
     
@@ -98,6 +344,93 @@ def normalize_dt_format(val, pnw, fmt):
 
 
 
+# Known JEM date/time formats (without UTC offset), tried before falling back to dateutil
+JEM_DATE_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%m/%d/%Y"]
+JEM_TIME_FORMATS = ["%H:%M:%S", "%H:%M"]
+# Below this many values, normalize_dt_series parses value by value (vectorized parsing has a fixed cost)
+DT_SERIES_MIN_VALUES = 50
+_dt_offset = re.compile(r"^(?P<body>.*?)\s*(?P<offset>Z|[+-]\d{2}:?\d{2})$")
+_dt_shapes = {f: re.escape(f).replace("%Y", r"\d{4}").replace("%m", r"\d{1,2}").replace("%d", r"\d{1,2}")
+              .replace("%H", r"\d{1,2}").replace("%M", r"[0-5]\d").replace("%S", r"[0-5]\d")
+              for f in JEM_DATE_FORMATS + JEM_TIME_FORMATS}
+
+
+def normalize_dt_series(values, pnw, fmt):
+    """Vectorized normalize_dt_format: convert a series of date/time strings to the output format.
+    
+    Values in one of the known JEM formats (with or without a UTC offset) are parsed
+    with explicit formats in bulk, and the -07:00 UTC default is applied in one pass.
+    Any other value goes through normalize_dt_format (dateutil), so the output is
+    identical to applying normalize_dt_format to every value. Short series (fewer than
+    DT_SERIES_MIN_VALUES values) go through normalize_dt_format directly.
+    
+    Parameters
+    ----------
+    values : pandas series
+    pnw : boolean 
+          indicates whether to use -07:00 UTC if UTC is missing
+    fmt : string
+          output format
+          
+    Returns
+    -------
+    normalized : pandas series of strings or np.nan
+    
+    """
+    
+    if len(values) < DT_SERIES_MIN_VALUES:
+        return values.apply(lambda x: normalize_dt_format(x, pnw=pnw, fmt=fmt)).astype(object)
+    normalized = pd.Series(np.nan, index=values.index, dtype=object)
+    is_str = values.map(type) == str
+    body_fmt = fmt[:-3] if fmt.endswith(" %z") else fmt
+    in_formats = JEM_DATE_FORMATS
+    if not any(d in fmt for d in ("%Y", "%y", "%m", "%d")):
+        # Time-only values are parsed with today's date by dateutil, only use them for time outputs
+        in_formats = JEM_DATE_FORMATS + JEM_TIME_FORMATS
+    
+    fast = pd.Series(dtype=object)
+    if is_str.any() and "%z" not in body_fmt:
+        text = pd.Series(pd.unique(values[is_str]))
+        parts = text.str.extract(_dt_offset)
+        has_offset = parts["offset"].notna()
+        body = parts["body"].where(has_offset, text)
+        parsed = pd.Series(pd.NaT, index=text.index, dtype="datetime64[ns]")
+        for in_fmt in in_formats:
+            todo = parsed.isna() & body.str.fullmatch(_dt_shapes[in_fmt])
+            if "%H" not in in_fmt:
+                # dateutil reads an offset after a date-only value as a time
+                todo = todo & ~has_offset
+            if todo.any():
+                parsed[todo] = pd.to_datetime(body[todo], format=in_fmt, errors="coerce")
+        ok = parsed.notna()
+        is_midnight = (parsed.dt.hour == 0) & (parsed.dt.minute == 0) & (parsed.dt.second == 0)
+        if fmt.endswith(" %z"):
+            # UTC offsets in strftime %z format (ex. "-07:00" -> "-0700", "Z" -> "+0000")
+            offset = parts["offset"].str.replace(":", "", regex=False).replace({"Z": "+0000"})
+            default_offset = "-0700" if pnw is True else ""
+            offset = offset.where(has_offset, np.where(is_midnight, "", default_offset))
+            fast = parsed[ok].dt.strftime(body_fmt) + " " + offset[ok]
+        else:
+            fast = parsed[ok].dt.strftime(body_fmt)
+        fast.index = text[ok]
+        missing_utc = text[ok & ~has_offset & ~is_midnight]
+        if pnw is not True:
+            for _ in range(values.isin(missing_utc).sum()):
+                print("Missing UTC.")
+    
+    in_fast = values.isin(fast.index) & is_str
+    normalized[in_fast] = values[in_fast].map(fast)
+    # Remaining values go through dateutil, once per distinct string
+    slow = values[~in_fast]
+    if pnw is True:
+        slow_str = slow[is_str[~in_fast]]
+        slow_map = {v: normalize_dt_format(v, pnw=pnw, fmt=fmt) for v in pd.unique(slow_str)}
+        normalized[slow_str.index] = slow_str.map(slow_map)
+        slow = slow[~is_str[~in_fast]]
+    normalized[slow.index] = slow.apply(lambda x: normalize_dt_format(x, pnw=pnw, fmt=fmt))
+    return normalized
+
+
 def stitch_container(user, date, tube_str):
     """Stitch together the Patch-seq container from user date and tube ID.
     
@@ -132,19 +465,260 @@ def stitch_container(user, date, tube_str):
     return container
 
 
+# Date and time fields normalized by _normalize_dates_times and normalize_dates_times
+JEM_DATE_FIELDS = ["acsfProductionDate", "blankFillDate"]
+JEM_TIME_FIELDS = ['extraction.timeExtractionEnd', 'extraction.timeExtractionStart', 'extraction.timeRetractionEnd',
+                   'extraction.timeRetractionStart', 'recording.timeStart', 'recording.timeWholeCellStart']
+# ROI fields (from different JEM versions) filled with "None, None"
+JEM_ROI_FIELDS = ["autoRoi", "manualRoi", "approach.autoRoi", "approach.manualRoi", "approach.anatomicalLocation"]
+# MET Production JEM form columns present in the final data (see _add_empty_columns)
+MET_COLUMNS = ['acsfProductionDate','acsfType','blankFillDate','date','flipped',
+               'formVersion','internalFillDate','limsSpecName',
+               'rigNumber','rigOperator','sliceQuality',
+               'approach.cellHealth','approach.creCell','approach.pilotName','approach.automation','approach.sliceHealth',
+               'approach.pipette_cleaned','approach.recycled_pipette','apporach.previous_profile','depth','auto_cell_attached','auto_break_in',
+               'extraction.endPipetteR','extraction.extractionObservations','extraction.nucleus','extraction.postPatch','extraction.pressureApplied',
+               'extraction.retractionPressureApplied','extraction.sampleObservations','extraction.timeExtractionEnd','extraction.timeExtractionStart',
+               'extraction.timeRetractionEnd','extraction.autoExtract','extraction.autoNucProfile','extraction.autoExtractStatus',
+               'extraction.autoExtractFailure','extraction.autoExtractTechFaislure','extraction.autoExtractGenFailure','extraction.autoExtractNotes',
+               'extracion.autoNucDeposit','extraction.autoNucDepositStatus','extraction.autoNucDepositFailure','extraction.fillquality',
+               'failureNotes','qcNotes','hypCellType','stimulusSet','recording.pipetteR',
+               'recording.timeStart','recording.timeWholeCellStart','status',
+               'attempt','roi','container']
+
+# JEM version families, newest first: (first version of the family, transformation plan)
+#  pipette_array: array of pipette attempts (pre-version 2 contains IVSCC, PatchSeq and Electroporation arrays)
+#  roi_fields: ROI source fields (auto ROI, then manual ROI if auto ROI is "None, None")
+#  container_source: "tubeID" (LIMS tube ID in extraction.tubeID) or "stitched" (from user, date and tube ID)
+#  slice_schema: slice schema name (schemas.py)
+#  normalize_rig_operator: replace full rig operator names (old JEM form style) with user logins
+JEM_VERSION_FAMILIES = [((2, 0, 2), {"family": "2.0.2+",
+                                     "pipette_array": "pipettes",
+                                     "roi_fields": ["autoRoi", "manualRoi"],
+                                     "container_source": "tubeID",
+                                     "slice_schema": "met_slice",
+                                     "normalize_rig_operator": False}),
+                        ((2,), {"family": "2.0.0-2.0.1",
+                                "pipette_array": "pipettes",
+                                "roi_fields": ["approach.autoRoi", "approach.manualRoi"],
+                                "container_source": "stitched",
+                                "slice_schema": "met_slice",
+                                "normalize_rig_operator": False}),
+                        ((), {"family": "1.x",
+                              "pipette_array": "pipettesPatchSeqPilot",
+                              "roi_fields": ["approach.anatomicalLocation"],
+                              "container_source": "stitched",
+                              "slice_schema": "met_slice_outdated",
+                              "normalize_rig_operator": True})]
+_version_plans = {}
+
+
+def parse_jem_version(version):
+    """Return a JEM version as a tuple of integers, so versions compare numerically.
+    
+    Parameters
+    ----------
+    version : string
+           JEM version (ex. "2.0.2")
+    
+    Returns
+    -------
+    version_tuple : tuple
+           (ex. (2, 0, 2))
+    
+    """
+    
+    return tuple(int(part) for part in re.findall(r"\d+", str(version)))
+
+
+def get_version_plan(version):
+    """Return the transformation plan of a JEM version's family (see JEM_VERSION_FAMILIES).
+    
+    Versions are parsed once, the plan of every version seen is kept.
+    
+    Parameters
+    ----------
+    version : string
+           JEM version (ex. "2.0.2")
+    
+    Returns
+    -------
+    plan : dictionary
+           family plan, with the parsed "version"
+    
+    """
+    
+    plan = _version_plans.get(version)
+    if plan is None:
+        parsed = parse_jem_version(version)
+        for first_version, family_plan in JEM_VERSION_FAMILIES:
+            if parsed >= first_version:
+                plan = dict(family_plan, version=parsed)
+                break
+        _version_plans[version] = plan
+    return plan
+
+
+def flatten_json_record(data, prefix="", record=None):
+    """Flatten nested dictionaries into one record with "." separated keys (as pd.json_normalize).
+    
+    Parameters
+    ----------
+    data : dictionary
+    prefix : string
+           key prefix of nested dictionaries
+    record : dictionary
+           record the flattened keys are added to
+           
+    Returns
+    -------
+    record : dictionary
+    
+    """
+    
+    if record is None:
+        record = {}
+    nested = []
+    for key, value in data.items():
+        if isinstance(value, dict):
+            nested.append((key, value))
+        else:
+            record[prefix + key] = value
+    # (Nested values follow top level values, empty dictionaries are dropped)
+    for key, value in nested:
+        flatten_json_record(value, prefix + key + ".", record)
+    return record
+
+
+def _is_null(value):
+    """Return True for values read as missing by pandas (None and NaN)."""
+    
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _coerce_numeric_fields(records, fields):
+    """Convert integer fields to float where a per-file dataframe would infer a float column.
+    
+    A column of numbers with missing values (or mixed int and float) becomes float64
+    when a dataframe is built from a single file, so the same values are written as
+    floats here to keep the combined data identical to concatenated per-file data.
+    
+    Parameters
+    ----------
+    records : list of dictionaries
+    fields : iterable of strings
+    
+    """
+    
+    for field in fields:
+        has_null = False
+        has_float = False
+        has_number = False
+        for record in records:
+            value = record.get(field)
+            if _is_null(value):
+                has_null = True
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                break
+            else:
+                has_number = True
+                has_float = has_float or isinstance(value, float)
+        else:
+            if has_number and (has_null or has_float):
+                for record in records:
+                    value = record.get(field)
+                    if _is_null(value):
+                        if field in record:
+                            record[field] = np.nan
+                    else:
+                        record[field] = float(value)
+
+
+def normalize_dates_times(data, pnw):
+    """Normalize the date, batch date and time stamp fields of a dataframe (see JemDataSet._normalize_dates_times).
+    
+    Parameters
+    ----------
+    data : pandas dataframe
+    pnw : boolean 
+          indicates whether to use -07:00 UTC if UTC is missing
+          
+    Returns
+    -------
+    data : pandas dataframe
+    
+    """
+    
+    fields = [("date", "%Y-%m-%d %H:%M:%S %z")]
+    fields += [(d, "%Y-%m-%d") for d in JEM_DATE_FIELDS]
+    fields += [(t, "%H:%M:%S %z") for t in JEM_TIME_FIELDS]
+    for field, fmt in fields:
+        if field in data.columns:
+            notnull = data[field].notnull()
+            if notnull.any():
+                values = data[field].astype(object)
+                values[notnull] = normalize_dt_series(data.loc[notnull, field], pnw=pnw, fmt=fmt)
+                data[field] = values
+        else:
+            data[field] = np.nan
+    return data
+
+
+def records_to_data(records, lab="AIBSPipeline"):
+    """Return one flattened slice metadata dataframe from the attempt records of many JEM files.
+    
+    Dates and times are normalized in bulk and the MET Production columns are added,
+    giving the same data as concatenating JemDataSet.get_data of every file.
+    
+    Parameters
+    ----------
+    records : list of dictionaries
+           attempt records from JemDataSet.get_records
+    lab : string
+           lab key of the JEM files
+           
+    Returns
+    -------
+    data : pandas dataframe
+    
+    """
+    
+    if len(records) == 0:
+        return pd.DataFrame()
+    data = pd.DataFrame(records)
+    data = normalize_dates_times(data, pnw=(lab == "AIBSPipeline"))
+    for c in MET_COLUMNS:
+        if c not in data.columns:
+            if c == "status":
+                data[c] = "NO ATTEMPTS"
+            else:
+                data[c] = np.nan
+    data = data.reindex(columns=sorted(data.columns))
+    
+    return data
+
+
 class JemDataSet(object):
     """ A very simple interface for extracting metadata from a JSON file
     created with JEM."""
 
 
-    def __init__(self, file_path, project_key=None, lab_key=None):
+    def __init__(self, file_path, project_key=None, lab_key=None, validation_mode="off", sample_fraction=VALIDATION_SAMPLE_FRACTION, raw=None):
         """ Initialize the NwbDataSet instance with a file name.
 
         Parameters
         ----------
         file_path: string
            JSON file path
+        validation_mode: string
+           "off", "sampled" or "full" (see VALIDATION_MODES)
+        sample_fraction: float
+           probability that the file is validated in "sampled" mode
+        raw: bytes
+           file contents, if already read (ex. by a read-ahead stage)
         """
+        if validation_mode not in VALIDATION_MODES:
+            raise ValueError("Unknown validation mode '%s', use one of %s." %(validation_mode, VALIDATION_MODES))
         default_project = "MET"
         default_lab = "AIBSPipeline"       
         
@@ -162,6 +736,7 @@ class JemDataSet(object):
             self.lab = lab_key
 
         self._version = None
+        self._plan = None
         self._date = None
         self.data = None
         self._slice_schema = None
@@ -169,7 +744,66 @@ class JemDataSet(object):
         self._pipette_array_name = None
         self._valid_slice = None
         self._valid_attempts = None
+        self._slice_info = None
+        self._load_error = None
+        self._raw = raw
+        self._probe_file = None
+        self._probe_raw = None
+        self.read_count = 0
+        self.validation_mode = validation_mode
+        self.sample_fraction = sample_fraction
+        self.validation_errors = []
+        self._validate_file = None
         
+
+    def _load_slice_info(self):
+        """ Reads and decodes the JSON file, keeping the parsed document so
+            that the version, date, validation and flattening steps all
+            share a single read of the file. Each open is counted in
+            'read_count'.
+
+            Returns
+            -------
+            dictionary: parsed JEM document
+
+            Raises
+            ------
+            ValueError: if the file does not contain valid JSON
+        """
+        if self._load_error is not None:
+            raise self._load_error
+        if self._slice_info is None and self._raw is None and self._probe_file is not None:
+            # (Continues reading the file left open by probe_experiment_date)
+            try:
+                self._raw = self._probe_raw + self._probe_file.read()
+            finally:
+                self.close()
+        if self._slice_info is None and self._raw is None:
+            with open(self.file_path, "rb") as data_file:
+                self.read_count += 1
+                self._raw = data_file.read()
+        if self._slice_info is None and self._raw is not None:
+            # (Decoded from bytes, the whole file may already be read by probe_experiment_date)
+            try:
+                self._slice_info = loads(self._raw)
+            except UnicodeDecodeError:
+                pass
+            except ValueError as e:
+                self._load_error = e
+                raise
+            finally:
+                self._raw = None
+        if self._slice_info is None:
+            # Not UTF-8, decode with the platform text encoding
+            with open(self.file_path) as data_file:
+                self.read_count += 1
+                try:
+                    self._slice_info = loads(data_file.read())
+                except ValueError as e:
+                    self._load_error = e
+                    raise
+        return self._slice_info
+
 	
     def get_jem_version(self):
         """ Returns the JEM version number, stored in the field 
@@ -180,18 +814,18 @@ class JemDataSet(object):
             -------
             string: "x.x.x"
         """
-        with open(self.file_path) as data_file:
-            try:
-                slice_info = json.load(data_file)
-            except ValueError as e:
-                logger.error("Unable to parse JSON data in %s.\n" %self.file_name)
-                #logger.warning(e)
-                #sys.exit("Unable to parse JSON data in %s." %self.file_name)
-                return None
+        try:
+            slice_info = self._load_slice_info()
+        except ValueError as e:
+            logger.error("Unable to parse JSON data in %s.\n" %self.file_name)
+            #logger.warning(e)
+            #sys.exit("Unable to parse JSON data in %s." %self.file_name)
+            return None
         try:
             self._version = slice_info["formVersion"]
         except KeyError:
             self._version = "1.0.0"
+        self._plan = get_version_plan(self._version)
         return self._version
     
     
@@ -203,12 +837,11 @@ class JemDataSet(object):
             string: "YYYY-MM-DD"
         """
         
-        with open(self.file_path) as data_file:
-            try:
-                slice_info = json.load(data_file)
-            except ValueError as e:
-                logger.warning(e)
-                sys.exit("Unable to parse JSON data in %s." %self.file_name)
+        try:
+            slice_info = self._load_slice_info()
+        except ValueError as e:
+            logger.warning(e)
+            sys.exit("Unable to parse JSON data in %s." %self.file_name)
         try:
             expt_date = parser.parse(slice_info["date"]).strftime("%Y-%m-%d")
             self._date = expt_date
@@ -220,6 +853,68 @@ class JemDataSet(object):
     
     
     
+    def probe_experiment_date(self):
+        """ Returns experiment date in YYYY-MM-DD format, reading only as much
+            of the file as needed to find the top-level 'date' and 'formVersion'
+            fields. Falls back to get_experiment_date (full parse) if 'date' is
+            not found within PROBE_MAX_BYTES or cannot be parsed.
+            
+            If the file is not read to the end, it is left open so that a full
+            parse continues reading it (see close).
+
+            Returns
+            -------
+            string: "YYYY-MM-DD"
+        """
+        
+        if self._slice_info is not None or self._load_error is not None:
+            return self.get_experiment_date()
+        
+        if self._raw is None and self._probe_file is None:
+            self._probe_file = open(self.file_path, "rb")
+            self.read_count += 1
+        raw = b""
+        found = {}
+        while True:
+            if self._probe_file is not None:
+                chunk = self._probe_file.read(PROBE_CHUNK_BYTES)
+            else:
+                chunk = self._raw[len(raw):len(raw) + PROBE_CHUNK_BYTES]
+            raw += chunk
+            found = probe_top_level_fields(raw.decode("utf-8", errors="replace"), ("date", "formVersion"))
+            if len(chunk) < PROBE_CHUNK_BYTES:
+                # Whole file read, keep it for the full parse
+                self._raw = raw
+                self.close()
+                if "formVersion" not in found:
+                    found["formVersion"] = "1.0.0"
+                break
+            if ("date" in found and "formVersion" in found) or len(raw) >= PROBE_MAX_BYTES:
+                if self._probe_file is not None:
+                    self._probe_raw = raw
+                break
+        
+        if "formVersion" in found:
+            self._version = found["formVersion"]
+            self._plan = get_version_plan(self._version)
+        try:
+            self._date = parser.parse(found["date"]).strftime("%Y-%m-%d")
+        except (KeyError, ValueError):
+            return self.get_experiment_date()
+        return self._date
+    
+    
+    def close(self):
+        """ Closes the file left open by probe_experiment_date (ex. when the
+            experiment date is outside the flattening window).
+        """
+        
+        if self._probe_file is not None:
+            self._probe_file.close()
+        self._probe_file = None
+        self._probe_raw = None
+    
+    
     def _is_field(self, colname):
         """Determine whether a column name exists in the attempts dataframe.
     
@@ -243,13 +938,11 @@ class JemDataSet(object):
     def _normalize_rig_operator(self):
         """ Replaces full rig operator name (old JEM form style) with user login."""
         
-        if self._version >= "2":
+        if not self._plan["normalize_rig_operator"]:
             return self.data
         else:
-            path = "//allen/programs/celltypes/workgroups/279/Patch-Seq/all-metadata-files/ps_user_info.csv"
             try:
-                users = pd.read_csv(path)
-                name_to_login = users.set_index("name").to_dict()["login"]
+                name_to_login, login_to_user = get_ps_user_info()
                 temp_df = self.data
                 temp_df.replace({"rigOperator": name_to_login}, inplace=True)
                 self.data = temp_df
@@ -263,9 +956,8 @@ class JemDataSet(object):
     def _normalize_dates_times(self):
         """ Normalizes date format in available date fields (from different JEM versions) as "YYYY-MM-DD"."""
     
-        date_fields =["acsfProductionDate", "blankFillDate"]
-        time_fields = ['extraction.timeExtractionEnd', 'extraction.timeExtractionStart', 'extraction.timeRetractionEnd',
-                       'extraction.timeRetractionStart', 'recording.timeStart', 'recording.timeWholeCellStart']
+        date_fields = JEM_DATE_FIELDS
+        time_fields = JEM_TIME_FIELDS
         
         # If UTC is missing and data was collected at AIBS, use -07:00 UTC.
         if self.lab == "AIBSPipeline":
@@ -276,17 +968,21 @@ class JemDataSet(object):
         temp_df = self.data
         
         # Recording Date and Time
-        temp_df["date"] = temp_df["date"].apply(lambda x: normalize_dt_format(x, pnw=pnw, fmt="%Y-%m-%d %H:%M:%S %z"))
+        temp_df["date"] = normalize_dt_series(temp_df["date"], pnw=pnw, fmt="%Y-%m-%d %H:%M:%S %z")
         # Batch Dates
         for d in date_fields:
             if self._is_field(d):
-                temp_df[d] = temp_df[d].apply(lambda x: normalize_dt_format(x, pnw=pnw, fmt="%Y-%m-%d"))
+                temp_df[d] = normalize_dt_series(temp_df[d], pnw=pnw, fmt="%Y-%m-%d")
             else:
                 temp_df[d] = np.nan
         # Experiment Time Stamps
         for t in time_fields:
             if self._is_field(t):
-                temp_df[t] = temp_df[t].apply(lambda x: normalize_dt_format(x, pnw=pnw, fmt="%H:%M:%S %z") if not pd.isnull(x) else x)           
+                notnull = temp_df[t].notnull()
+                if notnull.any():
+                    times = temp_df[t].astype(object)
+                    times[notnull] = normalize_dt_series(temp_df.loc[notnull, t], pnw=pnw, fmt="%H:%M:%S %z")
+                    temp_df[t] = times
             else:
                 temp_df[t] = np.nan
         
@@ -297,7 +993,7 @@ class JemDataSet(object):
     def _fillna_rois(self):
         """ Fills nans in all available roi fields (from different JEM versions) with "None, None"."""
     
-        roi_fields =["autoRoi", "manualRoi", "approach.autoRoi", "approach.manualRoi", "approach.anatomicalLocation"]
+        roi_fields = JEM_ROI_FIELDS
         temp_df = self.data
 
         for roi in roi_fields:
@@ -326,22 +1022,14 @@ class JemDataSet(object):
         self.data = self._fillna_rois()
         temp_df = self.data
         
-        if self._version >= "2.0.2":
-            autoRoi = "autoRoi"
-            manualRoi = "manualRoi"
-            roi = temp_df.apply(lambda x: x[autoRoi] if x[autoRoi] != "None, None" else x[manualRoi], axis=1)
-            temp_df.drop([autoRoi, manualRoi], axis=1, inplace=True)
-        
-        elif self._version >= "2":
-            autoRoi = "approach.autoRoi"
-            manualRoi = "approach.manualRoi"
-            roi = temp_df.apply(lambda x: x[autoRoi] if x[autoRoi] != "None, None" else x[manualRoi], axis=1)
-            temp_df.drop([autoRoi, manualRoi], axis=1, inplace=True)
-
+        roi_fields = self._plan["roi_fields"]
+        if len(roi_fields) > 1:
+            autoRoi, manualRoi = roi_fields
+            roi = temp_df[autoRoi].where(temp_df[autoRoi] != "None, None", temp_df[manualRoi])
         else:
-            unstructuredRoi = "approach.anatomicalLocation"
+            unstructuredRoi = roi_fields[0]
             roi = temp_df[unstructuredRoi]
-            temp_df.drop([unstructuredRoi], axis=1, inplace=True)
+        temp_df.drop(roi_fields, axis=1, inplace=True)
 
         temp_df["roi"] = roi
         self.data = temp_df
@@ -364,17 +1052,15 @@ class JemDataSet(object):
         date = parser.parse(self._date).strftime("%y%m%d")
         
         if self.project != "ME" and (sum(temp_df["status"].str.contains("SUCCESS"))>=1):
-            if self._version >= "2.0.2":
+            if self._plan["container_source"] == "tubeID":
                 containers = temp_df["extraction.tubeID"]             
             else:
                 if "approach.pilotName" in temp_df.columns:
                     tube_ids = temp_df.apply(lambda x: x["approach.pilotTest05"] if (x["approach.pilotName"] == "Tissue_Touch" and "approach.pilotTest05" in temp_df.columns) else x["extraction.tubeID"], axis=1)
                 else:
                     tube_ids = temp_df["extraction.tubeID"]
-                path = "//allen/programs/celltypes/workgroups/279/Patch-Seq/all-metadata-files/ps_user_info.csv"
                 try:
-                    users = pd.read_csv(path)
-                    login_to_user = users.set_index("login").to_dict()["p_user"]
+                    name_to_login, login_to_user = get_ps_user_info()
                     user_code = login_to_user[temp_df["rigOperator"].values[0]]
                     containers = tube_ids.apply(lambda x: stitch_container(user_code, date, x) if x is not np.nan else np.nan)
                 except IOError:
@@ -393,22 +1079,8 @@ class JemDataSet(object):
         """Ensure that all MET Production JEM form columns are present in 
         final data (add empty values if not)"""
         
-        met_cols = ['acsfProductionDate','acsfType','blankFillDate','date','flipped',
-                    'formVersion','internalFillDate','limsSpecName',
-                    'rigNumber','rigOperator','sliceQuality',
-                    'approach.cellHealth','approach.creCell','approach.pilotName','approach.automation','approach.sliceHealth',
-                    'approach.pipette_cleaned','approach.recycled_pipette','apporach.previous_profile','depth','auto_cell_attached','auto_break_in',
-                    'extraction.endPipetteR','extraction.extractionObservations','extraction.nucleus','extraction.postPatch','extraction.pressureApplied',
-                    'extraction.retractionPressureApplied','extraction.sampleObservations','extraction.timeExtractionEnd','extraction.timeExtractionStart',
-                    'extraction.timeRetractionEnd','extraction.autoExtract','extraction.autoNucProfile','extraction.autoExtractStatus',
-                    'extraction.autoExtractFailure','extraction.autoExtractTechFaislure','extraction.autoExtractGenFailure','extraction.autoExtractNotes',
-                    'extracion.autoNucDeposit','extraction.autoNucDepositStatus','extraction.autoNucDepositFailure','extraction.fillquality',
-                    'failureNotes','qcNotes','hypCellType','stimulusSet','recording.pipetteR',
-                    'recording.timeStart','recording.timeWholeCellStart','status',
-                    'attempt','roi','container']
-        
         temp_df = self.data
-        for c in met_cols:
+        for c in MET_COLUMNS:
             if c not in temp_df.columns:
                 if c == "status":
                     temp_df[c] = "NO ATTEMPTS"
@@ -420,18 +1092,13 @@ class JemDataSet(object):
         return self.data
             
     def _define_schemas(self, version):
-        """Return correct slice_schema, pipette_array_name and pipette_schema."""
+        """Return correct slice_schema, pipette_array_name and pipette_schema (schema names in schemas.py)."""
         
         if self.project == "MET" and self.lab == "AIBSPipeline":
-            if version >= "2":
-                self._slice_schema = schemas.schemas["met_slice"]
-                #self._pipette_schema = schemas.schemas["met_pipette"]
-                self._pipette_array_name = "pipettes"
-
-            else:
-                self._slice_schema = schemas.schemas["met_slice_outdated"]
-                #self._pipette_schema = schemas.schemas["met_pipette_outdated"]
-                self._pipette_array_name = "pipettesPatchSeqPilot"
+            plan = get_version_plan(version)
+            self._slice_schema = plan["slice_schema"]
+            self._pipette_array_name = plan["pipette_array"]
+            if plan["slice_schema"] == "met_slice_outdated":
                 logger.info(" %s:\n Old JEM version may have incomplete metadata. \n" %(self.file_name))
     
     def validate_slice(self):
@@ -446,14 +1113,15 @@ class JemDataSet(object):
         version = self.get_jem_version()
         self._define_schemas(version)
         
-        with open(self.file_path) as data_file:
-            slice_info = json.load(data_file)
-            #(A dictionary of slices with nested pipette attempts)
+        slice_info = dict(self._load_slice_info())
+        #(A dictionary of slices with nested pipette attempts)
         slice_info["formVersion"] = version
                 
 
-        v = sliceValidator(self._slice_schema)
-        v.allow_unknown = True
+        if self._slice_schema is None:
+            # (No schemas for this project and lab)
+            return slice_info, {}
+        v = get_validator(self._slice_schema)
         v.validate(slice_info)
         error_dict = v.errors
         if any(error_dict):
@@ -466,18 +1134,26 @@ class JemDataSet(object):
     def validate_attempts(self, attempts):
         """Return validation of nested attempts metadata.
     
+        Parameters
+        ----------
+        attempts : pandas dataframe or list of dictionaries
+            flattened pipette attempts
+        
         Returns
         -------
-        error_log : 
+        attempts_errors : list of tuples
+            (attempt number, "pipette" or "tube", cerberus errors) of every validated attempt
         
         """
-        data = attempts.to_dict('records')  
+        if isinstance(attempts, pd.DataFrame):
+            data = attempts.to_dict('records')
+        else:
+            data = attempts
         attempts_errors = []
         for i, d in enumerate(data):
-            pipette_v = sliceValidator(schemas.schemas["met_pipette"])
-            pipette_v.allow_unknown = True
+            pipette_v = get_validator("met_pipette")
             pipette_v.validate(d)
-            attempts_errors.append(pipette_v.errors)
+            attempts_errors.append((i+1, "pipette", pipette_v.errors))
             if any(pipette_v.errors):
                 logger.warning(" Error(s) found in %s, attempt# %d:\n %s\n" %(self.file_name, i+1, pipette_v.errors))
                 self._valid_attempts = False
@@ -487,14 +1163,51 @@ class JemDataSet(object):
         
             if self._valid_attempts:
                 if d["status"] == "SUCCESS":
-                    tube_v = sliceValidator(schemas.schemas["met_tube"])
-                    tube_v.allow_unknown = True
+                    tube_v = get_validator("met_tube")
                     tube_v.validate(d)
-                    attempts_errors.append(tube_v.errors)
+                    attempts_errors.append((i+1, "tube", tube_v.errors))
                     if any(tube_v.errors):
                         logger.warning(" Error(s) found in %s, attempt# %d:\n %s\n" %(self.file_name, i+1, tube_v.errors))
                         self._valid_attempts = False
         
+        return attempts_errors
+
+
+    def is_validated(self):
+        """Return True if the file is validated under its validation mode (decided once per file)."""
+        
+        if self._validate_file is None:
+            if self.validation_mode == "full":
+                self._validate_file = True
+            elif self.validation_mode == "sampled":
+                self._validate_file = random.random() < self.sample_fraction
+            else:
+                self._validate_file = False
+        return self._validate_file
+
+
+    def validate(self, attempts):
+        """Validate slice and attempts metadata, adding the findings to 'validation_errors'.
+    
+        Parameters
+        ----------
+        attempts : pandas dataframe or list of dictionaries
+            flattened pipette attempts
+        
+        Returns
+        -------
+        validation_errors : list of dictionaries
+            rows of the validation error table (see VALIDATION_ERROR_COLUMNS)
+        
+        """
+        slice_info, slice_errors = self.validate_slice()
+        lims_spec_name = slice_info.get("limsSpecName", np.nan)
+        self.validation_errors += validation_error_rows(self.file_name, lims_spec_name, np.nan, "slice", slice_errors)
+        if self._slice_schema is not None:
+            for attempt, level, errors in self.validate_attempts(attempts):
+                self.validation_errors += validation_error_rows(self.file_name, lims_spec_name, attempt, level, errors)
+        return self.validation_errors
+        
         
         
     def get_data_dev(self):
@@ -568,21 +1281,19 @@ class JemDataSet(object):
         else:
             self.get_experiment_date()
 
-            with open(self.file_path) as data_file:
-                slice_info = json.load(data_file)
-                #(A dictionary of slices with nested pipette attempts)
-                slice_info["jem_created"] = datetime.fromtimestamp(os.path.getctime(self.file_path))
+            slice_info = dict(self._load_slice_info())
+            #(A dictionary of slices with nested pipette attempts)
+            slice_info["jem_created"] = datetime.fromtimestamp(os.path.getctime(self.file_path))
 
         
             df = pd.json_normalize(slice_info)
             df["formVersion"] = version
         
             # (Pre-version 2 contains IVSCC, PatchSeq and Electroporation arrays)
-            if version >= "2":
-                array_name = "pipettes"
-            else:
-                array_name = "pipettesPatchSeqPilot"
+            array_name = self._plan["pipette_array"]
     
+            if self.is_validated():
+                self.validate([flatten_json_record(p) for p in slice_info[array_name]])
             attempts = pd.json_normalize(slice_info[array_name])
             try:
                 attempts["limsSpecName"] = df["limsSpecName"].values[0]
@@ -604,4 +1315,157 @@ class JemDataSet(object):
             self.data = self._add_empty_columns()
         
             return self.data
-    
\ No newline at end of file
+    
+
+    def get_records(self):
+        """Return flattened slice metadata as attempt records (one dictionary per pipette attempt).
+        
+        Same metadata as get_data, without building a dataframe per file. Records of many
+        files are combined into one dataframe by records_to_data, which also normalizes
+        the date and time fields in bulk.
+    
+        Returns
+        -------
+        records : list of dictionaries
+            A record of every pipette attempt along with all slice metadata."""
+        
+        version = self.get_jem_version()
+        if version == None:
+            return None
+        self.get_experiment_date()
+
+        slice_info = dict(self._load_slice_info())
+        #(A dictionary of slices with nested pipette attempts)
+        slice_info["jem_created"] = datetime.fromtimestamp(os.path.getctime(self.file_path))
+        
+        # (Pre-version 2 contains IVSCC, PatchSeq and Electroporation arrays)
+        array_name = self._plan["pipette_array"]
+        pipettes = slice_info[array_name]
+        
+        slice_record = flatten_json_record(slice_info)
+        slice_record.pop(array_name, None)
+        slice_record["formVersion"] = version
+        if "limsSpecName" not in slice_record:
+            sys.exit("'limsSpecName' field missing in %s." %self.file_name)
+        
+        attempts = [flatten_json_record(p) for p in pipettes]
+        if self.is_validated():
+            self.validate(attempts)
+        attempt_fields = set(["limsSpecName", "attempt"])
+        for attempt in attempts:
+            attempt_fields.update(attempt)
+        _coerce_numeric_fields(attempts, attempt_fields)
+        
+        # Fields in both slice and attempts are suffixed as in an outer merge on limsSpecName
+        shared_fields = (attempt_fields & set(slice_record)) - set(["limsSpecName"])
+        slice_record = {(k + "_x" if k in shared_fields else k): v for k, v in slice_record.items()}
+        records = []
+        for i, attempt in enumerate(attempts):
+            record = dict(slice_record)
+            for k, v in attempt.items():
+                record[k + "_y" if k in shared_fields else k] = v
+            record["limsSpecName"] = slice_record["limsSpecName"]
+            record["attempt"] = i + 1
+            records.append(record)
+        if len(attempts) == 0:
+            record = dict(slice_record)
+            record["attempt_y" if "attempt" in shared_fields else "attempt"] = np.nan
+            records.append(record)
+        fields = set(slice_record) | set(k + "_y" if k in shared_fields else k for k in attempt_fields)
+        
+        self._normalize_rig_operator_records(records)
+        if len(attempts) > 0:
+            self._extract_roi_records(records, fields)
+            self._generate_ps_container_records(records, fields)
+        if "status" not in fields:
+            for record in records:
+                record["status"] = "NO ATTEMPTS"
+        
+        return records
+
+
+    def _normalize_rig_operator_records(self, records):
+        """ Replaces full rig operator name (old JEM form style) with user login in attempt records."""
+        
+        if not self._plan["normalize_rig_operator"]:
+            return records
+        try:
+            name_to_login, login_to_user = get_ps_user_info()
+        except IOError:
+            print("'ps_user_info.csv' not found - rig operator name not normalized.")
+            return records
+        for record in records:
+            rig_operator = record.get("rigOperator")
+            if isinstance(rig_operator, str):
+                record["rigOperator"] = name_to_login.get(rig_operator, rig_operator)
+        return records
+
+
+    def _extract_roi_records(self, records, fields):
+        """ Fills missing roi fields with "None, None" and replaces them with a single "roi" field in attempt records."""
+        
+        for roi in JEM_ROI_FIELDS:
+            if roi in fields:
+                for record in records:
+                    value = record.get(roi, np.nan)
+                    if _is_null(value) or (value == "None"):
+                        record[roi] = "None, None"
+        
+        roi_fields = self._plan["roi_fields"]
+        for roi in roi_fields:
+            if roi not in fields:
+                raise KeyError(roi)
+        
+        for record in records:
+            roi = record.pop(roi_fields[0])
+            if len(roi_fields) > 1:
+                manual_roi = record.pop(roi_fields[1])
+                if roi == "None, None":
+                    roi = manual_roi
+            record["roi"] = roi
+        for roi in roi_fields:
+            fields.discard(roi)
+        return records
+
+
+    def _generate_ps_container_records(self, records, fields):
+        """ Adds the LIMS tube ID (aka Patch Container) to attempt records (see _generate_ps_container)."""
+        
+        def field_values(field):
+            if field not in fields:
+                raise KeyError(field)
+            return [record.get(field, np.nan) for record in records]
+        
+        date = parser.parse(self._date).strftime("%y%m%d")
+        n_success = sum(1 for status in field_values("status") if isinstance(status, str) and "SUCCESS" in status)
+        
+        if self.project != "ME" and n_success >= 1:
+            if self._plan["container_source"] == "tubeID":
+                containers = field_values("extraction.tubeID")
+            else:
+                tube_ids = []
+                for record in records:
+                    if record.get("approach.pilotName") == "Tissue_Touch" and "approach.pilotTest05" in fields:
+                        tube_ids.append(record.get("approach.pilotTest05", np.nan))
+                    elif "extraction.tubeID" in fields:
+                        tube_ids.append(record.get("extraction.tubeID", np.nan))
+                    else:
+                        raise KeyError("extraction.tubeID")
+                try:
+                    name_to_login, login_to_user = get_ps_user_info()
+                    user_code = login_to_user[field_values("rigOperator")[0]]
+                    containers = [stitch_container(user_code, date, x) if x is not np.nan else np.nan for x in tube_ids]
+                except IOError:
+                    containers = [np.nan]*len(records)
+                    print("'ps_user_info.csv' not found - Patch-seq container could not be generated.")
+            if "extraction.tubeID" not in fields:
+                raise KeyError("extraction.tubeID")
+            for record in records:
+                record.pop("extraction.tubeID", None)
+            fields.discard("extraction.tubeID")
+        else:
+            containers = [np.nan]*len(records)
+        
+        for record, container in zip(records, containers):
+            record["container"] = container
+        return records
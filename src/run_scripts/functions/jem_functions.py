@@ -16,52 +16,109 @@ import json
 import numpy as np
 import os
 import pandas as pd
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
+from functools import partial
+from multiprocessing import Pool
 # File imports
 from functions.file_functions import get_jsons, load_data_variables
-from functions.jem_data_set import JemDataSet
+from functions.file_manifest import get_scanned_stat
+from functions.jem_cache import JemCache
+from functions.jem_data_set import JemDataSet, VALIDATION_ERROR_COLUMNS, VALIDATION_MODES, VALIDATION_SAMPLE_FRACTION, export_ps_user_info, records_to_data, set_ps_user_info
 
 
 #-----Variables-----#
 # Load json file
 data_variables = load_data_variables()
+# JEM directories of the daily and weekly transcriptomics reports
+JEM_DIRS = {"ivscc": "//allen/programs/celltypes/workgroups/279/Patch-Seq/all-metadata-files",
+            "hct": "//allen/programs/celltypes/workgroups/hct/HCT_Ephys_Data/JEM_forms"}
+# Days of experiments in the jem_df of the daily and weekly transcriptomics reports
+JEM_REPORT_DAYS = 120
+# Read-ahead of JEM files: reader threads (0 lets the parser read each file) and files read ahead of the parser
+READ_AHEAD_THREADS = 8
+READ_AHEAD_DEPTH = 64
+# JEM version fixes: (versions of old JEM forms, {field: field of old JEM forms})
+JEM_VERSION_FIXES = [
+	# Fix depth and time fields (jem version 1.1.0 and onwards)
+	(["1.0.9"],
+	 {"jem-depth": "jem-depth_old", "jem-time_exp_retraction_end": "jem-time_exp_retraction_end_old"}),
+	# Fix the blank date fields (jem version 2.1.1 and onwards)
+	(["1.0.9", "2.0.0", "2.0.1", "2.0.2", "2.0.3", "2.0.5", "2.0.6", "2.0.7", "2.0.8", "2.1.0"],
+	 {"jem-date_blank": "jem-date_blank_old"}),
+	# Fix experiment section (jem version 2.1.3 and onwards)
+	(["1.0.9", "2.0.0", "2.0.1", "2.0.2", "2.0.3", "2.0.5", "2.0.6", "2.0.7", "2.0.8", "2.1.0", "2.1.1", "2.1.2"],
+	 {"jem-in_bath_time_start": "jem-in_bath_time_start_old", "jem-in_bath_resistance": "jem-in_bath_resistance_old",
+	  "jem-break_in_time_end": "jem-break_in_time_end_old"})]
 
 
 #-----Functions-----#
-def generate_jem_df(group, filter_tubes=None):
+def generate_jem_df(group, filter_tubes=None, cache=True):
 	"""
-	Generates a jem metadata dataframe with the previous 30 days of information.
+	Generates a jem metadata dataframe with the previous 120 days of information.
 	Specifically, used for daily and weekly transcriptomics reports.
 
 	Parameters:
 		group (string): "ivscc" or "hct".
 		filter_tubes (string): None (default) or "only_patch_tubes" to filter dataframe to only patched cell containers.
+		cache (boolean): True (default) to reuse flattened JEM files from the local JEM cache.
 
 	Returns:
 		jem_df (dataframe): a pandas dataframe.
 	"""
 
+	day_prev_120d, day_today, delta_mod_date = get_jem_report_window()
+	jem_paths = get_jsons(dirname=JEM_DIRS[group], expt="PS", delta_days=delta_mod_date)
+	# Flatten JSON files (previous 120 day information) to pandas dataframe jem_df)
+	jem_df = flatten_jem_data(jem_paths, day_prev_120d, day_today, cache=JemCache() if cache else None)
+
+	return clean_jem_df(jem_df, group, filter_tubes)
+
+
+def get_jem_report_window(report_days=JEM_REPORT_DAYS):
+	"""
+	Generates the experiment dates of the jem_df of the daily and weekly transcriptomics reports.
+
+	Parameters:
+		report_days (int): number of days before today.
+
+	Returns:
+		start_day (string): first experiment date ("YYMMDD").
+		end_day (string): last experiment date, today ("YYMMDD").
+		delta_mod_date (int): number of days of JEM file creation dates to search (see get_jsons).
+	"""
+
 	# Date of today
-	dt_today = datetime.today()
-	date_today = dt_today.date()
+	date_today = datetime.today().date()
 	day_today = date_today.strftime("%y%m%d") # "YYMMDD"
 	# Date of the previous 120 days from date of today
-	date_prev_120d = date_today - timedelta(days=120)
+	date_prev_120d = date_today - timedelta(days=report_days)
 	day_prev_120d = date_prev_120d.strftime("%y%m%d") # "YYMMDD"
-		
-	# Directories
-	if group == "ivscc":
-		json_dir = "//allen/programs/celltypes/workgroups/279/Patch-Seq/all-metadata-files"
-	if group == "hct":
-		json_dir = "//allen/programs/celltypes/workgroups/hct/HCT_Ephys_Data/JEM_forms"
-
 	delta_mod_date = (date_today - date_prev_120d).days + 3
-	jem_paths = get_jsons(dirname=json_dir, expt="PS", delta_days=delta_mod_date)
-	# Flatten JSON files (previous 30 day information) to pandas dataframe jem_df)
-	jem_df = flatten_jem_data(jem_paths, day_prev_120d, day_today)
+
+	return day_prev_120d, day_today, delta_mod_date
+
+
+def clean_jem_df(jem_df, group, filter_tubes=None):
+	"""
+	Renames and cleans a flattened jem metadata dataframe for the daily and weekly transcriptomics reports.
+
+	Parameters:
+		jem_df (dataframe): a pandas dataframe from flatten_jem_data.
+		group (string): "ivscc" or "hct".
+		filter_tubes (string): None (default) or "only_patch_tubes" to filter dataframe to only patched cell containers.
+
+	Returns:
+		jem_df (dataframe): a pandas dataframe.
+	"""
 
 	# Rename columns based on jem_dictionary
-	jem_df.rename(columns=data_variables["jem_dictionary"], inplace=True)
+	jem_df = jem_df.rename(columns=data_variables["jem_dictionary"])
 
 	if group == "ivscc":
 		jem_df = ivscc_fix_field_formatting(jem_df)
@@ -415,58 +472,38 @@ def add_jem_species_field(df):
 
 
 #-----Fix JEM version issues-----#
-def fix_jem_versions(df):
+def fix_jem_versions(df, version_fixes=None):
 	"""
-	Fixes jem versions in JEM metadata.
+	Fixes jem versions in JEM metadata, in a single pass (fields of old JEM forms are
+	copied into the current fields for the rows of those versions).
 
 	Parameters: 
 		df (dataframe): a pandas dataframe.
+		version_fixes (list): (versions, {field: old field}) fixes to apply (None applies JEM_VERSION_FIXES).
 
 	Returns:
 		df (dataframe): a pandas dataframe.
 	"""
 
-	# Lists
-	jem_version_109_list = ["1.0.9"]
-	jem_version_210_list = ["1.0.9", "2.0.0", "2.0.1", "2.0.2", "2.0.3", "2.0.5", "2.0.6", "2.0.7", "2.0.8", "2.1.0"]
-	jem_version_212_list = ["1.0.9", "2.0.0", "2.0.1", "2.0.2", "2.0.3", "2.0.5", "2.0.6", "2.0.7", "2.0.8", "2.1.0", "2.1.1", "2.1.2"]
-
-	# Fix depth and time fields (jem version 1.1.0 and onwards))
-	df_cur = df[~df["jem-version_jem_form"].isin(jem_version_109_list)].copy()
-	df_old = df[df["jem-version_jem_form"].isin(jem_version_109_list)].copy()
-	# Drop necessary fields for concatenating dataframes
-	if "jem-depth_old" in df.columns:
-		df_cur.drop(columns=["jem-depth_old", "jem-time_exp_retraction_end_old"], inplace=True)
-		df_old.drop(columns=["jem-depth", "jem-time_exp_retraction_end"], inplace=True)
-	# Rename necessary fields for concatenating dataframes
-	df_old = df_old.rename(columns={"jem-depth_old": "jem-depth", "jem-time_exp_retraction_end_old": "jem-time_exp_retraction_end"})
-	# Concatenate dataframes
-	df = pd.concat([df_cur, df_old], sort=True)
-	
-	# Fix the blank date fields (jem version 2.1.1 and onwards)
-	df_cur = df[~df["jem-version_jem_form"].isin(jem_version_210_list)].copy()
-	df_old = df[df["jem-version_jem_form"].isin(jem_version_210_list)].copy()
-	# Drop necessary fields for concatenating dataframes
-	if "jem-date_blank_old" in df.columns:
-		df_cur.drop(columns=["jem-date_blank_old"], inplace=True)
-		df_old.drop(columns=["jem-date_blank"], inplace=True)
-	# Rename necessary fields for concatenating dataframes
-	df_old = df_old.rename(columns={"jem-date_blank_old": "jem-date_blank"})
-	# Concatenate dataframes
-	df = pd.concat([df_cur, df_old], sort=True)
-
-	# Fix experiment section (jem version 2.1.3 and onwards)
-	df_cur = df[~df["jem-version_jem_form"].isin(jem_version_212_list)].copy()
-	df_old = df[df["jem-version_jem_form"].isin(jem_version_212_list)].copy()
-
-	# Drop necessary fields for concatenating dataframes
-	if "jem-in_bath_time_start_old" in df.columns:
-		df_cur.drop(columns=["jem-in_bath_time_start_old", "jem-in_bath_resistance_old", "jem-break_in_time_end_old"], inplace=True)
-		df_old.drop(columns=["jem-in_bath_time_start", "jem-in_bath_resistance", "jem-break_in_time_end"], inplace=True)
-	# Rename necessary fields for concatenating dataframes
-	df_old = df_old.rename(columns={"jem-in_bath_time_start_old": "jem-in_bath_time_start", "jem-in_bath_resistance_old": "jem-in_bath_resistance", "jem-break_in_time_end_old": "jem-break_in_time_end"})
-	# Concatenate dataframes
-	df = pd.concat([df_cur, df_old], sort=True)
+	if version_fixes is None:
+		version_fixes = JEM_VERSION_FIXES
+	# Rows of newer versions first (the order of splitting and concatenating dataframes per fix)
+	order = np.zeros(len(df), dtype=int)
+	for rank, (version_list, fields) in enumerate(version_fixes):
+		order += df["jem-version_jem_form"].isin(version_list).values.astype(int) << rank
+	df = df.take(np.argsort(order, kind="stable"))
+
+	drop_list = []
+	for version_list, fields in version_fixes:
+		old_fields = list(fields.values())
+		if old_fields[0] in df.columns:
+			is_old = df["jem-version_jem_form"].isin(version_list)
+			for field, old_field in fields.items():
+				df[field] = df[field].where(~is_old, df[old_field])
+			drop_list += old_fields
+	df = df.drop(columns=drop_list)
+	# Sort columns (as concatenating dataframes with sort=True)
+	df = df.reindex(columns=sorted(df.columns))
 
 	return df
 
@@ -482,39 +519,14 @@ def fix_jem_versions_hct(df):
 		df (dataframe): a pandas dataframe.
 	"""
 
-	# Lists
-	jem_version_109_list = ["1.0.9"]
-	jem_version_210_list = ["1.0.9", "2.0.0", "2.0.1", "2.0.2", "2.0.3", "2.0.5", "2.0.6", "2.0.7", "2.0.8", "2.1.0"]
-	jem_version_212_list = ["1.0.9", "2.0.0", "2.0.1", "2.0.2", "2.0.3", "2.0.5", "2.0.6", "2.0.7", "2.0.8", "2.1.0", "2.1.1", "2.1.2"]
-
-	# Fix depth and time fields (jem version 1.1.0 and onwards))
-	df_cur = df[~df["jem-version_jem_form"].isin(jem_version_109_list)].copy()
-	df_old = df[df["jem-version_jem_form"].isin(jem_version_109_list)].copy()
-	# Drop necessary fields for concatenating dataframes
-	if "jem-depth_old" in df.columns:
-		df_cur.drop(columns=["jem-depth_old", "jem-time_exp_retraction_end_old"], inplace=True)
-		df_old.drop(columns=["jem-depth", "jem-time_exp_retraction_end"], inplace=True)
-	# Rename necessary fields for concatenating dataframes
-	df_old = df_old.rename(columns={"jem-depth_old": "jem-depth", "jem-time_exp_retraction_end_old": "jem-time_exp_retraction_end"})
-	# Concatenate dataframes
-	df = pd.concat([df_cur, df_old], sort=True)
-	
-	# Fix the blank date fields (jem version 2.1.1 and onwards)
-	df_cur = df[~df["jem-version_jem_form"].isin(jem_version_210_list)].copy()
-	df_old = df[df["jem-version_jem_form"].isin(jem_version_210_list)].copy()
-	# Drop necessary fields for concatenating dataframes
-	if "jem-date_blank_old" in df.columns:
-		df_cur.drop(columns=["jem-date_blank_old"], inplace=True)
-		df_old.drop(columns=["jem-date_blank"], inplace=True)
-	# Rename necessary fields for concatenating dataframes
-	df_old = df_old.rename(columns={"jem-date_blank_old": "jem-date_blank"})
-	# Concatenate dataframes
-	df = pd.concat([df_cur, df_old], sort=True)
+	# (The experiment section fix does not apply to HCT JEM forms)
+	df = fix_jem_versions(df, JEM_VERSION_FIXES[0:2])
 
 	return df
 
 
-def flatten_jem_data(jem_paths, start_day_str, end_day_str):
+def flatten_jem_data(jem_paths, start_day_str, end_day_str, processes=1, cache=None, validation_mode="off", sample_every=None, validation_path=None,
+                     read_threads=READ_AHEAD_THREADS, read_depth=READ_AHEAD_DEPTH):
 	"""
 	Compiles JEM files from paths, returning a pandas dataframe.
 
@@ -522,21 +534,14 @@ def flatten_jem_data(jem_paths, start_day_str, end_day_str):
 		jem_paths : list of strings
 		start_day_str : string
 		end_day_str : string
+		processes, cache, validation_mode, sample_every, validation_path, read_threads, read_depth: see flatten_jem_files.
 
 	Returns:
 		jem_df (dataframe): a pandas dataframe.
 	"""
-	start_day = datetime.strptime(start_day_str, "%y%m%d").date()
-	end_day = datetime.strptime(end_day_str, "%y%m%d").date()
-
-	jem_df = pd.DataFrame()
-	for jem_path in jem_paths:
-	    jem = JemDataSet(jem_path)
-	    expt_date = jem.get_experiment_date()
-	    if (expt_date >= start_day.strftime("%Y-%m-%d")) and (expt_date <= end_day.strftime("%Y-%m-%d")):
-	        slice_data = jem.get_data()
-	        jem_df = pd.concat([jem_df, slice_data], axis=0, sort=True)
-	jem_df.reset_index(drop=True, inplace=True)
+	slice_data_list = flatten_jem_files(jem_paths, start_day_str, end_day_str, processes, cache, validation_mode, sample_every, validation_path,
+	                                    read_threads, read_depth)
+	jem_df = _combine_slice_data(slice_data_list)
 
 	if len(jem_df) == 0:
 	    print("No JEM data found for experiments between %s and %s" %(start_day_str, end_day_str))
@@ -545,25 +550,347 @@ def flatten_jem_data(jem_paths, start_day_str, end_day_str):
 	return jem_df
 
 
-def flatten_collab_jem_data(jem_paths):
+def flatten_jem_files(jem_paths, start_day_str, end_day_str, processes=1, cache=None, validation_mode="off", sample_every=None, validation_path=None,
+                      read_threads=READ_AHEAD_THREADS, read_depth=READ_AHEAD_DEPTH, save_cache=True):
+	"""
+	Flattens JEM files from paths, returning the attempt records of every file.
+
+	Parameters:
+		jem_paths : list of strings
+		start_day_str : string
+		end_day_str : string
+		processes (int): number of worker processes used to flatten files (1 flattens in this process).
+		cache (JemCache): cache of flattened files, only new or modified files are parsed (None parses every file).
+		validation_mode (string): "off" (default), "sampled" or "full" validation of the JEM files.
+		sample_every (int): in "sampled" mode, validates every Nth file instead of a random fraction of files.
+		validation_path (string): csv path of the validation error table (None does not save it).
+		read_threads (int): threads reading JEM files ahead of the parser (0 disables the read-ahead).
+		read_depth (int): maximum number of files read ahead of the parser.
+		save_cache (boolean): True (default) saves the cache, False leaves it to the caller (ex. a watcher keeping the cache open).
+
+	Returns:
+		slice_data_list (list): attempt records of every file (JemDataSet.get_records), in the same order as jem_paths
+			(None for files outside the experiment dates).
+	"""
+	start_day = datetime.strptime(start_day_str, "%y%m%d").date()
+	end_day = datetime.strptime(end_day_str, "%y%m%d").date()
+	start_date = start_day.strftime("%Y-%m-%d")
+	end_date = end_day.strftime("%Y-%m-%d")
+	file_modes = get_file_validation_modes(len(jem_paths), validation_mode, sample_every)
+
+	# Use cached files and only flatten new or modified files (and files to validate)
+	slice_data_list = [None]*len(jem_paths)
+	pending_idx = []
+	stats = {}
+	if cache is not None:
+		# (A cache kept between calls, as in watch mode, is discarded if ps_user_info.csv changed)
+		cache.check_version()
+	for idx, jem_path in enumerate(jem_paths):
+		entry = None
+		if cache is not None:
+			# (Stats from the directory scan, if the path was listed by get_jsons)
+			stats[jem_path] = get_scanned_stat(jem_path) or os.stat(jem_path)
+			entry = cache.get(jem_path, stats[jem_path])
+		if entry is None:
+			pending_idx.append(idx)
+		elif (entry["expt_date"] >= start_date) and (entry["expt_date"] <= end_date):
+			if entry["flattened"] and file_modes[idx] == "off":
+				slice_data_list[idx] = entry["slice_data"]
+			else:
+				pending_idx.append(idx)
+	n_reused = len(jem_paths) - len(pending_idx)
+
+	flatten_file = partial(_flatten_jem_file, start_date=start_date, end_date=end_date)
+	pending_paths = [jem_paths[idx] for idx in pending_idx]
+	jobs = [(jem_paths[idx], file_modes[idx]) for idx in pending_idx]
+	validation_errors = []
+	results = _map_jem_files(flatten_file, jobs, processes, read_threads, read_depth)
+	for idx, jem_path, (expt_date, slice_data, file_errors) in zip(pending_idx, pending_paths, results):
+		slice_data_list[idx] = slice_data
+		validation_errors += file_errors
+		if cache is not None:
+			cache.put(jem_path, expt_date, slice_data, flattened=(slice_data is not None), stat=stats[jem_path])
+	if cache is not None:
+		if save_cache:
+			cache.save()
+		print("JEM cache: %s files reused from cache, %s files flattened." %(n_reused, len(pending_paths)))
+	if validation_mode != "off":
+		save_validation_errors(validation_errors, validation_path)
+
+	return slice_data_list
+
+
+def flatten_collab_jem_data(jem_paths, processes=1, validation_mode="off", sample_every=None, validation_path=None,
+                            read_threads=READ_AHEAD_THREADS, read_depth=READ_AHEAD_DEPTH):
 	"""
 	Compiles JEM files from paths, returning a pandas dataframe.
 
 	Parameters:
 		jem_paths : list of strings
+		processes (int): number of worker processes used to flatten files (1 flattens in this process).
+		validation_mode (string): "off" (default), "sampled" or "full" validation of the JEM files.
+		sample_every (int): in "sampled" mode, validates every Nth file instead of a random fraction of files.
+		validation_path (string): csv path of the validation error table (None does not save it).
+		read_threads (int): threads reading JEM files ahead of the parser (0 disables the read-ahead).
+		read_depth (int): maximum number of files read ahead of the parser.
+
+	Returns:
+		jem_df (dataframe): a pandas dataframe.
+	"""
+
+	file_modes = get_file_validation_modes(len(jem_paths), validation_mode, sample_every)
+	results = _map_jem_files(_flatten_jem_file, list(zip(jem_paths, file_modes)), processes, read_threads, read_depth)
+	if validation_mode != "off":
+		save_validation_errors([row for expt_date, slice_data, file_errors in results for row in file_errors], validation_path)
+	jem_df = _combine_slice_data([slice_data for expt_date, slice_data, file_errors in results])
+
+	return jem_df
+
+
+#-----JEM validation-----#
+def get_file_validation_modes(n_files, validation_mode="off", sample_every=None):
+	"""
+	Selects the JEM files validated under a validation mode.
+
+	Parameters:
+		n_files (int): number of JEM files.
+		validation_mode (string): "off", "sampled" or "full".
+		sample_every (int): in "sampled" mode, validates every Nth file (None validates a random
+			VALIDATION_SAMPLE_FRACTION of files).
+
+	Returns:
+		file_modes (list): "full" for files to validate and "off" for the others.
+	"""
+
+	if validation_mode not in VALIDATION_MODES:
+		raise ValueError("Unknown validation mode '%s', use one of %s." %(validation_mode, VALIDATION_MODES))
+	if validation_mode == "sampled":
+		if sample_every is not None:
+			return ["full" if idx % sample_every == 0 else "off" for idx in range(n_files)]
+		return ["full" if random.random() < VALIDATION_SAMPLE_FRACTION else "off" for idx in range(n_files)]
+
+	return [validation_mode]*n_files
+
+
+def save_validation_errors(validation_errors, validation_path=None):
+	"""
+	Builds the validation error table and saves it as a csv.
+
+	Parameters:
+		validation_errors (list): validation error rows (see JemDataSet.validate).
+		validation_path (string): csv path of the table (None does not save it).
+
+	Returns:
+		errors_df (dataframe): a pandas dataframe with VALIDATION_ERROR_COLUMNS.
+	"""
+
+	errors_df = pd.DataFrame(validation_errors, columns=VALIDATION_ERROR_COLUMNS)
+	n_files = errors_df["file_name"].nunique()
+	print("JEM validation: %s errors found in %s files." %(len(errors_df), n_files))
+	if validation_path is not None:
+		try:
+			errors_df.to_csv(validation_path, encoding='utf-8-sig', index=False)
+		except IOError:
+			print("\nOh no! Unable to save spreadsheet :(\nMake sure you don't already have a file with the same name opened.")
+
+	return errors_df
+
+
+#-----JEM flattening engine-----#
+def _flatten_jem_file(jem_path, validation_mode="off", raw=None, start_date=None, end_date=None):
+	"""
+	Flattens a single JEM file (the unit of work handed to each worker process).
+
+	Parameters:
+		jem_path (string): path to a JEM file.
+		validation_mode (string): "off", "sampled" or "full" validation of the file.
+		raw (bytes): contents of the file if already read, or None to read the file.
+		start_date (string): first experiment date kept ("YYYY-MM-DD"), or None to keep every file.
+		end_date (string): last experiment date kept ("YYYY-MM-DD"), or None to keep every file.
+
+	Returns:
+		expt_date (string): experiment date ("YYYY-MM-DD"), or None if no window was given.
+		slice_data (list): attempt records of the file (JemDataSet.get_records), or None if outside the window.
+		validation_errors (list): validation error rows of the file.
+		exit_message (string): reason the file stopped the run, or None.
+	"""
+
+	jem = JemDataSet(jem_path, validation_mode=validation_mode, raw=raw)
+	expt_date = None
+	try:
+		if start_date is not None:
+			expt_date = jem.probe_experiment_date()
+			if (expt_date < start_date) or (expt_date > end_date):
+				return expt_date, None, [], None
+		return expt_date, jem.get_records(), jem.validation_errors, None
+	except SystemExit as e:
+		# Workers cannot exit the run themselves, so hand the message back to the parent
+		return expt_date, None, jem.validation_errors, str(e.code)
+	finally:
+		jem.close()
+
+
+def _map_jem_files(flatten_file, jobs, processes=1, read_threads=READ_AHEAD_THREADS, read_depth=READ_AHEAD_DEPTH):
+	"""
+	Applies flatten_file to every JEM file, spreading the files across a process pool.
+	With read_threads > 0, file contents are read on a thread pool ahead of the parser,
+	so waiting on the network share overlaps with parsing.
+
+	Parameters:
+		flatten_file (function): per-file function returning (expt_date, slice_data, validation_errors, exit_message).
+		jobs (list): (JEM file path, validation mode) of every file.
+		processes (int): number of worker processes (1 flattens in this process).
+		read_threads (int): threads reading JEM files ahead of the parser (0 disables the read-ahead).
+		read_depth (int): maximum number of files read ahead of the parser.
+
+	Returns:
+		results (list): (expt_date, slice_data, validation_errors) of every file, in the same order as jobs.
+	"""
+
+	read_stats = {"wait_seconds": 0.0, "read_seconds": 0.0, "bytes": 0}
+	if read_threads > 0:
+		# Files are read ahead (at most read_depth files in memory) and passed as raw bytes
+		in_flight = threading.BoundedSemaphore(read_depth)
+		stop = threading.Event()
+		def read_jobs():
+			for job, raw in zip(jobs, _read_ahead([job[0] for job in jobs], read_threads, read_depth, read_stats)):
+				while not in_flight.acquire(timeout=0.5):
+					if stop.is_set():
+						return
+				yield tuple(job) + (raw,)
+		job_iter = read_jobs()
+	else:
+		in_flight = None
+		job_iter = iter(jobs)
+
+	results = []
+	cpu_seconds = 0.0
+	if processes is None or processes > 1:
+		# Workers receive the rig operator info once instead of each reading ps_user_info.csv
+		with Pool(processes, initializer=set_ps_user_info, initargs=(export_ps_user_info(),)) as pool:
+			chunksize = 1 if in_flight is not None else max(1, len(jobs) // ((processes or os.cpu_count()) * 4))
+			try:
+				for result, seconds in pool.imap(partial(_timed_call, flatten_file), job_iter, chunksize=chunksize):
+					results.append(result)
+					cpu_seconds += seconds
+					if in_flight is not None:
+						in_flight.release()
+			finally:
+				# (Unblocks the pool's task feeder if the run stops early)
+				if in_flight is not None:
+					stop.set()
+	else:
+		try:
+			for job in job_iter:
+				result, seconds = _timed_call(flatten_file, job)
+				results.append(result)
+				cpu_seconds += seconds
+				if in_flight is not None:
+					in_flight.release()
+				if result[3] is not None:
+					break
+		finally:
+			if in_flight is not None:
+				job_iter.close()
+	if in_flight is not None and len(results) > 0:
+		print("JEM read-ahead: %s files (%.1f MB), %.1f s waiting on file reads (%.1f s reading), %.1f s CPU parsing." %(
+			len(results), read_stats["bytes"]/1e6, read_stats["wait_seconds"], read_stats["read_seconds"], cpu_seconds))
+
+	for expt_date, slice_data, validation_errors, exit_message in results:
+		if exit_message is not None:
+			sys.exit(exit_message)
+
+	return [(expt_date, slice_data, validation_errors) for expt_date, slice_data, validation_errors, exit_message in results]
+
+
+def _read_ahead(jem_paths, threads=READ_AHEAD_THREADS, depth=READ_AHEAD_DEPTH, stats=None):
+	"""
+	Reads JEM files on a thread pool, keeping up to depth reads in flight ahead of the consumer.
+
+	Parameters:
+		jem_paths (list): JEM file paths.
+		threads (int): number of reader threads.
+		depth (int): maximum number of files read ahead.
+		stats (dictionary): updated with "wait_seconds" (consumer waiting on reads),
+			"read_seconds" (time spent in reads) and "bytes".
+
+	Yields:
+		raw (bytes): contents of each file in the order of jem_paths, or None if it could not be read
+			(the parser then reports the error).
+	"""
+
+	if stats is None:
+		stats = {"wait_seconds": 0.0, "read_seconds": 0.0, "bytes": 0}
+	pending = deque()
+	paths = iter(jem_paths)
+	with ThreadPoolExecutor(max_workers=threads) as executor:
+		for jem_path in paths:
+			pending.append(executor.submit(_read_file, jem_path))
+			if len(pending) >= depth:
+				break
+		while pending:
+			start = time.perf_counter()
+			raw, read_seconds = pending.popleft().result()
+			stats["wait_seconds"] += time.perf_counter() - start
+			stats["read_seconds"] += read_seconds
+			stats["bytes"] += len(raw) if raw is not None else 0
+			for jem_path in paths:
+				pending.append(executor.submit(_read_file, jem_path))
+				break
+			yield raw
+
+
+def _read_file(jem_path):
+	"""
+	Reads the raw bytes of a file (run on a reader thread).
+
+	Parameters:
+		jem_path (string): path to a JEM file.
+
+	Returns:
+		raw (bytes): file contents, or None if it could not be read.
+		read_seconds (float): time spent reading.
+	"""
+
+	start = time.perf_counter()
+	try:
+		with open(jem_path, "rb") as data_file:
+			raw = data_file.read()
+	except OSError:
+		raw = None
+	return raw, time.perf_counter() - start
+
+
+def _timed_call(func, args):
+	"""
+	Calls func(*args), also returning the CPU time of the call.
+
+	Parameters:
+		func (function): function to call.
+		args (tuple): positional arguments.
+
+	Returns:
+		result: return value of func.
+		cpu_seconds (float): CPU time of the call.
+	"""
+
+	start = time.process_time()
+	result = func(*args)
+	return result, time.process_time() - start
+
+
+def _combine_slice_data(slice_data_list):
+	"""
+	Builds one dataframe from the attempt records of every file, instead of a dataframe per file.
+
+	Parameters:
+		slice_data_list (list): per-file attempt records (None entries are skipped).
 
 	Returns:
 		jem_df (dataframe): a pandas dataframe.
 	"""
 
-	jem_df = pd.DataFrame()
-	for jem_path in jem_paths:
-		jem = JemDataSet(jem_path)
-		slice_data = jem.get_data()
-		if slice_data is None:
-			continue
-		success_slice_data = slice_data[slice_data["status"].str.contains("SUCCESS")]
-		jem_df = pd.concat([jem_df, slice_data], axis=0, sort=True)
-	jem_df.reset_index(drop=True, inplace=True)
+	records = [record for slice_data in slice_data_list if slice_data is not None for record in slice_data]
+	jem_df = records_to_data(records)
 
-	return jem_df
\ No newline at end of file
+	return jem_df
@@ -0,0 +1,208 @@
+"""
+---------------------------------------------------------------------
+File name: jem_warehouse.py
+Maintainer: Ramkumar Rajanbabu
+---------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: Typed JEM metadata store partitioned by experiment year/month
+---------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import numpy as np
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import shutil
+from datetime import datetime
+
+
+#-----Variables-----#
+# Directories
+JEM_WAREHOUSE_DIR = "//allen/programs/celltypes/workgroups/279/Patch-Seq/ivscc-data-warehouse/data-sources/jem-raw-data-sources/jem_metadata_warehouse"
+# Partition and split columns (added on write, dropped on read)
+PARTITION_COLUMNS = ["date_year", "date_month"]
+SPLIT_COLUMN = "jem_split"
+# Splits of JEM attempts (previously jem_metadata.csv, NA_jem_metadata.csv and the failures in jem_metadata_wFAILURE.csv)
+JEM_SPLITS = ["tube", "na", "failure"]
+# Container values of successful experiments without a tube
+NA_CONTAINERS = ["NA", "na", "N/A", "n/a"]
+# Text stored as missing values (the values read_csv read as NaN from the csv files)
+MISSING_TEXT = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                "<NA>", "N/A", "NA", "NULL", "NaN", "n/a", "nan", "null"]
+PARTITIONING = ds.partitioning(pa.schema([("date_year", pa.int16()), ("date_month", pa.int8())]), flavor="hive")
+
+
+#-----Functions-----#
+def get_jem_splits(jem_df):
+    """
+    Labels every JEM attempt as "tube" (successful with a tube), "na" (successful
+    without a tube) or "failure".
+
+    Parameters:
+        jem_df (dataframe): a pandas dataframe with status and container columns.
+
+    Returns:
+        splits (series): split of every row.
+    """
+
+    success = jem_df["status"].fillna("").astype(str).str.contains("SUCCESS")
+    no_tube = jem_df["container"].isnull() | jem_df["container"].isin(NA_CONTAINERS)
+    splits = np.where(success & ~no_tube, "tube", np.where(success, "na", "failure"))
+
+    return pd.Series(splits, index=jem_df.index)
+
+
+def write_jem_warehouse(jem_df, warehouse_dir=JEM_WAREHOUSE_DIR):
+    """
+    Writes JEM metadata to the warehouse, replacing its previous contents.
+    The new warehouse is written next to the old one and swapped in once complete.
+
+    Parameters:
+        jem_df (dataframe): a pandas dataframe from flatten_jem_data.
+        warehouse_dir (string): warehouse directory.
+
+    Returns:
+        n_partitions (int): number of year/month partitions written.
+    """
+
+    df = _to_warehouse_types(jem_df)
+    df[SPLIT_COLUMN] = get_jem_splits(df)
+    expt_dates = pd.to_datetime(df["date"].str[0:10], format="%Y-%m-%d", errors="coerce")
+    df["date_year"] = expt_dates.dt.year.fillna(0).astype("int16")
+    df["date_month"] = expt_dates.dt.month.fillna(0).astype("int8")
+    df = df.sort_values(by="date", kind="mergesort")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    tmp_dir = warehouse_dir + ".tmp"
+    old_dir = warehouse_dir + ".old"
+    for path in [tmp_dir, old_dir]:
+        if os.path.exists(path):
+            shutil.rmtree(path)
+    ds.write_dataset(table, tmp_dir, format="parquet", partitioning=PARTITIONING, basename_template="part-{i}.parquet")
+    if os.path.exists(warehouse_dir):
+        os.rename(warehouse_dir, old_dir)
+    os.rename(tmp_dir, warehouse_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+
+    return len(df[PARTITION_COLUMNS].drop_duplicates())
+
+
+def read_jem_warehouse(columns=None, start_date=None, end_date=None, splits=None, status=None, warehouse_dir=JEM_WAREHOUSE_DIR):
+    """
+    Reads JEM metadata from the warehouse. Only the partitions inside the date range
+    and the requested columns are read, and split/status filters are applied while reading.
+
+    Parameters:
+        columns (list): columns to read (None reads every column, missing columns are skipped).
+        start_date (string): first experiment date ("YYYY-MM-DD"), or None.
+        end_date (string): last experiment date ("YYYY-MM-DD"), or None.
+        splits (list): splits to keep (see JEM_SPLITS), or None to keep every split.
+        status (list): status values to keep, or None to keep every status.
+        warehouse_dir (string): warehouse directory.
+
+    Returns:
+        jem_df (dataframe): a pandas dataframe sorted by date.
+    """
+
+    dataset = ds.dataset(warehouse_dir, format="parquet", partitioning=PARTITIONING)
+    data_columns = [name for name in dataset.schema.names if name not in PARTITION_COLUMNS + [SPLIT_COLUMN]]
+    if columns is not None:
+        data_columns = [name for name in data_columns if name in set(columns)]
+    read_columns = data_columns if "date" in data_columns else data_columns + ["date"]
+
+    expression = _date_expression(start_date, end_date)
+    if splits is not None:
+        expression = _and(expression, ds.field(SPLIT_COLUMN).isin(list(splits)))
+    if status is not None:
+        expression = _and(expression, ds.field("status").isin(list(status)))
+    table = dataset.to_table(columns=read_columns, filter=expression)
+
+    jem_df = table.to_pandas()
+    for column in jem_df.columns[jem_df.dtypes == object]:
+        # (Null strings come back as None, the csv files gave NaN)
+        jem_df[column] = jem_df[column].where(jem_df[column].notnull(), np.nan)
+    jem_df = jem_df.sort_values(by="date", kind="mergesort", ignore_index=True)
+
+    return jem_df[data_columns]
+
+
+def _to_warehouse_types(jem_df):
+    """
+    Gives every column a single type that parquet can store, as the csv files did:
+    object columns of numbers become number columns, other object columns become text
+    and MISSING_TEXT values become missing values.
+
+    Parameters:
+        jem_df (dataframe): a pandas dataframe.
+
+    Returns:
+        df (dataframe): a typed copy of jem_df.
+    """
+
+    df = jem_df.copy()
+    for column in df.columns[df.dtypes == object]:
+        notnull = df[column].notnull()
+        values = df.loc[notnull, column]
+        if values.map(lambda value: isinstance(value, bool)).all():
+            continue
+        text = values.astype(str)
+        text = text[~text.isin(MISSING_TEXT)]
+        numbers = pd.to_numeric(text, errors="coerce")
+        if numbers.notnull().all():
+            df[column] = numbers.reindex(df.index)
+        else:
+            df[column] = text.reindex(df.index).astype(object)
+
+    return df
+
+
+def _date_expression(start_date=None, end_date=None):
+    """
+    Builds a filter on experiment date that prunes year/month partitions.
+
+    Parameters:
+        start_date (string): first experiment date ("YYYY-MM-DD"), or None.
+        end_date (string): last experiment date ("YYYY-MM-DD"), or None.
+
+    Returns:
+        expression (Expression): a pyarrow dataset filter, or None.
+    """
+
+    if start_date is None and end_date is None:
+        return None
+    start = datetime.strptime(start_date or "1900-01-01", "%Y-%m-%d")
+    end = datetime.strptime(end_date or "2999-12-31", "%Y-%m-%d")
+    year_month = ds.field("date_year").cast(pa.int32())*100 + ds.field("date_month").cast(pa.int32())
+    expression = (year_month >= start.year*100 + start.month) & (year_month <= end.year*100 + end.month)
+    if start_date is not None:
+        expression = expression & (ds.field("date") >= start_date)
+    if end_date is not None:
+        # (date holds "YYYY-MM-DD HH:MM:SS +ZZZZ", so compare against the following character)
+        expression = expression & (ds.field("date") < end_date + "~")
+
+    return expression
+
+
+def _and(expression, other):
+    """
+    Combines two filters (either may be None).
+
+    Parameters:
+        expression (Expression): a pyarrow dataset filter, or None.
+        other (Expression): a pyarrow dataset filter, or None.
+
+    Returns:
+        expression (Expression): both filters combined, or None.
+    """
+
+    if expression is None:
+        return other
+    if other is None:
+        return expression
+    return expression & other
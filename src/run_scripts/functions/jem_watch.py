@@ -0,0 +1,186 @@
+"""
+---------------------------------------------------------------------
+File name: jem_watch.py
+Maintainer: Ramkumar Rajanbabu
+---------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: Keeps the jem_df of the transcriptomics reports in memory,
+applying only the JEM files changed since the previous poll
+---------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import os
+import queue
+import threading
+import time
+import traceback
+# File imports
+from functions.file_functions import get_jsons
+from functions.file_manifest import get_scanned_stat
+from functions.jem_cache import JemCache
+from functions.jem_data_set import records_to_data
+from functions.jem_functions import JEM_DIRS, clean_jem_df, flatten_jem_files, get_jem_report_window
+
+
+#-----Variables-----#
+# Seconds between polls of the JEM directory
+WATCH_INTERVAL = 60
+# Seconds between saves of the JEM cache kept open by the watcher (it is also saved when watching stops)
+WATCH_CACHE_SAVE_INTERVAL = 600
+
+
+#-----Functions-----#
+def watch(watcher, on_change, interval=WATCH_INTERVAL):
+    """
+    Polls the JEM directory every interval seconds and calls on_change with a copy of
+    jem_df when JEM files changed. Pressing Enter calls on_change at once, "q" stops watching.
+    Errors of on_change are printed and watching continues. The JEM cache is saved every
+    WATCH_CACHE_SAVE_INTERVAL seconds and when watching stops.
+
+    Parameters:
+        watcher (JemWatcher): the watcher to poll.
+        on_change (function): called with jem_df (dataframe).
+        interval (int): seconds between polls.
+
+    Returns:
+        None
+    """
+
+    commands = queue.Queue()
+    def read_commands():
+        while True:
+            try:
+                commands.put(input().strip().lower())
+            except EOFError:
+                return
+    threading.Thread(target=read_commands, daemon=True).start()
+
+    print("\nWatching %s every %s seconds (press Enter to regenerate, q + Enter to stop)." %(watcher.jem_dir, interval))
+    next_poll = 0
+    try:
+        while True:
+            try:
+                command = commands.get(timeout=max(0, next_poll - time.time()))
+            except queue.Empty:
+                command = None
+            if command == "q":
+                return
+            if command is None:
+                next_poll = time.time() + interval
+                changed = watcher.poll()
+                watcher.save_cache(min_interval=WATCH_CACHE_SAVE_INTERVAL)
+                if not changed:
+                    continue
+            if watcher.jem_df is None:
+                # (The first poll failed, retried at the next poll)
+                print("JEM watch: no JEM data yet - waiting for the next poll.")
+                continue
+            try:
+                on_change(watcher.jem_df.copy())
+            except Exception:
+                print("JEM watch: the reports could not be generated - watching continues.")
+                traceback.print_exc()
+    finally:
+        # (Also on Ctrl+C or an error of a poll)
+        watcher.save_cache()
+
+
+#-----Classes-----#
+class JemWatcher(object):
+    """
+    Keeps the cleaned jem_df of the daily and weekly transcriptomics reports in memory.
+
+    Every poll lists the JEM directory (see get_jsons) and flattens only the JEM files
+    added or modified since the previous poll, keeping the attempt records of every
+    file. Removed files are dropped. When the report window moves (a new day), every
+    file is checked again, through the JEM cache. The cache is kept open between polls
+    and only written by save_cache.
+    """
+
+    def __init__(self, group, filter_tubes="only_patch_tubes", cache=True):
+        """
+        Parameters:
+            group (string): "ivscc" or "hct".
+            filter_tubes (string): None or "only_patch_tubes" (default) to filter jem_df to only patched cell containers.
+            cache (boolean): True (default) to reuse flattened JEM files from the local JEM cache.
+        """
+
+        self.group = group
+        self.filter_tubes = filter_tubes
+        self.jem_dir = JEM_DIRS[group]
+        self.jem_df = None
+        self.window = None
+        self._cache = JemCache() if cache else None
+        self._cache_saved = time.time()
+        self._stats = {}
+        self._slice_data = {}
+
+    def poll(self):
+        """
+        Applies the JEM files added, modified or removed since the previous poll.
+
+        Parameters:
+            None
+
+        Returns:
+            changed (boolean): True if jem_df was regenerated.
+        """
+
+        start_day, end_day, delta_mod_date = get_jem_report_window()
+        if (start_day, end_day) != self.window:
+            self.window = (start_day, end_day)
+            self._stats = {}
+        jem_paths = get_jsons(dirname=self.jem_dir, expt="PS", delta_days=delta_mod_date)
+
+        stats = {}
+        for jem_path in jem_paths:
+            try:
+                # (Stats from the directory scan, if the file was stat-ed by it)
+                stat = get_scanned_stat(jem_path) or os.stat(jem_path)
+            except FileNotFoundError:
+                continue
+            stats[jem_path] = (stat.st_size, stat.st_mtime)
+        changed_paths = [jem_path for jem_path in stats if self._stats.get(jem_path) != stats[jem_path]]
+        removed_paths = [jem_path for jem_path in self._slice_data if jem_path not in stats]
+        if (self.jem_df is not None) and (len(changed_paths) == 0) and (len(removed_paths) == 0):
+            return False
+
+        try:
+            slice_data_list = flatten_jem_files(changed_paths, start_day, end_day, cache=self._cache, save_cache=False)
+        except SystemExit as e:
+            # (Ex. a JEM file saved while it was read, retried at the next poll)
+            print("JEM watch: %s" %e.code)
+            return False
+        for jem_path, slice_data in zip(changed_paths, slice_data_list):
+            self._slice_data[jem_path] = slice_data
+            self._stats[jem_path] = stats[jem_path]
+        for jem_path in removed_paths:
+            del self._slice_data[jem_path]
+            self._stats.pop(jem_path, None)
+
+        # Combine in listing order (as generate_jem_df)
+        records = [record for jem_path in stats if self._slice_data[jem_path] is not None for record in self._slice_data[jem_path]]
+        self.jem_df = clean_jem_df(records_to_data(records), self.group, self.filter_tubes)
+        print("JEM watch: %s files flattened, %s files removed, %s attempts in jem_df." %(len(changed_paths), len(removed_paths), len(self.jem_df)))
+
+        return True
+
+    def save_cache(self, min_interval=0):
+        """
+        Saves the JEM cache if it changed (see JemCache.save).
+
+        Parameters:
+            min_interval (int): seconds since the previous save before the cache is saved again (0 saves now).
+
+        Returns:
+            None
+        """
+
+        if self._cache is None or time.time() - self._cache_saved < min_interval:
+            return
+        self._cache.save()
+        self._cache_saved = time.time()
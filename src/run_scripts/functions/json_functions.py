@@ -0,0 +1,124 @@
+"""
+---------------------------------------------------------------------
+File name: json_functions.py
+Maintainer: Ramkumar Rajanbabu
+---------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: JSON decoding with an optional fast backend
+---------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import json
+import time
+# Optional imports (the standard library json module is used without orjson)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+#-----Variables-----#
+# Name of the decoding backend in use
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+#-----Functions-----#
+def loads(data):
+    """
+    Decodes a JSON document from bytes (or a string) with the fast backend if installed.
+
+    Documents the fast backend rejects but the standard library accepts (ex. NaN
+    values written by Python, non UTF-8 byte order marks) are decoded with the
+    standard library, so results never depend on the backend.
+
+    Parameters:
+        data (bytes or string): a JSON document.
+
+    Returns:
+        document: the decoded JSON document (dictionaries, lists, strings and numbers).
+
+    Raises:
+        ValueError: if data is not valid JSON (json.JSONDecodeError, or UnicodeDecodeError
+            for bytes that are not valid text).
+    """
+
+    if orjson is not None and not _has_non_finite(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(data)
+
+
+def _has_non_finite(data):
+    """
+    Checks for NaN or Infinity values, which only the standard library decodes
+    (a fast scan that avoids decoding such documents twice).
+
+    Parameters:
+        data (bytes or string): a JSON document.
+
+    Returns:
+        has_non_finite (boolean): True if "NaN" or "Infinity" appears in data.
+    """
+
+    if isinstance(data, str):
+        return ("NaN" in data) or ("Infinity" in data)
+
+    return (b"NaN" in data) or (b"Infinity" in data)
+
+
+def load_json(file_path):
+    """
+    Reads and decodes a JSON file (read as bytes, without a text decoding step).
+
+    Parameters:
+        file_path (string): path to a JSON file.
+
+    Returns:
+        document: the decoded JSON document.
+
+    Raises:
+        ValueError: if the file is not valid JSON.
+    """
+
+    with open(file_path, "rb") as json_file:
+        data = json_file.read()
+
+    return loads(data)
+
+
+def benchmark_json_decoding(file_paths, repeat=5):
+    """
+    Times decoding of JSON files with the standard library and the fast backend.
+
+    Parameters:
+        file_paths (list): paths to JSON files (read once, decoding is timed from memory).
+        repeat (int): number of times every file is decoded.
+
+    Returns:
+        timings (dictionary): backend name to seconds per file.
+    """
+
+    documents = []
+    for file_path in file_paths:
+        with open(file_path, "rb") as json_file:
+            documents.append(json_file.read())
+    backends = {"json (text)": lambda data: json.loads(data.decode("utf-8")),
+                "json (bytes)": json.loads,
+                "loads (%s)" %JSON_BACKEND: loads}
+
+    timings = {}
+    for name, decode in backends.items():
+        start = time.perf_counter()
+        for i in range(repeat):
+            for data in documents:
+                decode(data)
+        timings[name] = (time.perf_counter() - start) / max(1, repeat*len(documents))
+
+    return timings
@@ -0,0 +1,124 @@
+"""
+---------------------------------------------------------------------
+File name: lims_backends.py
+Maintainer: Ramkumar Rajanbabu
+---------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: LIMS backends (where LIMS connections come from): the LIMS
+database or a local Postgres stand-in for offline benchmarking
+---------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import os
+import pg8000
+# File imports
+from functions.lims_cache import LIMS_CACHE_DIR
+
+
+#-----Variables-----#
+# Environment variable selecting the LIMS backend of a run ("lims" by default, or "standin")
+LIMS_BACKEND_ENV = "EPHYS_LIMS_BACKEND"
+# Local Postgres stand-in (see lims_standin.py)
+STANDIN_HOST = "localhost"
+STANDIN_PORT = 5432
+STANDIN_DATABASE = "lims_standin"
+STANDIN_USER = "postgres"
+STANDIN_PASSWORD = "postgres"
+
+
+#-----Functions-----#
+def get_lims_backend_by_name(name):
+    """
+    Creates a LIMS backend from its name.
+
+    Parameters:
+        name (string): "lims" or "standin".
+
+    Returns:
+        backend (LimsBackend): the backend.
+    """
+
+    backends = {"lims": PostgresLimsBackend, "standin": StandinLimsBackend}
+    if name not in backends:
+        raise ValueError("Unknown LIMS backend '%s' (backends: %s)" %(name, ", ".join(backends)))
+
+    return backends[name]()
+
+
+def get_default_lims_backend_name():
+    """
+    Returns the name of the LIMS backend of this run (EPHYS_LIMS_BACKEND environment variable, "lims" if not set).
+
+    Parameters:
+        None
+
+    Returns:
+        name (string): backend name.
+    """
+
+    return os.environ.get(LIMS_BACKEND_ENV, "lims").strip().lower() or "lims"
+
+
+#-----Classes-----#
+class LimsBackend(object):
+    """
+    Where LIMS connections come from. A backend opens DB-API connections that run the
+    LIMS queries unchanged (PostgreSQL, through pg8000), and has its own query result
+    cache directory so results of different backends are never mixed.
+    """
+
+    name = None
+    cache_dir = LIMS_CACHE_DIR
+
+    def connect(self, user, host, database, password, port):
+        """
+        Opens a connection.
+
+        Parameters:
+            user, host, database, password, port: LIMS connection parameters (see lims_functions.limsquery).
+
+        Returns:
+            conn (pg8000 connection): an open connection.
+        """
+
+        raise NotImplementedError
+
+
+class PostgresLimsBackend(LimsBackend):
+    """
+    The LIMS database (the connection parameters of each query are used as given).
+    """
+
+    name = "lims"
+
+    def connect(self, user, host, database, password, port):
+        return pg8000.connect(user=user, host=host, database=database, password=password, port=port)
+
+
+class StandinLimsBackend(LimsBackend):
+    """
+    A local Postgres database seeded with synthetic LIMS tables (see lims_standin.py).
+    Every query runs on the stand-in, whatever LIMS connection parameters it is given.
+    """
+
+    name = "standin"
+    cache_dir = LIMS_CACHE_DIR + "_standin"
+
+    def __init__(self, host=STANDIN_HOST, port=STANDIN_PORT, database=STANDIN_DATABASE, user=STANDIN_USER, password=STANDIN_PASSWORD):
+        """
+        Parameters:
+            host, port, database, user, password (string): connection parameters of the local Postgres stand-in.
+        """
+
+        self.host = host
+        self.port = port
+        self.database = database
+        self.user = user
+        self.password = password
+
+    def connect(self, user=None, host=None, database=None, password=None, port=None):
+        return pg8000.connect(user=self.user, host=self.host, database=self.database, password=self.password, port=self.port)
@@ -0,0 +1,489 @@
+"""
+---------------------------------------------------------------------
+File name: lims_cache.py
+Maintainer: Ramkumar Rajanbabu
+---------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: On-disk cache of LIMS query results
+---------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import pandas as pd
+from contextlib import contextmanager
+# Optional imports (the cache is disabled without pyarrow)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+#-----Variables-----#
+# Bump when the cached result format changes
+CACHE_VERSION = 1
+# Local cache directory (kept off the network share on purpose)
+LIMS_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".ephys-analysis-tools", "lims_cache")
+# Cache size limit, the least recently used results are evicted first
+LIMS_CACHE_MAX_BYTES = 512*1024**2
+# Default seconds a cached result is used before it is refreshed
+LIMS_CACHE_TTL_SECONDS = 3600
+# Seconds between full refreshes of results refreshed from a watermark (catches deleted rows)
+LIMS_CACHE_FULL_REFRESH_SECONDS = 24*3600
+# Seconds after which an index lock file is considered left over by a crashed process
+LIMS_CACHE_LOCK_STALE_SECONDS = 30
+
+
+#-----Functions-----#
+def get_query_key(query, params=None):
+    """
+    Generates the cache key of a query: a hash of the SQL (whitespace normalized) and its parameters.
+
+    Parameters:
+        query (string): SQL query.
+        params (tuple or dictionary): query parameters, or None.
+
+    Returns:
+        key (string): hex digest.
+    """
+
+    normalized = " ".join(query.split())
+    if params is not None and not isinstance(params, dict):
+        params = list(params)
+    text = json.dumps([CACHE_VERSION, normalized, params], default=str, sort_keys=True)
+
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def clear_lims_cache(cache_dir=LIMS_CACHE_DIR):
+    """
+    Deletes every cached LIMS query result.
+
+    Parameters:
+        cache_dir (string): cache directory.
+
+    Returns:
+        n_removed (int): number of removed files.
+    """
+
+    n_removed = 0
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            os.remove(os.path.join(cache_dir, name))
+            n_removed += 1
+
+    return n_removed
+
+
+@contextmanager
+def _index_lock(cache_dir, stale_seconds=LIMS_CACHE_LOCK_STALE_SECONDS):
+    """
+    Context manager holding the index lock file of a cache directory (with _index_lock(cache_dir): ...),
+    so processes sharing the cache read, merge and write index.json one at a time.
+
+    Parameters:
+        cache_dir (string): cache directory.
+        stale_seconds (int): seconds after which an existing lock file is removed.
+
+    Returns:
+        None (raises TimeoutError, an OSError, if the lock cannot be taken)
+    """
+
+    lock_path = os.path.join(cache_dir, "index.lock")
+    deadline = time.time() + 2*stale_seconds
+    while True:
+        try:
+            lock_file = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_seconds:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                # (Released since)
+                continue
+            except OSError:
+                pass
+            if time.time() > deadline:
+                raise TimeoutError("LIMS cache index lock %s could not be taken." %lock_path)
+            time.sleep(0.05)
+    os.close(lock_file)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+#-----Classes-----#
+class LimsCache(object):
+    """
+    A persistent cache of LIMS query results, one parquet file per query and parameters.
+
+    A result is used until it is older than the query's TTL. Results with a watermark
+    column (ex. updated_at) can then be refreshed incrementally: by key (the keys and
+    watermarks of the matching rows are compared with the cached rows, and only new or
+    updated rows are queried again), or for append-only queries by querying the rows
+    newer than the cached maximum. A full refresh runs every LIMS_CACHE_FULL_REFRESH_SECONDS. The index (index.json) keeps the refresh
+    times, size and last use of every result. The cache may be used by several threads
+    (queries run outside of its lock) and processes: the index is re-read and merged under
+    a lock file before it is saved, and only results evicted by this process are deleted.
+    """
+
+    def __init__(self, cache_dir=LIMS_CACHE_DIR, max_bytes=LIMS_CACHE_MAX_BYTES, full_refresh_seconds=LIMS_CACHE_FULL_REFRESH_SECONDS):
+        """
+        Parameters:
+            cache_dir (string): cache directory.
+            max_bytes (int): maximum size of cached results before eviction.
+            full_refresh_seconds (int): seconds between full refreshes of results refreshed from a watermark.
+        """
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.full_refresh_seconds = full_refresh_seconds
+        self.enabled = pa is not None
+        self.hits = 0
+        self.refreshes = 0
+        self.misses = 0
+        self._index = None
+        # Keys updated or evicted by this process since the index was last saved
+        self._changed = set()
+        self._evicted = set()
+        self._lock = threading.RLock()
+
+    def fetch(self, query, params, run_query, ttl_seconds=LIMS_CACHE_TTL_SECONDS, watermark_column=None, key_columns=None):
+        """
+        Returns the result of a query from the cache, running (or refreshing) it if needed.
+
+        Parameters:
+            query (string): SQL query (with %s placeholders for a tuple of params, :name for a dictionary).
+            params (tuple or dictionary): query parameters, or None.
+            run_query (function): run_query(query, params) returns the result dataframe.
+            ttl_seconds (int): seconds the cached result is used before it is refreshed.
+            watermark_column (string): column of the result that changes when a row is
+                updated (ex. "updated_at"), to refresh only new or updated rows, or None.
+            key_columns (list): columns identifying a row. Expired results are refreshed by
+                key (see _refresh_keys), which also drops deleted rows. None treats the query
+                as append-only: only rows past the cached watermark are queried and appended.
+
+        Returns:
+            df (dataframe): a pandas dataframe.
+        """
+
+        if not self.enabled:
+            return run_query(query, params)
+        key = get_query_key(query, params)
+        with self._lock:
+            if self._index is None:
+                self.load()
+            entry = self._index.get(key)
+            now = time.time()
+            df = self._read(key) if entry is not None else None
+
+            if df is not None and now - entry["refreshed"] <= ttl_seconds:
+                self.hits += 1
+                entry["last_used"] = now
+                self._changed.add(key)
+                self._save_index()
+                return df
+
+        if df is not None and watermark_column is not None and now - entry["created"] <= self.full_refresh_seconds \
+           and (key_columns is not None or df[watermark_column].notnull().any()):
+            if key_columns is not None:
+                df = self._refresh_keys(query, params, run_query, df, watermark_column, key_columns)
+            else:
+                df = self._refresh_appended(query, params, run_query, df, watermark_column)
+            with self._lock:
+                self.refreshes += 1
+                self._write(key, query, df, created=entry["created"], now=now)
+            return df
+
+        df = run_query(query, params)
+        with self._lock:
+            self.misses += 1
+            self._write(key, query, df, created=now, now=now)
+
+        return df
+
+    def _refresh_appended(self, query, params, run_query, df, watermark_column):
+        """
+        Refreshes a cached result of an append-only query: rows past the cached watermark
+        are queried and appended.
+
+        Parameters:
+            query, params, run_query, watermark_column: see fetch.
+            df (dataframe): the cached result.
+
+        Returns:
+            df (dataframe): the refreshed result.
+        """
+
+        watermark = df[watermark_column].max()
+        if isinstance(watermark, pd.Timestamp):
+            watermark = watermark.to_pydatetime()
+        if isinstance(params, dict):
+            refresh_query = "SELECT * FROM (%s) AS cached_query WHERE cached_query.%s > :cache_watermark" %(query, watermark_column)
+            refresh_params = dict(params, cache_watermark=watermark)
+        else:
+            refresh_query = "SELECT * FROM (%s) AS cached_query WHERE cached_query.%s > %%s" %(query, watermark_column)
+            refresh_params = tuple(params or ()) + (watermark,)
+        new_df = run_query(refresh_query, refresh_params)
+        if len(new_df) > 0:
+            df = pd.concat([df, new_df], ignore_index=True)
+
+        return df
+
+    def _refresh_keys(self, query, params, run_query, df, watermark_column, key_columns):
+        """
+        Refreshes a cached result by key: the keys and watermarks of every row currently
+        matching the query are queried (only these columns cross the network). Cached
+        rows whose key no longer matches (deleted rows, or rows edited out of the query's
+        filters) are dropped, and rows with a new key or a different watermark are queried
+        again. Rows with a missing watermark are always queried again.
+
+        Parameters:
+            query, params, run_query, watermark_column, key_columns: see fetch.
+            df (dataframe): the cached result.
+
+        Returns:
+            df (dataframe): the refreshed result.
+        """
+
+        select_columns = ", ".join("cached_query.%s" %(column) for column in key_columns + [watermark_column])
+        keys_query = "SELECT %s FROM (%s) AS cached_query" %(select_columns, query)
+        keys_df = run_query(keys_query, params).drop_duplicates(ignore_index=True)
+        if len(keys_df) == 0:
+            return df.iloc[0:0].reset_index(drop=True)
+
+        cached_df = df[key_columns + [watermark_column]].drop_duplicates(subset=key_columns)
+        merged_df = keys_df.merge(cached_df, on=key_columns, how="left", suffixes=("", "_cached"))
+        unchanged = merged_df[watermark_column] == merged_df[watermark_column + "_cached"]
+        changed_df = merged_df.loc[~unchanged, key_columns].drop_duplicates(ignore_index=True)
+        current = pd.MultiIndex.from_frame(keys_df[key_columns])
+        changed = pd.MultiIndex.from_frame(changed_df)
+        cached_keys = pd.MultiIndex.from_frame(df[key_columns])
+        df = df[cached_keys.isin(current) & ~cached_keys.isin(changed)]
+
+        if len(changed_df) > 0:
+            key_values = [changed_df[column].tolist() for column in key_columns]
+            key_tuple = "(%s)" %(", ".join("cached_query.%s" %(column) for column in key_columns))
+            if isinstance(params, dict):
+                names = ["cache_keys_%s" %(idx) for idx in range(len(key_columns))]
+                rows_query = "SELECT * FROM (%s) AS cached_query WHERE %s IN (SELECT * FROM UNNEST(%s))" \
+                             %(query, key_tuple, ", ".join(":" + name for name in names))
+                rows_params = dict(params, **dict(zip(names, key_values)))
+            else:
+                rows_query = "SELECT * FROM (%s) AS cached_query WHERE %s IN (SELECT * FROM UNNEST(%s))" \
+                             %(query, key_tuple, ", ".join(["%s"]*len(key_columns)))
+                rows_params = tuple(params or ()) + tuple(key_values)
+            new_df = run_query(rows_query, rows_params)
+            df = pd.concat([df, new_df], ignore_index=True)
+
+        return df.reset_index(drop=True)
+
+    def load(self):
+        """
+        Reads the cache index, discarding it if it cannot be read.
+
+        Parameters:
+            None
+
+        Returns:
+            n_entries (int): number of cached results.
+        """
+
+        self._index = self._read_index()
+        if self._index is None:
+            print("LIMS cache index could not be read - rebuilding %s." %self.cache_dir)
+            self._index = {}
+        self._changed = set()
+        self._evicted = set()
+
+        return len(self._index)
+
+    def evict(self):
+        """
+        Evicts the least recently used results until the cache fits in max_bytes, deleting
+        the result files of the evicted keys (files of other keys are left alone, they may
+        have been written by another process since the index was read).
+
+        Parameters:
+            None
+
+        Returns:
+            n_evicted (int): number of evicted results.
+        """
+
+        total_bytes = sum(entry["n_bytes"] for entry in self._index.values())
+        n_evicted = 0
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]["last_used"]):
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= entry["n_bytes"]
+            del self._index[key]
+            self._changed.discard(key)
+            self._evicted.add(key)
+            n_evicted += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+        return n_evicted
+
+    def _read(self, key):
+        """
+        Reads a cached result.
+
+        Parameters:
+            key (string): cache key.
+
+        Returns:
+            df (dataframe): the cached result, or None if it cannot be read.
+        """
+
+        try:
+            return pq.read_table(self._path(key)).to_pandas()
+        except (OSError, pa.ArrowInvalid):
+            return None
+
+    def _write(self, key, query, df, created, now):
+        """
+        Writes a result (through a temporary file) and updates the index. The result
+        is not cached if it cannot be written.
+
+        Parameters:
+            key (string): cache key.
+            query (string): SQL query (kept in the index for reference).
+            df (dataframe): query result.
+            created (float): time of the last full refresh.
+            now (float): time of this refresh.
+
+        Returns:
+            None
+        """
+
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # (Columns of mixed types cannot be stored, the result is not cached)
+            return
+        # (Unique temporary file, several threads may write the same result)
+        temp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_file, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=key + "_", suffix=".tmp")
+            os.close(temp_file)
+            pq.write_table(table, temp_path)
+            os.replace(temp_path, self._path(key))
+            n_bytes = os.path.getsize(self._path(key))
+        except OSError:
+            print("LIMS cache result could not be saved to %s." %self.cache_dir)
+            if temp_path is not None and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            return
+        self._index[key] = {"query": " ".join(query.split())[0:200],
+                            "created": created,
+                            "refreshed": now,
+                            "last_used": now,
+                            "n_rows": len(df),
+                            "n_bytes": n_bytes}
+        self._changed.add(key)
+        self._evicted.discard(key)
+        self._save_index()
+
+    def _read_index(self):
+        """
+        Reads the entries of index.json.
+
+        Parameters:
+            None
+
+        Returns:
+            entries (dictionary): key: entry of every cached result ({} if there is no index
+                or it has another version), or None if the index cannot be read.
+        """
+
+        index_path = os.path.join(self.cache_dir, "index.json")
+        if not os.path.exists(index_path):
+            return {}
+        try:
+            with open(index_path, "r") as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return None
+
+        return index["entries"] if index.get("version") == CACHE_VERSION else {}
+
+    def _save_index(self):
+        """
+        Merges the entries updated by this process into index.json (re-read under the
+        index lock, so entries saved by other processes are kept), evicts results over
+        max_bytes and writes the index (through a temporary file).
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+
+        index_path = os.path.join(self.cache_dir, "index.json")
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with _index_lock(self.cache_dir):
+                index = self._read_index() or {}
+                for key in self._evicted:
+                    index.pop(key, None)
+                for key in self._changed:
+                    entry = self._index.get(key)
+                    saved = index.get(key)
+                    if entry is None:
+                        continue
+                    if saved is not None and saved["refreshed"] > entry["refreshed"]:
+                        # (Refreshed by another process since, keep its result)
+                        saved["last_used"] = max(saved["last_used"], entry["last_used"])
+                    else:
+                        index[key] = entry
+                self._index = index
+                self.evict()
+                temp_file, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix="index_", suffix=".tmp")
+                try:
+                    with os.fdopen(temp_file, "w") as index_file:
+                        json.dump({"version": CACHE_VERSION, "entries": self._index}, index_file)
+                    os.replace(temp_path, index_path)
+                except OSError:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+                self._changed = set()
+                self._evicted = set()
+        except OSError:
+            print("LIMS cache index could not be saved to %s." %self.cache_dir)
+
+    def _path(self, key):
+        """
+        Parameters:
+            key (string): cache key.
+
+        Returns:
+            path (string): path to the result file of key.
+        """
+
+        return os.path.join(self.cache_dir, key + ".parquet")
@@ -12,32 +12,112 @@ Description: LIMS related functions
 
 #-----Imports-----#
 # General imports
+import atexit
 import json
+import numpy as np
 import pandas as pd
 import pg8000
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 # File imports
 from functions.file_functions import load_data_variables
 from functions.io_functions import is_this_py3
+from functions.lims_backends import LimsBackend, get_default_lims_backend_name, get_lims_backend_by_name
+from functions.lims_cache import LimsCache
+from functions.lims_stats import estimate_rows_bytes, get_lims_stats
+from functions.sql_registry import get_sql_query
 
 
 #-----Variables-----#
 # Load json file
 data_variables = load_data_variables()
+# LIMS connection pool: connections kept open per process, and seconds a connection may sit idle before a health check
+LIMS_POOL_SIZE = 4
+LIMS_HEALTH_CHECK_SECONDS = 60
+# Patched cell container prefixes of collaborator containers (excluded from the daily transcriptomics reports)
+COLLAB_CONTAINER_PREFIXES = ["PGS4", "PHS4", "PNS4", "PDS4", "PRS4", "PZS4"]
+# HCT patched cell container tube numbers (Ex. PXS4_220101_301_A01 -> 301)
+HCT_TUBE_NUMBERS = ([str(x) for x in range(101, 151, 1)]      # Jonathan(101-150)
+                    + [str(x) for x in range(225, 251, 1)]    # Cristina(225-250)
+                    + [str(x) for x in range(301, 351, 1)]    # Brian K(301-350), Meanhwan(325-350)
+                    #+ [str(x) for x in range(351, 401, 1)]   # Lindsay(351-400)
+                    + [str(x) for x in range(751, 801, 1)]    # Scott(751-800)
+                    + [str(x) for x in range(801, 851, 1)])   # Sami (801-850) - was Sara, updated to Sami
+# Cells (or specimens) per query of get_lims_sweeps
+LIMS_SWEEP_CHUNK_SIZE = 1000
+# Rows per fetch of queries streamed through a server-side cursor (limsquery_df)
+LIMS_FETCH_ROWS = 5000
+# Seconds get_lims results are used from the LIMS cache before a refresh (0 refreshes on every
+# call: the ids and updated_at of the matching cells are queried, and only new or updated cells
+# are queried in full)
+LIMS_CELLS_CACHE_TTL = 0
+# PostgreSQL type OIDs of result columns decoded into typed arrays (see _rows_to_df)
+FLOAT_TYPE_OIDS = {700, 701, 1700}     # real, double precision, numeric
+INT_TYPE_OIDS = {20, 21, 23}           # bigint, smallint, integer
+BOOL_TYPE_OIDS = {16}                  # boolean
+TIMESTAMP_TYPE_OIDS = {1114, 1184}     # timestamp, timestamp with time zone
+TEXT_TYPE_OIDS = {19, 25, 1042, 1043}  # name, text, char, varchar
+# LIMS backend of this process (see set_lims_backend) and its query result cache
+_lims_backend = None
+_lims_cache = None
+# Threads running queries submitted with submit_lims_query (one per pooled connection)
+LIMS_QUERY_THREADS = LIMS_POOL_SIZE
+_lims_executor = None
+# Connection pools of this process (one per database/user)
+_lims_pools = {}
+_lims_pools_lock = threading.Lock()
 
 
 #-----Functions-----#
 def _connect(user="limsreader", host="limsdb2", database="lims2", password="limsro", port=5432):
-    conn = pg8000.connect(user=user, host=host, database=database, password=password, port=port)
-    return conn, conn.cursor()
+    conn = get_lims_backend().connect(user, host, database, password, port)
+    return conn
 
 
-def _select(cursor, query):
-    cursor.execute(query)
-    columns = [ d[0] for d in cursor.description ]
-    return [ dict(zip(columns, c)) for c in cursor.fetchall() ]
+def get_lims_backend():
+    """Returns the LIMS backend of this process: the LIMS database, unless the
+    EPHYS_LIMS_BACKEND environment variable (or set_lims_backend) selects another one
+    (ex. "standin", a local Postgres stand-in for offline benchmarking, see lims_standin.py)."""
+    global _lims_backend
+    with _lims_pools_lock:
+        if _lims_backend is None:
+            _lims_backend = get_lims_backend_by_name(get_default_lims_backend_name())
+    return _lims_backend
 
 
-def limsquery(query, user="limsreader", host="limsdb2", database="lims2", password="limsro", port=5432):
+def set_lims_backend(backend):
+    """Runs the following LIMS queries of this process on another backend, closing the
+    connections of the previous one.
+
+    Parameters
+    ----------
+    backend : LimsBackend, or a backend name ("lims" or "standin")
+
+    Returns
+    -------
+    backend : LimsBackend
+    """
+    global _lims_backend, _lims_cache
+    if not isinstance(backend, LimsBackend):
+        backend = get_lims_backend_by_name(backend)
+    close_lims_pools()
+    with _lims_pools_lock:
+        _lims_backend = backend
+        # (Each backend has its own result cache)
+        _lims_cache = None
+    return backend
+
+
+def _execute(cursor, query, params=None):
+    # (A dictionary is bound to :name placeholders, a tuple to %s placeholders)
+    if isinstance(params, dict):
+        cursor.paramstyle = "named"
+    cursor.execute(query, params or ())
+
+
+def limsquery(query, user="limsreader", host="limsdb2", database="lims2", password="limsro", port=5432, params=None):
     """Connects to the LIMS database, executes provided query and returns a dictionary with results.    
     Parameters
     ----------
@@ -47,18 +127,327 @@ def limsquery(query, user="limsreader", host="limsdb2", database="lims2", passwo
     database : string
     password : string
     port : int
+    params : tuple of values bound to the %s placeholders of query (literal % written as %%),
+        dictionary of values bound to its :name placeholders, or None
     
     Returns
     -------
     results : dictionary
     """
-    conn, cursor = _connect(user, host, database, password, port)
+    connect_args = {"user": user, "host": host, "database": database, "password": password, "port": port}
+    start = time.time()
+    pool = get_lims_pool(**connect_args)
+    with pool.connection() as conn:
+        connected = time.time()
+        cursor = conn.cursor()
+        try:
+            _execute(cursor, query, params)
+            executed = time.time()
+            columns = [ d[0] for d in cursor.description ]
+            rows = cursor.fetchall()
+            results = [ dict(zip(columns, c)) for c in rows ]
+        finally:
+            cursor.close()
+    _record_query(query, params, (connected - start, executed - connected, time.time() - executed), len(rows),
+                  estimate_rows_bytes(rows), connect_args)
+    return results
+
+
+def limsquery_df(query, params=None, chunksize=None, cache_ttl=None, watermark_column=None, key_columns=None,
+                 categorical_columns=None, user="limsreader", host="limsdb2", database="lims2", password="limsro", port=5432):
+    """Executes a query through a server-side cursor, fetching rows in batches
+    (instead of every row at once) and decoding each batch into typed columns
+    (see _rows_to_df).
+
+    Parameters
+    ----------
+    query : string containing SQL query (a SELECT, with %s or :name placeholders for params)
+    params : tuple or dictionary of values bound to the placeholders (see limsquery), or None
+    chunksize : int
+        Rows per dataframe yielded to the caller, or None to return one dataframe.
+    cache_ttl : int
+        Seconds a result may be used from the LIMS cache (see LimsCache.fetch), or None
+        to always query LIMS (streamed chunks are never cached).
+    watermark_column, key_columns : incremental refresh of cached results (see LimsCache.fetch)
+    categorical_columns : list
+        Text columns of repeated codes (ex. project codes, workflow states) returned as categoricals, or None.
+    user, host, database, password, port : connection parameters (see limsquery)
+
+    Returns
+    -------
+    df : pandas dataframe, or an iterator of pandas dataframes if chunksize is given
+    """
+    connect_args = {"user": user, "host": host, "database": database, "password": password, "port": port}
+    if chunksize is not None:
+        return _fetch_chunks(query, params, chunksize, connect_args, categorical_columns)
+    if cache_ttl is not None:
+        run_query = lambda cached_query, cached_params: limsquery_df(cached_query, cached_params, categorical_columns=categorical_columns,
+                                                                     **connect_args)
+        return get_lims_cache().fetch(query, params, run_query, cache_ttl, watermark_column, key_columns)
+
+    chunks = list(_fetch_chunks(query, params, LIMS_FETCH_ROWS, connect_args))
+    if len(chunks) == 1:
+        df = chunks[0]
+    else:
+        df = pd.concat(chunks, ignore_index=True)
+        # (Object columns that were empty in a chunk)
+        df = df.infer_objects()
+    # (Categories of the whole result, chunks may have different categories)
+    return _to_categorical(df, categorical_columns)
+
+
+def _fetch_chunks(query, params, chunksize, connect_args, categorical_columns=None):
+    """Yields the result of a query in dataframes of chunksize rows, through a
+    server-side cursor (the pooled connection is held until the last chunk)."""
+    start = time.time()
+    pool = get_lims_pool(**connect_args)
+    with pool.connection() as conn:
+        connected = time.time()
+        cursor = conn.cursor()
+        try:
+            _execute(cursor, "DECLARE lims_fetch NO SCROLL CURSOR FOR " + query, params)
+            executed = time.time()
+            # (Fetch time excludes the time the caller spends between chunks)
+            fetch_seconds = 0
+            n_rows = 0
+            n_bytes = 0
+            n_chunks = 0
+            while True:
+                fetch_start = time.time()
+                cursor.execute("FETCH FORWARD " + str(int(chunksize)) + " FROM lims_fetch")
+                columns = [ d[0] for d in cursor.description ]
+                type_oids = [ d[1] for d in cursor.description ]
+                rows = cursor.fetchall()
+                n_rows += len(rows)
+                n_bytes += estimate_rows_bytes(rows)
+                if len(rows) > 0 or n_chunks == 0:
+                    chunk = _to_categorical(_rows_to_df(rows, columns, type_oids), categorical_columns)
+                    fetch_seconds += time.time() - fetch_start
+                    yield chunk
+                    n_chunks += 1
+                else:
+                    fetch_seconds += time.time() - fetch_start
+                if len(rows) < chunksize:
+                    break
+        finally:
+            cursor.close()
+    # (Recorded once the connection is released, as a slow query is explained on a pooled connection)
+    _record_query(query, params, (connected - start, executed - connected, fetch_seconds), n_rows, n_bytes, connect_args)
+
+
+def run_named_query(name, params=None, user="limsreader", host="limsdb2", database="lims2", password="limsro", port=5432):
+    """Runs a named query of functions/sql_queries (see get_sql_query) as a prepared
+    statement. The statement is prepared once per pooled connection and reused by
+    later calls, so repeated queries (ex. per chunk of cells) are only planned once.
+
+    Parameters
+    ----------
+    name : string
+        Query name (file name without .sql, ex. "lims_sweeps_by_name").
+    params : dictionary of values bound to the :name placeholders of the query, or None
+    user, host, database, password, port : connection parameters (see limsquery)
+
+    Returns
+    -------
+    df : pandas dataframe
+    """
+    connect_args = {"user": user, "host": host, "database": database, "password": password, "port": port}
+    query = get_sql_query(name)
+    start = time.time()
+    pool = get_lims_pool(**connect_args)
+    with pool.connection() as conn:
+        connected = time.time()
+        statement = pool.prepare(conn, query)
+        try:
+            rows = statement.run(**(params or {}))
+        except pg8000.DatabaseError:
+            # (Prepared again by the next call, ex. after a schema change)
+            pool.discard_statement(conn, query)
+            raise
+        columns = [ column["name"] for column in statement.row_desc or [] ]
+        type_oids = [ column["type_oid"] for column in statement.row_desc or [] ]
+    executed = time.time()
+    df = _rows_to_df(rows, columns, type_oids)
+    _record_query(query, params, (connected - start, executed - connected, time.time() - executed), len(rows),
+                  estimate_rows_bytes(rows), connect_args)
+    return df
+
+
+def _record_query(query, params, timings, n_rows, n_bytes, connect_args):
+    """Records a query call in the LIMS query statistics (see LimsQueryStats), and
+    writes the plan of a slow query to the run log."""
+    stats = get_lims_stats()
+    record = stats.record(query, params, timings[0], timings[1], timings[2], n_rows, n_bytes)
+    if stats.is_slow(record):
+        try:
+            plan = _explain(query, params, connect_args)
+        except (pg8000.Error, OSError) as e:
+            plan = ["(EXPLAIN failed: %s)" %e]
+        stats.log_plan(record, query, params, plan)
+
+
+def _explain(query, params, connect_args):
+    """Runs a query again with EXPLAIN (ANALYZE, BUFFERS) and returns the lines of its plan."""
+    pool = get_lims_pool(**connect_args)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            _execute(cursor, "EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+            return [ row[0] for row in cursor.fetchall() ]
+        finally:
+            cursor.close()
+
+
+def _rows_to_df(rows, columns, type_oids=None):
+    """Builds a dataframe column by column from fetched rows (a repeated column name keeps its last column, as limsquery).
+
+    Columns are decoded from their PostgreSQL types (type_oids, from the cursor description)
+    straight into typed arrays: float64 for real/double/numeric columns, int64 for integer
+    columns (float64 if they have nulls), bool for boolean columns without nulls,
+    datetime64 for timestamp columns and objects for text columns. Other columns are
+    left to pandas.
+    """
+    values = list(zip(*rows)) if len(rows) > 0 else [ () for column in columns ]
+    data = {}
+    for idx, column in enumerate(columns):
+        data[column] = _decode_column(values[idx], type_oids[idx] if type_oids is not None else None)
+    return pd.DataFrame(data)
+
+
+def _decode_column(values, type_oid):
+    if type_oid in FLOAT_TYPE_OIDS:
+        # (None is decoded as NaN)
+        return np.array(values, dtype=np.float64)
+    if type_oid in INT_TYPE_OIDS:
+        try:
+            return np.array(values, dtype=np.int64)
+        except TypeError:
+            return np.array(values, dtype=np.float64)
+    if type_oid in BOOL_TYPE_OIDS and None not in values:
+        return np.array(values, dtype=bool)
+    if type_oid in TIMESTAMP_TYPE_OIDS:
+        try:
+            return pd.to_datetime(list(values))
+        except (ValueError, OverflowError):
+            # (Out of the datetime64 range, ex. year 1, kept as datetimes)
+            pass
+    if type_oid in TEXT_TYPE_OIDS:
+        # (Kept as objects, without type inference)
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+    return list(values)
+
+
+def _to_categorical(df, categorical_columns):
+    for column in categorical_columns or []:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def submit_lims_query(function, *args, **kwargs):
+    """Runs a LIMS query function (ex. get_lims_ephys, or run_named_query with a query
+    name) on the LIMS query threads, so it runs at the same time as other queries and
+    work of the caller. Each query runs on its own pooled connection.
+    (Functions submitted here should not wait on other submitted queries.)
+
+    Parameters
+    ----------
+    function : function returning the query result
+    args, kwargs : arguments of function
+
+    Returns
+    -------
+    future : concurrent.futures.Future of the result (future.result() waits for it, and raises its error)
+    """
+    global _lims_executor
+    with _lims_pools_lock:
+        if _lims_executor is None:
+            _lims_executor = ThreadPoolExecutor(max_workers=LIMS_QUERY_THREADS, thread_name_prefix="lims_query")
+    return _lims_executor.submit(function, *args, **kwargs)
+
+
+def run_lims_queries(queries):
+    """Runs independent LIMS queries at the same time (see submit_lims_query), so the
+    wall time is that of the slowest query instead of the sum.
+
+    Parameters
+    ----------
+    queries : dictionary
+        key: query, where a query is a named query ("lims_ephys"), a named query with
+        its parameters (("lims_sweeps_by_name", {"cell_names": [...]})) or a function
+        without arguments (ex. functools.partial(get_lims, date="220101")).
+
+    Returns
+    -------
+    results : dictionary
+        key: result (a pandas dataframe for named queries).
+    """
+    futures = {}
+    for key, query in queries.items():
+        if callable(query):
+            futures[key] = submit_lims_query(query)
+        elif isinstance(query, str):
+            futures[key] = submit_lims_query(run_named_query, query)
+        else:
+            name, params = query
+            futures[key] = submit_lims_query(run_named_query, name, params)
     try:
-        results = _select(cursor, query)
+        return { key: future.result() for key, future in futures.items() }
     finally:
-        cursor.close()
-        conn.close()
-    return results
+        # (Queries not started yet after an error)
+        for future in futures.values():
+            future.cancel()
+
+
+def get_lims_cache():
+    """Returns the LIMS query result cache of this process."""
+    global _lims_cache
+    backend = get_lims_backend()
+    with _lims_pools_lock:
+        if _lims_cache is None:
+            _lims_cache = LimsCache(cache_dir=backend.cache_dir)
+    return _lims_cache
+
+
+def get_lims_pool(user="limsreader", host="limsdb2", database="lims2", password="limsro", port=5432, size=LIMS_POOL_SIZE,
+                  health_check_seconds=LIMS_HEALTH_CHECK_SECONDS):
+    """Returns the LIMS connection pool of this process, creating it on first use.
+    The pool of a database/user is created once per process (size and
+    health_check_seconds only apply when it is created) and closed at exit.
+
+    Parameters
+    ----------
+    user, host, database, password, port : connection parameters (see limsquery)
+    size : int
+        Maximum number of open connections.
+    health_check_seconds : int
+        Seconds a connection may sit idle before it is checked with SELECT 1.
+
+    Returns
+    -------
+    pool : LimsConnectionPool
+    """
+    key = (user, host, database, port)
+    with _lims_pools_lock:
+        pool = _lims_pools.get(key)
+        if pool is None:
+            pool = LimsConnectionPool(user, host, database, password, port, size, health_check_seconds)
+            _lims_pools[key] = pool
+    return pool
+
+
+def close_lims_pools():
+    """Closes every LIMS connection of this process (called at exit)."""
+    with _lims_pools_lock:
+        pools = list(_lims_pools.values())
+        _lims_pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_lims_pools)
 
 
 def rename_byte_cols(df):
@@ -81,142 +470,98 @@ def rename_byte_cols(df):
 
 def get_lims_ephys():
 
-    project_codes = ("hIVSCC-MET", "hIVSCC-METx", "hIVSCC-METc", "hIVSCC-MET-SCH", "hIVSCC-METc-SCH", "mIVSCC-MET", "mIVSCC-METx", "mIVSCC-MET-HiMC", "mIVSCC-MET-R01_LC", "mIVSCC-MET-U19_AIBS", "mIVSCC-MET-U01_AIBS", "qIVSCC-METa", "qIVSCC-METc", "MET-NM", "mMPATCHx", "H301", "H301x", "BHA-ODa")
-    user_codes = ("PC", "PX", "P1", "P2", "P4", "P6", "P8", "P9", "PA", "PB", "PE", "PF", "PI", "PJ", "PR", "PV", "PL")
-
-    lims_query = """
-    SELECT cell.name AS cell_name, 
-    cell.id AS cell_id, 
-    cell.patched_cell_container AS tube_id,
-    substring(cell.patched_cell_container, 0, 3) as rig_operator,
-    cell.workflow_state AS specimen_workflow_state,
-    p.code AS project_code,
-    err.id AS roi_result_id,
-    err.storage_directory AS storage_dir,
-    err.created_at AS created_date,
-    err.recording_date AS recording_date,
-    err.workflow_state AS roiresult_workflow_state,
-    err.electrode_0_pa,
-    err.failed_electrode_0,
-    err.input_resistance_mohm,
-    err.initial_access_resistance_mohm,
-    err.input_access_resistance_ratio,
-    err.seal_gohm,
-    err.failed_no_seal,
-    err.failed_bad_rs,
-    err.failed_other,
-    slice.name as slice_name,
-    eff.tau,
-    eff.upstroke_downstroke_ratio_short_square,
-    eff.peak_v_short_square,
-    eff.upstroke_downstroke_ratio_ramp,
-    eff.threshold_v_ramp,
-    eff.sag,
-    eff.threshold_t_ramp,
-    eff.slow_trough_v_ramp,
-    eff.vrest, 
-    eff.trough_t_ramp,
-    eff.trough_v_long_square,
-    eff.threshold_t_short_square,
-    eff.peak_t_ramp,
-    eff.fast_trough_v_ramp,
-    eff.trough_t_long_square,
-    eff.slow_trough_v_long_square,
-    eff.trough_t_short_square,
-    eff.slow_trough_t_long_square,
-    eff.threshold_v_long_square,
-    eff.fast_trough_t_long_square,
-    eff.ri,
-    eff.threshold_t_long_square,
-    eff.threshold_v_short_square,
-    eff.avg_isi,
-    eff.vm_for_sag,
-    eff.threshold_i_long_square,
-    eff.threshold_i_short_square,
-    eff.slow_trough_t_ramp,
-    eff.peak_v_ramp,
-    eff.fast_trough_v_short_square,
-    eff.fast_trough_t_short_square,
-    eff.fast_trough_t_ramp,
-    eff.threshold_i_ramp,
-    eff.slow_trough_v_short_square,
-    eff.peak_t_short_square,
-    eff.slow_trough_t_short_square,
-    eff.trough_v_short_square,
-    eff.f_i_curve_slope,
-    eff.peak_t_long_square,
-    eff.latency,
-    eff.fast_trough_v_long_square,
-    eff.upstroke_downstroke_ratio_long_square,
-    eff.trough_v_ramp,
-    eff.peak_v_long_square,
-    eff.adaptation,
-    eff.has_delay,
-    eff.has_pause,
-    eff.has_burst
-    FROM specimens cell
-    LEFT JOIN ephys_roi_results err ON cell.ephys_roi_result_id = err.id 
-    LEFT JOIN projects p ON cell.project_id = p.id
-    LEFT JOIN specimens slice ON cell.parent_id = slice.id
-    LEFT JOIN ephys_features eff ON cell.id = eff.specimen_id
-    WHERE p.code IN {}
-    AND substring(cell.patched_cell_container, 0, 3) IN {}
-    AND cell.patched_cell_container IS NOT null
-    ORDER BY err.created_at
-    """ .format(project_codes, user_codes)
-    # AND err.storage_directory IS NOT null
-
-    df = pd.DataFrame(limsquery(lims_query))
+    project_codes = ["hIVSCC-MET", "hIVSCC-METx", "hIVSCC-METc", "hIVSCC-MET-SCH", "hIVSCC-METc-SCH", "mIVSCC-MET", "mIVSCC-METx", "mIVSCC-MET-HiMC", "mIVSCC-MET-R01_LC", "mIVSCC-MET-U19_AIBS", "mIVSCC-MET-U01_AIBS", "qIVSCC-METa", "qIVSCC-METc", "MET-NM", "mMPATCHx", "H301", "H301x", "BHA-ODa"]
+    user_codes = ["PC", "PX", "P1", "P2", "P4", "P6", "P8", "P9", "PA", "PB", "PE", "PF", "PI", "PJ", "PR", "PV", "PL"]
+
+    df = limsquery_df(get_sql_query("lims_ephys"), {"project_codes": project_codes, "user_codes": user_codes},
+                      categorical_columns=["project_code", "specimen_workflow_state", "roiresult_workflow_state"])
     if is_this_py3:
         df = rename_byte_cols(df)
     return df
 
 
 def get_lims_sweep(cell_name):
-    sweep_qc_query = """
-    SELECT sw.specimen_id, stim.description, sw.workflow_state, sw.sweep_number, stype.name, specimens.name AS cell_name
+    df = run_named_query("lims_sweep", {"cell_name": cell_name})
+    if is_this_py3:
+        df = rename_byte_cols(df)
+    return df
+
 
-    FROM ephys_sweeps sw
+def get_lims_sweeps(cell_names=None, specimen_ids=None, chunk_size=LIMS_SWEEP_CHUNK_SIZE):
+    """Queries the sweeps of many cells at once (instead of get_lims_sweep per cell),
+    in chunks of chunk_size cells bound as an array (= ANY).
 
-    JOIN ephys_stimuli stim ON stim.id = sw.ephys_stimulus_id
-    JOIN specimens ON specimens.id = sw.specimen_id
-    JOIN ephys_stimulus_types stype ON stype.id = stim.ephys_stimulus_type_id
+    Parameters
+    ----------
+    cell_names : list
+        Cell (specimen) names, or None to use specimen_ids.
+    specimen_ids : list
+        Cell specimen ids, used if cell_names is None.
+    chunk_size : int
+        Number of cells per query.
 
-    WHERE specimens.name LIKE '{}'
-    """.format(cell_name)
-        
-    df = pd.DataFrame(limsquery(sweep_qc_query))
+    Returns
+    -------
+    df : pandas dataframe
+        Sweeps of every cell (specimen_id, description, workflow_state, sweep_number, name, cell_name).
+    """
+    if cell_names is not None:
+        query_name, param = "lims_sweeps_by_name", "cell_names"
+        values = list(dict.fromkeys(name for name in cell_names if pd.notnull(name)))
+    else:
+        query_name, param = "lims_sweeps_by_id", "specimen_ids"
+        values = list(dict.fromkeys(int(specimen_id) for specimen_id in specimen_ids if pd.notnull(specimen_id)))
+
+    # (The same prepared statement is run for every chunk)
+    dfs = [ run_named_query(query_name, {param: values[start:start+chunk_size]}) for start in range(0, len(values), chunk_size) ]
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=["specimen_id", "description", "workflow_state", "sweep_number", "name", "cell_name"])
+    df = pd.concat(dfs, ignore_index=True)
     if is_this_py3:
         df = rename_byte_cols(df)
     return df
 
 
-def get_lims():
-    lims_query="""
-    SELECT DISTINCT
-    cell.name,
-    cell.patched_cell_container,
-    cell.cell_depth,
-    slice.histology_well_name,
-    d.external_donor_name AS id_cell_specimen_id,
-    d.full_genotype AS id_slice_genotype,
-    d.name AS donor_name, 
-    org.name AS id_species,
-    proj.code AS id_project_code,
-    structures.acronym AS structure,
-    cell_reporters.name AS cell_reporter
-    FROM specimens cell
-    INNER JOIN specimens slice ON cell.parent_id = slice.id 
-    INNER JOIN donors d ON d.id = cell.donor_id
-    LEFT JOIN organisms org ON d.organism_id = org.id
-    LEFT JOIN projects proj ON cell.project_id = proj.id
-    LEFT JOIN structures ON cell.structure_id = structures.id
-    LEFT JOIN cell_reporters ON cell.cell_reporter_id = cell_reporters.id
-    WHERE SUBSTRING(cell.patched_cell_container FROM 6 FOR 6) BETWEEN '171001' AND '301231'"""
-
-    df = pd.DataFrame(limsquery(lims_query))
+def get_lims(start_day="171001", end_day="301231", date=None, exclude_prefixes=None, tube_numbers=None, exclude_tube_numbers=None,
+             cache=True):
+    """Queries LIMS for patched cells, filtering in the database with bound parameters.
+    Results are kept in the LIMS cache and refreshed by cell id: only new or updated
+    cells are queried in full, and cells that no longer match are dropped (see
+    LIMS_CELLS_CACHE_TTL).
+
+    Parameters
+    ----------
+    start_day, end_day : string
+        Range of patched cell container dates ("YYMMDD").
+    date : string
+        Only containers with this date ("YYMMDD"), or None.
+    exclude_prefixes : list
+        Container prefixes to exclude (ex. COLLAB_CONTAINER_PREFIXES), or None.
+    tube_numbers : list
+        Only containers with these tube numbers (ex. HCT_TUBE_NUMBERS), or None.
+    exclude_tube_numbers : list
+        Container tube numbers to exclude, or None.
+    cache : boolean
+        True (default) to use the LIMS cache.
+
+    Returns
+    -------
+    df : pandas dataframe
+    """
+    # (A None parameter does not filter, see lims_cells.sql)
+    params = {"start_day": start_day,
+              "end_day": end_day,
+              "date": date,
+              "exclude_prefixes": list(exclude_prefixes) if exclude_prefixes else None,
+              "tube_numbers": list(tube_numbers) if tube_numbers is not None else None,
+              "exclude_tube_numbers": list(exclude_tube_numbers) if exclude_tube_numbers else None}
+
+    df = limsquery_df(get_sql_query("lims_cells"), params, cache_ttl=LIMS_CELLS_CACHE_TTL if cache else None,
+                      watermark_column="cache_updated_at", key_columns=["cache_cell_id"])
     if is_this_py3:
         df = rename_byte_cols(df)
+    # (Columns only used by the LIMS cache)
+    df = df.drop(columns=["cache_cell_id", "cache_updated_at"])
     return df
 
 
@@ -232,42 +577,25 @@ def generate_lims_df(group, date):
         lims_df (dataframe): a pandas dataframe.
     """
 
-    # Lists
-    hct_jt = [str(x) for x in range(101, 151, 1)]          # Jonathan(101-150)
-    hct_cr = [str(x) for x in range(225, 251, 1)]          # Cristina(225-250)
-    hct_bk_mk = [str(x) for x in range(301, 351, 1)]       # Brian K(301-350), Meanhwan(325-350)
-    #hct_ln = [str(x) for x in range(351, 401, 1)]          # Lindsay(351-400)
-    hct_ss = [str(x) for x in range(751, 801, 1)]          # Scott(751-800)
-    hct_sl = [str(x) for x in range(801, 851, 1)]          # Sami (801-850) - was Sara, updated to Sami
-    hct_user_tube_num_list = hct_jt + hct_cr + hct_bk_mk + hct_ss + hct_sl
-
-    lims_df = get_lims()
+    # Query only the specified date, excluding collaborator containers and
+    # excluding (ivscc) or only including (hct) HCT containers
+    if group == "ivscc":
+        lims_df = get_lims(date=date, exclude_prefixes=COLLAB_CONTAINER_PREFIXES, exclude_tube_numbers=HCT_TUBE_NUMBERS)
+    elif group == "hct":
+        lims_df = get_lims(date=date, exclude_prefixes=COLLAB_CONTAINER_PREFIXES, tube_numbers=HCT_TUBE_NUMBERS)
+    else:
+        lims_df = get_lims(date=date, exclude_prefixes=COLLAB_CONTAINER_PREFIXES)
     # Rename columns based on jem_dictionary
     lims_df.rename(columns=data_variables["lims_dictionary"], inplace=True)
-    # Exclude Collaborator containers
-    lims_df = lims_df[(~lims_df["lims-id_patched_cell_container"].str.startswith("PGS4")) & (~lims_df["lims-id_patched_cell_container"].str.startswith("PHS4"))
-    & (~lims_df["lims-id_patched_cell_container"].str.startswith("PNS4")) & (~lims_df["lims-id_patched_cell_container"].str.startswith("PDS4"))
-    & (~lims_df["lims-id_patched_cell_container"].str.startswith("PRS4")) & (~lims_df["lims-id_patched_cell_container"].str.startswith("PZS4"))]
-    # Filters dataframe to user specified date
-    lims_df = lims_df[lims_df["lims-id_patched_cell_container"].str.contains(date)]
     # Only run if patched cell containers were collected
     if len(lims_df) > 0:
-        if group == "ivscc":
-            # Exclude HCT containers (Ex. column output: 301)
-            lims_df["lims-exclude_container"] = lims_df["lims-id_patched_cell_container"].str.slice(-7, -4)
-            lims_df = lims_df[~lims_df["lims-exclude_container"].str.contains("|".join(hct_user_tube_num_list))]
-        if group == "hct":
-            # Include only HCT containers (Ex. column output: 301)
-            lims_df["lims-include_container"] = lims_df["lims-id_patched_cell_container"].str.slice(-7, -4)
-            lims_df = lims_df[lims_df["lims-include_container"].str.contains("|".join(hct_user_tube_num_list))]
-        if len(lims_df) > 0:
-            # Replace values
-            lims_df["lims-id_species"].replace({"Homo Sapiens": "Human", "Mus musculus": "Mouse"}, inplace=True)
-            lims_df["lims-id_slice_genotype"].replace({None: ""}, inplace=True)
-            # Apply specimen id
-            lims_df["lims-id_cell_specimen_id"] = lims_df.apply(get_specimen_id, axis=1)
-            # Sort by patched_cell_container in ascending order
-            lims_df.sort_values(by="lims-id_patched_cell_container", inplace=True)
+        # Replace values
+        lims_df["lims-id_species"].replace({"Homo Sapiens": "Human", "Mus musculus": "Mouse"}, inplace=True)
+        lims_df["lims-id_slice_genotype"].replace({None: ""}, inplace=True)
+        # Apply specimen id
+        lims_df["lims-id_cell_specimen_id"] = lims_df.apply(get_specimen_id, axis=1)
+        # Sort by patched_cell_container in ascending order
+        lims_df.sort_values(by="lims-id_patched_cell_container", inplace=True)
 
     return lims_df
 
@@ -302,73 +630,10 @@ def get_specimen_id(row):
 #-----SQL Queries-----#
 def create_ivscc_transcriptomics_query_to_df():
     """
-    Uses same SQL query from ivscc_transcriptomics_query.sql file.
-    """
-
-    sql_query = """
-    WITH Ivscc AS (
-        SELECT
-            C.name AS lims_cell_name,
-            C.patched_cell_container AS lims_patch_tube,
-            SUBSTRING(C.patched_cell_container, 1, 4) AS lims_patch_tube_id,
-            CAST(SUBSTRING(C.patched_cell_container, 6, 6) AS DATE) AS lims_patch_tube_date,
-            SUBSTRING(C.patched_cell_container, 13, 3) AS lims_patch_tube_number,
-            Sp.histology_well_name AS lims_histology_well_name,
-            P.code AS lims_project_code,
-            O.name AS lims_species_type,
-            S.acronym AS lims_structure,
-            CR.name AS lims_cell_reporter,
-            C.cell_depth AS lims_cell_depth,
-            D.name AS lims_donor_name,
-            D.external_donor_name AS lims_specimen_id,
-            D.full_genotype AS lims_slice_genotype
-        FROM specimens C
-        INNER JOIN specimens Sp
-            ON C.parent_id = Sp.id 
-        INNER JOIN donors D 
-            ON D.id = C.donor_id
-        LEFT JOIN organisms O
-            ON D.organism_id = O.id
-        LEFT JOIN projects P
-            ON C.project_id = P.id
-        LEFT JOIN structures S
-            ON C.structure_id = S.id
-        LEFT JOIN cell_reporters CR 
-            ON C.cell_reporter_id = CR.id
-        WHERE SUBSTRING(C.patched_cell_container, 1, 4) 
-            IN (
-                'PCS4',
-                'PXS4',
-                'P1S4',
-                'P2S4',
-                'P4S4',
-                'P5S4',
-                'P6S4',
-                'P8S4',
-                'PAS4',
-                'PBS4',
-                'PFS4',
-                'PVS4'
-            )
-        AND SUBSTRING(C.patched_cell_container, 6, 6) >= '171001'
-    )
-    SELECT
-        *
-    FROM Ivscc
-    WHERE SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '001' AND '050'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '051' AND '100'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '151' AND '200'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '201' AND '250'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '251' AND '300'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '351' AND '400'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '401' AND '450'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '501' AND '550'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '701' AND '750'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '851' AND '900'
-    ORDER BY lims_patch_tube_date DESC, lims_patch_tube_id ASC, lims_patch_tube_number ASC
+    Runs the SQL query of the ivscc_transcriptomics_query.sql file.
     """
 
-    df = pd.DataFrame(limsquery(sql_query))
+    df = run_named_query("ivscc_transcriptomics_query")
     if is_this_py3:
         df = rename_byte_cols(df)
 
@@ -377,63 +642,10 @@ def create_ivscc_transcriptomics_query_to_df():
 
 def create_hct_transcriptomics_query_to_df():
     """
-    Uses same SQL query from hct_transcriptomics_query.sql file.
+    Runs the SQL query of the hct_transcriptomics_query.sql file.
     """
 
-    sql_query = """
-    WITH Hct AS (
-        SELECT
-            C.name AS lims_cell_name,
-            C.patched_cell_container AS lims_patch_tube,
-            SUBSTRING(C.patched_cell_container, 1, 4) AS lims_patch_tube_id,
-            CAST(SUBSTRING(C.patched_cell_container, 6, 6) AS DATE) AS lims_patch_tube_date,
-            SUBSTRING(C.patched_cell_container, 13, 3) AS lims_patch_tube_number,
-            Sp.histology_well_name AS lims_histology_well_name,
-            P.code AS lims_project_code,
-            O.name AS lims_species_type,
-            S.acronym AS lims_structure,
-            CR.name AS lims_cell_reporter,
-            C.cell_depth AS lims_cell_depth,
-            D.name AS lims_donor_name,
-            D.external_donor_name AS lims_specimen_id,
-            D.full_genotype AS lims_slice_genotype
-        FROM specimens C
-        INNER JOIN specimens Sp
-            ON C.parent_id = Sp.id 
-        INNER JOIN donors D 
-            ON D.id = C.donor_id
-        LEFT JOIN organisms O
-            ON D.organism_id = O.id
-        LEFT JOIN projects P
-            ON C.project_id = P.id
-        LEFT JOIN structures S
-            ON C.structure_id = S.id
-        LEFT JOIN cell_reporters CR 
-            ON C.cell_reporter_id = CR.id
-        WHERE SUBSTRING(C.patched_cell_container, 1, 4) 
-            IN (
-                'PCS4',
-                'PXS4',
-                'P3S4',
-                'P7S4',
-                'PJS4',
-                'PKS4',
-                'PLS4',
-                'PSS4'
-            )
-        AND SUBSTRING(C.patched_cell_container, 6, 6) >= '171001'
-    )
-    SELECT
-        *
-    FROM Hct
-    WHERE SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '101' AND '150'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '301' AND '350'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '751' AND '800'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '801' AND '850'
-    ORDER BY lims_patch_tube_date DESC, lims_patch_tube_id ASC, lims_patch_tube_number ASC
-    """
-
-    df = pd.DataFrame(limsquery(sql_query))
+    df = run_named_query("hct_transcriptomics_query")
     if is_this_py3:
         df = rename_byte_cols(df)
 
@@ -442,65 +654,163 @@ def create_hct_transcriptomics_query_to_df():
 
 def create_collab_transcriptomics_query_to_df():
     """
-    Uses same SQL query from collaborator_transcriptomics_query.sql file.
-    """
-
-    sql_query = """
-    WITH Collaborators AS (
-        SELECT
-            C.name AS lims_cell_name,
-            C.patched_cell_container AS lims_patch_tube,
-            SUBSTRING(C.patched_cell_container, 1, 4) AS lims_patch_tube_id,
-            CAST(SUBSTRING(C.patched_cell_container, 6, 6) AS DATE) AS lims_patch_tube_date,
-            SUBSTRING(C.patched_cell_container, 13, 3) AS lims_patch_tube_number,
-            C.cell_depth AS lims_cell_depth,
-            D.external_donor_name AS lims_specimen_id,
-            D.full_genotype AS lims_slice_genotype,
-            D.name AS lims_donor_name, 
-            O.name AS lims_species_type,
-            P.code AS lims_project_code, 
-            S.acronym AS lims_structure
-        FROM specimens C
-        INNER JOIN specimens Sp
-            ON C.parent_id = Sp.id 
-        INNER JOIN donors D 
-            ON D.id = C.donor_id
-        LEFT JOIN organisms O
-            ON D.organism_id = O.id
-        LEFT JOIN projects P
-            ON C.project_id = P.id
-        LEFT JOIN structures S
-            ON C.structure_id = S.id
-        WHERE SUBSTRING(C.patched_cell_container, 1, 4) 
-            IN (
-                'PDS4',
-                'PGS4',
-                'PHS4',
-                'PNS4',
-                'PRS4',
-                'PWS4',
-                'PZS4'
-            )
-        AND SUBSTRING(C.patched_cell_container, 6, 6) >= '171001'
-    )
-    SELECT
-        *
-    FROM Collaborators
-    WHERE SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '001' AND '051'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '101' AND '150'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '201' AND '250'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '501' AND '550'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '601' AND '650'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '651' AND '700'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '701' AND '750'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '801' AND '850'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '851' AND '900'
-    OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '901' AND '950'
-    ORDER BY lims_patch_tube_date DESC, lims_patch_tube_id ASC, lims_patch_tube_number ASC
+    Runs the SQL query of the collborator_transcriptomics_query.sql file.
     """
 
-    df = pd.DataFrame(limsquery(sql_query))
+    df = run_named_query("collborator_transcriptomics_query")
     if is_this_py3:
         df = rename_byte_cols(df)
 
     return df
+
+
+#-----Classes-----#
+class LimsConnectionPool(object):
+    """A pool of open LIMS connections shared by every query of the process.
+
+    Connections are opened on demand up to size and handed back after
+    each query, with its read transaction rolled back so the next query
+    sees current data. A connection idle for more than
+    health_check_seconds is checked with SELECT 1 before it is reused,
+    and broken connections are replaced.
+    """
+
+    def __init__(self, user="limsreader", host="limsdb2", database="lims2", password="limsro", port=5432, size=LIMS_POOL_SIZE,
+                 health_check_seconds=LIMS_HEALTH_CHECK_SECONDS):
+        self.connect_args = {"user": user, "host": host, "database": database, "password": password, "port": port}
+        self.size = max(1, size)
+        self.health_check_seconds = health_check_seconds
+        self.n_connects = 0
+        self._idle = []
+        self._statements = {}
+        self._n_open = 0
+        self._closed = False
+        self._available = threading.Condition()
+
+    def acquire(self):
+        """Returns an open connection, waiting if size connections are in use.
+
+        Returns
+        -------
+        conn : pg8000 connection
+        """
+        with self._available:
+            while True:
+                if self._closed:
+                    raise pg8000.InterfaceError("LIMS connection pool is closed")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._n_open < self.size:
+                    self._n_open += 1
+                    conn = None
+                    break
+                self._available.wait()
+        if conn is not None and (time.time() - idle_since <= self.health_check_seconds or self._is_healthy(conn)):
+            return conn
+        if conn is not None:
+            self._close_conn(conn)
+        try:
+            conn = _connect(**self.connect_args)
+        except Exception:
+            self._forget()
+            raise
+        self.n_connects += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        """Hands a connection back to the pool, rolling back its read transaction.
+
+        Parameters
+        ----------
+        conn : pg8000 connection
+        discard : boolean
+            True closes the connection instead (ex. after a connection error).
+        """
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        with self._available:
+            if not discard and not self._closed:
+                self._idle.append((conn, time.time()))
+                self._available.notify()
+                return
+        self._close_conn(conn)
+        self._forget()
+
+    @contextmanager
+    def connection(self):
+        """Context manager of a pooled connection (with pool.connection() as conn: ...)."""
+        conn = self.acquire()
+        try:
+            yield conn
+        except (pg8000.InterfaceError, OSError):
+            # (Broken connection)
+            self.release(conn, discard=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        self.release(conn)
+
+    def prepare(self, conn, query):
+        """Returns the prepared statement of a query on a pooled connection, preparing
+        it on first use (statements are kept until the connection is closed).
+
+        Parameters
+        ----------
+        conn : pg8000 connection (acquired from this pool)
+        query : string containing SQL query (with :name placeholders)
+
+        Returns
+        -------
+        statement : pg8000 PreparedStatement
+        """
+        statements = self._statements.setdefault(id(conn), {})
+        statement = statements.get(query)
+        if statement is None:
+            statement = conn.prepare(query)
+            statements[query] = statement
+        return statement
+
+    def discard_statement(self, conn, query):
+        """Forgets the prepared statement of a query on a connection (it is prepared again on next use)."""
+        self._statements.get(id(conn), {}).pop(query, None)
+
+    def close(self):
+        """Closes the idle connections, and connections in use as they are released."""
+        with self._available:
+            self._closed = True
+            idle = self._idle
+            self._idle = []
+            self._available.notify_all()
+        for conn, idle_since in idle:
+            self._close_conn(conn)
+            self._forget()
+
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            conn.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _close_conn(self, conn):
+        self._statements.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _forget(self):
+        with self._available:
+            self._n_open -= 1
+            self._available.notify()
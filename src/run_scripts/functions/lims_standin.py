@@ -0,0 +1,249 @@
+"""
+---------------------------------------------------------------------
+File name: lims_standin.py
+Maintainer: Ramkumar Rajanbabu
+---------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: Seeds a local Postgres stand-in of LIMS with synthetic
+specimens, donors, projects, ephys_roi_results, ephys_features and
+ephys_sweeps tables, so the LIMS queries can be timed offline
+---------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import csv
+import io
+import random
+import re
+from datetime import datetime, timedelta
+# File imports
+from functions.lims_backends import StandinLimsBackend
+from functions.sql_registry import get_sql_query
+
+
+#-----Variables-----#
+# Default scale of the stand-in
+STANDIN_N_CELLS = 20000
+STANDIN_SWEEPS_PER_CELL = 40
+# Cells per slice, slices per donor
+CELLS_PER_SLICE = 6
+SLICES_PER_DONOR = 8
+# Patched cell container prefixes (ivscc, hct and collaborator containers) and tube numbers
+CONTAINER_PREFIXES = ["PCS4", "PXS4", "P1S4", "P2S4", "P4S4", "P5S4", "P6S4", "P8S4", "PAS4", "PBS4", "PFS4", "PVS4",
+                      "P3S4", "P7S4", "PJS4", "PKS4", "PLS4", "PSS4", "PDS4", "PGS4", "PHS4", "PNS4", "PRS4", "PWS4", "PZS4"]
+TUBE_NUMBERS = ["%03d" %(number) for number in range(1, 1000)]
+PROJECT_CODES = ["hIVSCC-MET", "hIVSCC-METx", "hIVSCC-METc", "mIVSCC-MET", "mIVSCC-METx", "mIVSCC-MET-U19_AIBS",
+                 "qIVSCC-METa", "MET-NM", "mMPATCHx", "H301", "H301x", "BHA-ODa", "hMMPATCHx"]
+ORGANISMS = ["Mouse", "Human"]
+STRUCTURES = ["VISp", "VISl", "MOp", "SSp", "MTG", "FCx", "TCx", "PCx"]
+CELL_REPORTERS = ["cre reporter positive", "cre reporter negative", "not available"]
+WORKFLOW_STATES = ["manual_passed", "auto_passed", "manual_failed", "auto_failed", "uploaded"]
+# Stimulus (description, type) of the sweeps
+STIMULI = [("EXTPSMOKET180424", "Test"), ("X1PS_SubThresh", "Long Square"), ("X3LP_Rheo", "Long Square"),
+           ("X4PS_SupraThresh", "Long Square"), ("X4PS_SupraThresh_DA_1", "Long Square"), ("X6SP_Rheo", "Short Square"),
+           ("X7RAMP", "Ramp"), ("C2CHIRPA180503", "Chirp"), ("C2CHIRPB180503", "Chirp"), ("C2CHIRPC180503", "Chirp"),
+           ("C2CHIRPD180503", "Chirp"), ("C2MD_LP_neg50", "Long Square"), ("C2MD_LP_neg70", "Long Square")]
+# Tables of the stand-in (columns of ephys_features are the eff.* columns of lims_ephys.sql)
+STANDIN_TABLES = {
+    "organisms": ["id BIGINT PRIMARY KEY", "name TEXT"],
+    "projects": ["id BIGINT PRIMARY KEY", "code TEXT"],
+    "structures": ["id BIGINT PRIMARY KEY", "acronym TEXT"],
+    "cell_reporters": ["id BIGINT PRIMARY KEY", "name TEXT"],
+    "donors": ["id BIGINT PRIMARY KEY", "name TEXT", "external_donor_name TEXT", "full_genotype TEXT", "organism_id BIGINT",
+               "updated_at TIMESTAMP"],
+    "specimens": ["id BIGINT PRIMARY KEY", "name TEXT", "parent_id BIGINT", "donor_id BIGINT", "project_id BIGINT",
+                  "structure_id BIGINT", "cell_reporter_id BIGINT", "ephys_roi_result_id BIGINT", "patched_cell_container TEXT",
+                  "cell_depth DOUBLE PRECISION", "histology_well_name TEXT", "workflow_state TEXT", "updated_at TIMESTAMP"],
+    "ephys_roi_results": ["id BIGINT PRIMARY KEY", "storage_directory TEXT", "created_at TIMESTAMP", "recording_date TIMESTAMP",
+                          "workflow_state TEXT", "electrode_0_pa DOUBLE PRECISION", "failed_electrode_0 BOOLEAN",
+                          "input_resistance_mohm DOUBLE PRECISION", "initial_access_resistance_mohm DOUBLE PRECISION",
+                          "input_access_resistance_ratio DOUBLE PRECISION", "seal_gohm DOUBLE PRECISION", "failed_no_seal BOOLEAN",
+                          "failed_bad_rs BOOLEAN", "failed_other BOOLEAN"],
+    "ephys_features": None,
+    "ephys_stimulus_types": ["id BIGINT PRIMARY KEY", "name TEXT"],
+    "ephys_stimuli": ["id BIGINT PRIMARY KEY", "description TEXT", "ephys_stimulus_type_id BIGINT"],
+    "ephys_sweeps": ["id BIGINT PRIMARY KEY", "specimen_id BIGINT", "ephys_stimulus_id BIGINT", "workflow_state TEXT", "sweep_number INTEGER"],
+}
+# Indexes of the LIMS tables used by the queries
+STANDIN_INDEXES = ["CREATE INDEX ON specimens (name)",
+                   "CREATE INDEX ON specimens (parent_id)",
+                   "CREATE INDEX ON ephys_features (specimen_id)",
+                   "CREATE INDEX ON ephys_sweeps (specimen_id)"]
+
+
+#-----Functions-----#
+def get_feature_columns():
+    """
+    Returns the ephys_features columns of the stand-in (the eff.* columns of lims_ephys.sql).
+
+    Parameters:
+        None
+
+    Returns:
+        columns (list): column definitions ("name TYPE").
+    """
+
+    names = list(dict.fromkeys(re.findall(r"\beff\.(\w+)", get_sql_query("lims_ephys"))))
+    columns = ["specimen_id BIGINT"]
+    for name in names:
+        if name == "specimen_id":
+            continue
+        columns.append("%s %s" %(name, "BOOLEAN" if name.startswith("has_") else "DOUBLE PRECISION"))
+
+    return columns
+
+
+def generate_standin_rows(n_cells=STANDIN_N_CELLS, sweeps_per_cell=STANDIN_SWEEPS_PER_CELL, seed=0):
+    """
+    Generates the synthetic rows of every stand-in table.
+
+    Parameters:
+        n_cells (int): number of patched cells.
+        sweeps_per_cell (int): number of sweeps per cell.
+        seed (int): random seed (the same seed generates the same tables).
+
+    Returns:
+        tables (dictionary): table name: (columns (list), rows (list of lists)).
+    """
+
+    rng = random.Random(seed)
+    feature_columns = [column.split()[0] for column in get_feature_columns()]
+    now = datetime(2026, 1, 1)
+    first_day = datetime(2017, 10, 1)
+    n_days = (now - first_day).days
+    tables = {}
+
+    def lookup(names):
+        return [[idx + 1, name] for idx, name in enumerate(names)]
+    tables["organisms"] = (["id", "name"], lookup(ORGANISMS))
+    tables["projects"] = (["id", "code"], lookup(PROJECT_CODES))
+    tables["structures"] = (["id", "acronym"], lookup(STRUCTURES))
+    tables["cell_reporters"] = (["id", "name"], lookup(CELL_REPORTERS))
+    stimulus_types = list(dict.fromkeys(stimulus_type for description, stimulus_type in STIMULI))
+    tables["ephys_stimulus_types"] = (["id", "name"], lookup(stimulus_types))
+    tables["ephys_stimuli"] = (["id", "description", "ephys_stimulus_type_id"],
+                               [[idx + 1, description + "_DA_0", stimulus_types.index(stimulus_type) + 1]
+                                for idx, (description, stimulus_type) in enumerate(STIMULI)])
+
+    n_slices = max(1, -(-n_cells // CELLS_PER_SLICE))
+    n_donors = max(1, -(-n_slices // SLICES_PER_DONOR))
+    donors = []
+    for donor_id in range(1, n_donors + 1):
+        organism_id = rng.randint(1, len(ORGANISMS))
+        if organism_id == 1:
+            name = "Sst-IRES-Cre;Ai14-%06d" %(400000 + donor_id)
+            genotype = "Sst-IRES-Cre/wt;Ai14(RCL-tdT)/wt"
+        else:
+            name = "H%02d.26.%03d" %(17 + donor_id % 10, donor_id % 1000)
+            genotype = None
+        donors.append([donor_id, name, str(100000 + donor_id), genotype, organism_id,
+                       first_day + timedelta(seconds=rng.randint(0, n_days*86400))])
+    tables["donors"] = (["id", "name", "external_donor_name", "full_genotype", "organism_id", "updated_at"], donors)
+
+    specimens = []
+    roi_results = []
+    features = []
+    sweeps = []
+    specimen_id = 500000000
+    slices = []
+    for slice_idx in range(n_slices):
+        donor = donors[slice_idx // SLICES_PER_DONOR]
+        specimen_id += 1
+        slice_name = "%s.%02d.%02d" %(donor[1], slice_idx % SLICES_PER_DONOR + 1, 1)
+        slices.append((specimen_id, slice_name, donor))
+        specimens.append([specimen_id, slice_name, None, donor[0], None, None, None, None, None, None,
+                          "well_%s" %(rng.randint(1, 96)), "sectioned", donor[5]])
+    for cell_idx in range(n_cells):
+        slice_id, slice_name, donor = slices[cell_idx // CELLS_PER_SLICE]
+        specimen_id += 1
+        recorded = first_day + timedelta(seconds=rng.randint(0, n_days*86400))
+        container = "%s_%s_%s_A%02d" %(rng.choice(CONTAINER_PREFIXES), recorded.strftime("%y%m%d"), rng.choice(TUBE_NUMBERS), rng.randint(1, 12))
+        roi_result_id = 900000000 + cell_idx
+        specimens.append([specimen_id, "%s.%02d" %(slice_name, cell_idx % CELLS_PER_SLICE + 1), slice_id, donor[0],
+                          rng.randint(1, len(PROJECT_CODES)), rng.randint(1, len(STRUCTURES)), rng.randint(1, len(CELL_REPORTERS)),
+                          roi_result_id, container, round(rng.uniform(20, 900), 1), None, rng.choice(WORKFLOW_STATES),
+                          recorded + timedelta(days=rng.randint(0, 30))])
+        roi_results.append([roi_result_id, "/allen/programs/celltypes/production/mousecelltypes/prod%s/Ephys_Roi_Result_%s/" %(rng.randint(0, 999), roi_result_id),
+                            recorded + timedelta(hours=2), recorded, rng.choice(WORKFLOW_STATES),
+                            round(rng.gauss(0, 20), 3), rng.random() < 0.05, round(rng.uniform(50, 900), 3), round(rng.uniform(5, 40), 3),
+                            round(rng.uniform(0.01, 0.2), 4), round(rng.uniform(0.5, 10), 3), rng.random() < 0.05,
+                            rng.random() < 0.05, rng.random() < 0.05])
+        # (Cells without features, as cells that failed QC)
+        if rng.random() < 0.9:
+            features.append([specimen_id] + [(rng.random() < 0.2) if column.startswith("has_") else (round(rng.gauss(0, 50), 6) if rng.random() < 0.95 else None)
+                                              for column in feature_columns[1:]])
+        for sweep_number in range(sweeps_per_cell):
+            sweeps.append([len(sweeps) + 1, specimen_id, rng.randint(1, len(STIMULI)), rng.choice(WORKFLOW_STATES), sweep_number])
+    tables["specimens"] = (["id", "name", "parent_id", "donor_id", "project_id", "structure_id", "cell_reporter_id", "ephys_roi_result_id",
+                            "patched_cell_container", "cell_depth", "histology_well_name", "workflow_state", "updated_at"], specimens)
+    tables["ephys_roi_results"] = ([column.split()[0] for column in STANDIN_TABLES["ephys_roi_results"]], roi_results)
+    tables["ephys_features"] = (feature_columns, features)
+    tables["ephys_sweeps"] = (["id", "specimen_id", "ephys_stimulus_id", "workflow_state", "sweep_number"], sweeps)
+
+    return tables
+
+
+def create_lims_standin(backend=None, n_cells=STANDIN_N_CELLS, sweeps_per_cell=STANDIN_SWEEPS_PER_CELL, seed=0):
+    """
+    Creates the stand-in database if needed, and (re)creates its tables with synthetic rows.
+
+    Parameters:
+        backend (StandinLimsBackend): the local Postgres stand-in (None for the default stand-in).
+        n_cells (int): number of patched cells.
+        sweeps_per_cell (int): number of sweeps per cell.
+        seed (int): random seed.
+
+    Returns:
+        n_rows (dictionary): table name: number of rows.
+    """
+
+    if backend is None:
+        backend = StandinLimsBackend()
+    _create_database(backend)
+    tables = generate_standin_rows(n_cells, sweeps_per_cell, seed)
+
+    conn = backend.connect()
+    try:
+        cursor = conn.cursor()
+        for table, columns in STANDIN_TABLES.items():
+            if columns is None:
+                columns = get_feature_columns()
+            cursor.execute("DROP TABLE IF EXISTS %s" %table)
+            cursor.execute("CREATE TABLE %s (%s)" %(table, ", ".join(columns)))
+            column_names, rows = tables[table]
+            cursor.execute("COPY %s (%s) FROM STDIN WITH (FORMAT csv)" %(table, ", ".join(column_names)), stream=_to_csv(rows))
+        for index in STANDIN_INDEXES:
+            cursor.execute(index)
+        conn.commit()
+        cursor.execute("ANALYZE")
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+    return {table: len(rows) for table, (column_names, rows) in tables.items()}
+
+
+def _create_database(backend):
+    # (Through the postgres maintenance database, CREATE DATABASE cannot run in a transaction)
+    conn = StandinLimsBackend(backend.host, backend.port, "postgres", backend.user, backend.password).connect()
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (backend.database,))
+        if len(cursor.fetchall()) == 0:
+            cursor.execute('CREATE DATABASE "%s"' %backend.database)
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def _to_csv(rows):
+    # (None is written as an unquoted empty field, read as NULL by COPY)
+    stream = io.StringIO()
+    csv.writer(stream).writerows(rows)
+    stream.seek(0)
+    return stream
@@ -0,0 +1,258 @@
+"""
+---------------------------------------------------------------------
+File name: lims_stats.py
+Maintainer: Ramkumar Rajanbabu
+---------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: Per-call LIMS query statistics (connect, execute and fetch
+times, rows and bytes), a run log of slow query plans and a summary
+table printed at exit
+---------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+# File imports
+from functions.sql_registry import find_sql_query_name
+
+
+#-----Variables-----#
+# Environment variable enabling EXPLAIN (ANALYZE) of queries slower than its value in seconds (ex. 5)
+LIMS_EXPLAIN_ENV = "EPHYS_LIMS_EXPLAIN_SECONDS"
+# Directory of the run logs (slow queries and their plans, and the summary table)
+LIMS_RUN_LOG_DIR = os.path.join(os.path.expanduser("~"), ".ephys-analysis-tools", "lims_runs")
+# Rows sampled to estimate the size of a result
+BYTES_SAMPLE_ROWS = 100
+# Query statistics of this process
+_lims_stats = None
+_lims_stats_lock = threading.Lock()
+
+
+#-----Functions-----#
+def get_lims_stats():
+    """
+    Returns the LIMS query statistics of this process (the summary table is printed at exit).
+
+    Parameters:
+        None
+
+    Returns:
+        stats (LimsQueryStats): query statistics.
+    """
+
+    global _lims_stats
+    with _lims_stats_lock:
+        if _lims_stats is None:
+            explain_seconds = os.environ.get(LIMS_EXPLAIN_ENV)
+            _lims_stats = LimsQueryStats(explain_seconds=float(explain_seconds) if explain_seconds else None)
+            atexit.register(_lims_stats.print_summary)
+
+    return _lims_stats
+
+
+def get_query_name(query):
+    """
+    Returns a name for a query in statistics: its name if it is a named query (see
+    sql_registry), or else the beginning of its SQL.
+
+    Parameters:
+        query (string): SQL query.
+
+    Returns:
+        name (string): query name.
+    """
+
+    name = find_sql_query_name(query)
+    if name is None:
+        name = " ".join(query.split())[0:40]
+    elif "AS cached_query" in query:
+        # (Incremental refresh of a cached result, see LimsCache.fetch)
+        name += " (refresh)"
+
+    return name
+
+
+def estimate_rows_bytes(rows, sample_rows=BYTES_SAMPLE_ROWS):
+    """
+    Estimates the size of fetched rows from a sample: the length of text and binary
+    values, and 8 bytes for other values.
+
+    Parameters:
+        rows (list): fetched rows.
+        sample_rows (int): number of rows sampled.
+
+    Returns:
+        n_bytes (int): approximate size.
+    """
+
+    if len(rows) == 0:
+        return 0
+    sample = rows[0:sample_rows]
+    sample_bytes = 0
+    for row in sample:
+        for value in row:
+            if isinstance(value, (str, bytes, bytearray)):
+                sample_bytes += len(value)
+            elif value is not None:
+                sample_bytes += 8
+
+    return int(sample_bytes*len(rows)/len(sample))
+
+
+#-----Classes-----#
+class LimsQueryStats(object):
+    """
+    Statistics of every LIMS query call of a run. Each call records the query name, the
+    number of parameters, the connect time (getting a pooled connection), the execute
+    time, the fetch time (receiving and decoding the rows), the number of rows and their
+    approximate size. With explain_seconds, slower queries are run again with
+    EXPLAIN (ANALYZE, BUFFERS) and their plans written to the run log.
+    """
+
+    def __init__(self, explain_seconds=None, run_log_dir=LIMS_RUN_LOG_DIR):
+        """
+        Parameters:
+            explain_seconds (float): capture the plans of queries slower than this, or None.
+            run_log_dir (string): directory of the run log.
+        """
+
+        self.explain_seconds = explain_seconds
+        self.run_log_dir = run_log_dir
+        self.run_log_path = None
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, query, params, connect_seconds, execute_seconds, fetch_seconds, n_rows, n_bytes):
+        """
+        Records a query call.
+
+        Parameters:
+            query (string): SQL query.
+            params (tuple or dictionary): query parameters, or None.
+            connect_seconds, execute_seconds, fetch_seconds (float): times of the call.
+            n_rows (int): number of rows.
+            n_bytes (int): approximate size of the rows.
+
+        Returns:
+            record (dictionary): the recorded call.
+        """
+
+        record = {"query": get_query_name(query),
+                  "params": len(params) if params else 0,
+                  "connect": connect_seconds,
+                  "execute": execute_seconds,
+                  "fetch": fetch_seconds,
+                  "total": connect_seconds + execute_seconds + fetch_seconds,
+                  "rows": n_rows,
+                  "bytes": n_bytes}
+        with self._lock:
+            self.records.append(record)
+
+        return record
+
+    def is_slow(self, record):
+        """
+        Parameters:
+            record (dictionary): a recorded call.
+
+        Returns:
+            slow (boolean): True if the plan of the call should be captured.
+        """
+
+        return self.explain_seconds is not None and record["execute"] + record["fetch"] >= self.explain_seconds
+
+    def log_plan(self, record, query, params, plan):
+        """
+        Writes a slow query, its parameters and its plan to the run log.
+
+        Parameters:
+            record (dictionary): the recorded call.
+            query (string): SQL query.
+            params (tuple or dictionary): query parameters, or None.
+            plan (list): lines of the EXPLAIN (ANALYZE) output.
+
+        Returns:
+            None
+        """
+
+        lines = ["=" * 80,
+                 "%s  %s  (%.3f s: connect %.3f, execute %.3f, fetch %.3f; %s rows, %.1f MB)"
+                 %(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), record["query"], record["total"], record["connect"],
+                   record["execute"], record["fetch"], record["rows"], record["bytes"]/1e6),
+                 "Parameters: %s" %(str(params)[0:1000]),
+                 "",
+                 query.strip(),
+                 "",
+                 "Plan:"] + list(plan) + [""]
+        self._write_log(lines)
+
+    def summary(self):
+        """
+        Summarizes the recorded calls per query, slowest first.
+
+        Parameters:
+            None
+
+        Returns:
+            summary_df (dataframe): calls, parameters, total times, maximum time, rows and MB per query.
+        """
+
+        with self._lock:
+            records_df = pd.DataFrame(self.records, columns=["query", "params", "connect", "execute", "fetch", "total", "rows", "bytes"])
+        summary_df = records_df.groupby("query", sort=False).agg(calls=("total", "size"), params=("params", "max"),
+                                                               connect_s=("connect", "sum"), execute_s=("execute", "sum"),
+                                                               fetch_s=("fetch", "sum"), total_s=("total", "sum"),
+                                                               max_s=("total", "max"), rows=("rows", "sum"), bytes=("bytes", "sum"))
+        summary_df["mb"] = summary_df.pop("bytes")/1e6
+
+        return summary_df.sort_values("total_s", ascending=False)
+
+    def print_summary(self):
+        """
+        Prints the summary table (and writes it to the run log, if there is one).
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+
+        if len(self.records) == 0:
+            return
+        summary_df = self.summary()
+        title = "LIMS queries: %s calls in %.1f s" %(int(summary_df["calls"].sum()), summary_df["total_s"].sum())
+        table = summary_df.to_string(float_format=lambda value: "%.3f" %value)
+        print("\n%s\n%s" %(title, table))
+        if self.run_log_path is not None:
+            self._write_log(["=" * 80, title, table, ""])
+            print("Slow query plans: %s" %self.run_log_path)
+
+    def _write_log(self, lines):
+        """
+        Appends lines to the run log (created on first use).
+
+        Parameters:
+            lines (list): lines of text.
+
+        Returns:
+            None
+        """
+
+        with self._lock:
+            try:
+                if self.run_log_path is None:
+                    os.makedirs(self.run_log_dir, exist_ok=True)
+                    self.run_log_path = os.path.join(self.run_log_dir, "lims_run_%s_%s.log" %(time.strftime("%Y%m%d_%H%M%S"), os.getpid()))
+                with open(self.run_log_path, "a") as log_file:
+                    log_file.write("\n".join(lines) + "\n")
+            except OSError:
+                print("LIMS run log could not be written to %s." %self.run_log_dir)
@@ -28,8 +28,10 @@ WITH Collaborators AS (
             'PDS4',
             'PGS4',
             'PHS4',
+            'PNS4',
             'PRS4',
-            'PWS4'
+            'PWS4',
+            'PZS4'
         )
     AND SUBSTRING(C.patched_cell_container, 6, 6) >= '171001'
 )
@@ -41,7 +43,9 @@ OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '101' AND '150'
 OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '201' AND '250'
 OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '501' AND '550'
 OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '601' AND '650'
+OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '651' AND '700'
 OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '701' AND '750'
 OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '801' AND '850'
+OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '851' AND '900'
 OR SUBSTRING(lims_patch_tube, 13, 3) BETWEEN '901' AND '950'
 ORDER BY lims_patch_tube_date DESC, lims_patch_tube_id ASC, lims_patch_tube_number ASC
\ No newline at end of file
@@ -0,0 +1,32 @@
+SELECT DISTINCT
+cell.name,
+cell.patched_cell_container,
+cell.cell_depth,
+slice.histology_well_name,
+d.external_donor_name AS id_cell_specimen_id,
+d.full_genotype AS id_slice_genotype,
+d.name AS donor_name,
+org.name AS id_species,
+proj.code AS id_project_code,
+structures.acronym AS structure,
+cell_reporters.name AS cell_reporter,
+cell.id AS cache_cell_id,
+GREATEST(cell.updated_at, slice.updated_at, d.updated_at) AS cache_updated_at
+FROM specimens cell
+INNER JOIN specimens slice ON cell.parent_id = slice.id
+INNER JOIN donors d ON d.id = cell.donor_id
+LEFT JOIN organisms org ON d.organism_id = org.id
+LEFT JOIN projects proj ON cell.project_id = proj.id
+LEFT JOIN structures ON cell.structure_id = structures.id
+LEFT JOIN cell_reporters ON cell.cell_reporter_id = cell_reporters.id
+WHERE SUBSTRING(cell.patched_cell_container FROM 6 FOR 6) BETWEEN :start_day AND :end_day
+-- Optional filters (a NULL parameter does not filter)
+AND (CAST(:date AS TEXT) IS NULL
+    OR POSITION(CAST(:date AS TEXT) IN cell.patched_cell_container) > 0)
+AND (CAST(:exclude_prefixes AS TEXT[]) IS NULL
+    OR SUBSTRING(cell.patched_cell_container FROM 1 FOR 4) <> ALL(CAST(:exclude_prefixes AS TEXT[])))
+-- Tube number (Ex. PXS4_220101_301_A01 -> 301)
+AND (CAST(:tube_numbers AS TEXT[]) IS NULL
+    OR SUBSTRING(cell.patched_cell_container FROM LENGTH(cell.patched_cell_container) - 6 FOR 3) = ANY(CAST(:tube_numbers AS TEXT[])))
+AND (CAST(:exclude_tube_numbers AS TEXT[]) IS NULL
+    OR SUBSTRING(cell.patched_cell_container FROM LENGTH(cell.patched_cell_container) - 6 FOR 3) <> ALL(CAST(:exclude_tube_numbers AS TEXT[])))
\ No newline at end of file
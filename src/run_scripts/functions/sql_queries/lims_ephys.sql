@@ -0,0 +1,78 @@
+SELECT cell.name AS cell_name,
+cell.id AS cell_id,
+cell.patched_cell_container AS tube_id,
+substring(cell.patched_cell_container, 0, 3) as rig_operator,
+cell.workflow_state AS specimen_workflow_state,
+p.code AS project_code,
+err.id AS roi_result_id,
+err.storage_directory AS storage_dir,
+err.created_at AS created_date,
+err.recording_date AS recording_date,
+err.workflow_state AS roiresult_workflow_state,
+err.electrode_0_pa,
+err.failed_electrode_0,
+err.input_resistance_mohm,
+err.initial_access_resistance_mohm,
+err.input_access_resistance_ratio,
+err.seal_gohm,
+err.failed_no_seal,
+err.failed_bad_rs,
+err.failed_other,
+slice.name as slice_name,
+eff.tau,
+eff.upstroke_downstroke_ratio_short_square,
+eff.peak_v_short_square,
+eff.upstroke_downstroke_ratio_ramp,
+eff.threshold_v_ramp,
+eff.sag,
+eff.threshold_t_ramp,
+eff.slow_trough_v_ramp,
+eff.vrest,
+eff.trough_t_ramp,
+eff.trough_v_long_square,
+eff.threshold_t_short_square,
+eff.peak_t_ramp,
+eff.fast_trough_v_ramp,
+eff.trough_t_long_square,
+eff.slow_trough_v_long_square,
+eff.trough_t_short_square,
+eff.slow_trough_t_long_square,
+eff.threshold_v_long_square,
+eff.fast_trough_t_long_square,
+eff.ri,
+eff.threshold_t_long_square,
+eff.threshold_v_short_square,
+eff.avg_isi,
+eff.vm_for_sag,
+eff.threshold_i_long_square,
+eff.threshold_i_short_square,
+eff.slow_trough_t_ramp,
+eff.peak_v_ramp,
+eff.fast_trough_v_short_square,
+eff.fast_trough_t_short_square,
+eff.fast_trough_t_ramp,
+eff.threshold_i_ramp,
+eff.slow_trough_v_short_square,
+eff.peak_t_short_square,
+eff.slow_trough_t_short_square,
+eff.trough_v_short_square,
+eff.f_i_curve_slope,
+eff.peak_t_long_square,
+eff.latency,
+eff.fast_trough_v_long_square,
+eff.upstroke_downstroke_ratio_long_square,
+eff.trough_v_ramp,
+eff.peak_v_long_square,
+eff.adaptation,
+eff.has_delay,
+eff.has_pause,
+eff.has_burst
+FROM specimens cell
+LEFT JOIN ephys_roi_results err ON cell.ephys_roi_result_id = err.id
+LEFT JOIN projects p ON cell.project_id = p.id
+LEFT JOIN specimens slice ON cell.parent_id = slice.id
+LEFT JOIN ephys_features eff ON cell.id = eff.specimen_id
+WHERE p.code = ANY(:project_codes)
+AND substring(cell.patched_cell_container, 0, 3) = ANY(:user_codes)
+AND cell.patched_cell_container IS NOT null
+ORDER BY err.created_at
\ No newline at end of file
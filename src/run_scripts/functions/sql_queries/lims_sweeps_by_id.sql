@@ -0,0 +1,9 @@
+SELECT sw.specimen_id, stim.description, sw.workflow_state, sw.sweep_number, stype.name, specimens.name AS cell_name
+
+FROM ephys_sweeps sw
+
+JOIN ephys_stimuli stim ON stim.id = sw.ephys_stimulus_id
+JOIN specimens ON specimens.id = sw.specimen_id
+JOIN ephys_stimulus_types stype ON stype.id = stim.ephys_stimulus_type_id
+
+WHERE sw.specimen_id = ANY(:specimen_ids)
\ No newline at end of file
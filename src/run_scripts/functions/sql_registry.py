@@ -0,0 +1,85 @@
+"""
+---------------------------------------------------------------------
+File name: sql_registry.py
+Maintainer: Ramkumar Rajanbabu
+---------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: Named SQL queries loaded from the sql_queries directory
+---------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# General imports
+import os
+
+
+#-----Variables-----#
+# Directory of the named queries (<name>.sql, parameters written as :name)
+SQL_QUERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql_queries")
+# Queries read in this process (path: SQL)
+_sql_queries = {}
+
+
+#-----Functions-----#
+def get_sql_query(name, query_dir=SQL_QUERY_DIR):
+    """
+    Returns the SQL of a named query (read from <query_dir>/<name>.sql once per process).
+
+    Parameters:
+        name (string): query name (ex. "lims_sweeps_by_name").
+        query_dir (string): directory of the .sql files.
+
+    Returns:
+        sql (string): SQL query, with :name parameters.
+
+    Raises:
+        KeyError: if there is no query with this name.
+    """
+
+    path = os.path.join(query_dir, name + ".sql")
+    sql = _sql_queries.get(path)
+    if sql is None:
+        if not os.path.exists(path):
+            raise KeyError("Unknown SQL query '%s' (queries: %s)" %(name, ", ".join(list_sql_queries(query_dir))))
+        with open(path, "r") as sql_file:
+            sql = sql_file.read()
+        _sql_queries[path] = sql
+
+    return sql
+
+
+def list_sql_queries(query_dir=SQL_QUERY_DIR):
+    """
+    Lists the named queries.
+
+    Parameters:
+        query_dir (string): directory of the .sql files.
+
+    Returns:
+        names (list): query names.
+    """
+
+    return sorted(file_name[0:-len(".sql")] for file_name in os.listdir(query_dir) if file_name.endswith(".sql"))
+
+
+def find_sql_query_name(sql):
+    """
+    Returns the name of a named query read in this process, from its SQL.
+
+    Parameters:
+        sql (string): SQL query (a named query, or a query wrapping one, ex. in a subquery).
+
+    Returns:
+        name (string): query name, or None if sql is not a named query.
+    """
+
+    containing = None
+    for path, query in _sql_queries.items():
+        if query == sql:
+            return os.path.basename(path)[0:-len(".sql")]
+        if containing is None and query in sql:
+            containing = os.path.basename(path)[0:-len(".sql")]
+
+    return containing
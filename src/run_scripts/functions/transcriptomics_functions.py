@@ -25,7 +25,8 @@ from pathlib import Path, PureWindowsPath
 from functions.file_functions import load_data_variables
 from functions.io_functions import validated_input, validated_date_input, save_xlsx
 from functions.jem_functions import generate_jem_df
-from functions.lims_functions import generate_lims_df
+from functions.jem_watch import WATCH_INTERVAL, JemWatcher, watch
+from functions.lims_functions import generate_lims_df, submit_lims_query
 
 
 #-----General Information-----#
@@ -51,12 +52,15 @@ data_variables = load_data_variables()
 
 
 #-----Daily Transcriptomics Functions-----#
-def generate_daily_report(group):
+def generate_daily_report(group, date_report=None, jem_df=None):
     """
     Generates the daily transcriptomics report.
 
     Parameters:
         group (string): "ivscc" or "hct".
+        date_report (string): date to report on ("YYMMDD"), or None to prompt the user.
+        jem_df (dataframe): a pandas dataframe from generate_jem_df with only patch tubes (ex. from watch mode),
+            or None to generate it.
 
     Returns:
         An excel file with a daily transcriptomics report based on a user specified date.
@@ -83,21 +87,21 @@ def generate_daily_report(group):
         # File name 
         name_report = "ps_transcriptomics_report_HCT"
 
-    # Get last business day
-    last_bday, last_bday_str = generate_last_business_day()
-
-    # User prompts
-    date_report, dt_report = user_prompts_daily(last_bday, last_bday_str)
+    if date_report is None:
+        # Get last business day
+        last_bday, last_bday_str = generate_last_business_day()
+        # User prompts
+        date_report, dt_report = user_prompts_daily(last_bday, last_bday_str)
+    else:
+        dt_report = datetime.strptime(date_report, "%y%m%d").date()
     # Create daily transcriptomics report name
     date_name_report = "%s_%s.xlsx" %(date_report, name_report)
 
-    # Generate lims_df and jem_df with only patch tubes
-    if group == "ivscc":
-        lims_df = generate_lims_df("ivscc", date_report)
-        jem_df = generate_jem_df("ivscc", "only_patch_tubes")
-    if group == "hct":
-        lims_df = generate_lims_df("hct", date_report)
-        jem_df = generate_jem_df("hct", "only_patch_tubes")
+    # Generate lims_df (queried while jem_df is generated) and jem_df with only patch tubes
+    lims_future = submit_lims_query(generate_lims_df, group, date_report)
+    if jem_df is None:
+        jem_df = generate_jem_df(group, "only_patch_tubes")
+    lims_df = lims_future.result()
     # Generate jem_df in daily transcriptomics report format
     jem_df = generate_daily_jem_df(jem_df, dt_report, group)
 
@@ -597,12 +601,16 @@ def test_lims_structure(test_lims_structure_df):
 
 
 #-----Weekly Transcriptomics Functions-----#
-def generate_weekly_report(group):
+def generate_weekly_report(group, day_start=None, day_end=None, jem_df=None):
     """
     Generates the weekly transcriptomics report.
 
     Parameters:
-        None
+        group (string): "ivscc" or "hct".
+        day_start (string): start date/Monday ("YYMMDD"), or None to prompt the user.
+        day_end (string): end date/Sunday ("YYMMDD"), or None to prompt the user.
+        jem_df (dataframe): a pandas dataframe from generate_jem_df with only patch tubes (ex. from watch mode),
+            or None to generate it.
 
     Returns:
         An excel file with a weekly transcriptomics report based on a user specified date range.
@@ -628,10 +636,15 @@ def generate_weekly_report(group):
         # File name 
         name_report = "ps_transcriptomics_report_HCT"
 
-    # Generate date variables
-    day_prev_monday, day_curr_sunday = generate_dates()
-    # User prompts
-    dt_start, dt_end, day_prev_monday, day_curr_sunday = user_prompts_weekly(day_prev_monday, day_curr_sunday)
+    if day_start is None or day_end is None:
+        # Generate date variables
+        day_prev_monday, day_curr_sunday = generate_dates()
+        # User prompts
+        dt_start, dt_end, day_prev_monday, day_curr_sunday = user_prompts_weekly(day_prev_monday, day_curr_sunday)
+    else:
+        day_prev_monday, day_curr_sunday = day_start, day_end
+        dt_start = datetime.strptime(day_prev_monday, "%y%m%d")
+        dt_end = datetime.strptime(day_curr_sunday, "%y%m%d")
     # Create weekly transcriptomics report name
     date_name_report = "%s-%s_%s.xlsx" %(day_prev_monday, day_curr_sunday, name_report)  #name_report[0:-5]
 
@@ -639,10 +652,12 @@ def generate_weekly_report(group):
     # Generate lims_df and jem_df with only patch tubes
     # Generate jem_df in daily transcriptomics report format
     if group == "ivscc":
-        jem_df = generate_jem_df("ivscc", "only_patch_tubes")
+        if jem_df is None:
+            jem_df = generate_jem_df("ivscc", "only_patch_tubes")
         jem_df = generate_weekly_jem_df("ivscc", jem_df, dt_start, dt_end)
     if group == "hct":
-        jem_df = generate_jem_df("hct", "only_patch_tubes")
+        if jem_df is None:
+            jem_df = generate_jem_df("hct", "only_patch_tubes")
         jem_df = generate_weekly_jem_df("hct", jem_df, dt_start, dt_end)
 
     if len(jem_df) > 0:
@@ -789,3 +804,34 @@ def terminal_message_weekly(day_prev_monday, day_curr_sunday, saved_location, re
     print(f"Total Patch Tubes: {len(df)}")
     print()
     print("If all present information is correct, please create a copy from the saved report location and submit the report in the submit report location.")
+
+
+#-----Watch Mode Functions-----#
+def watch_transcriptomics_reports(group, reports=("daily", "weekly"), interval=WATCH_INTERVAL):
+    """
+    Keeps jem_df in memory and regenerates the transcriptomics reports (for the last
+    business day and the previous week) whenever JEM files change, or on demand.
+
+    Parameters:
+        group (string): "ivscc" or "hct".
+        reports (tuple): reports to generate ("daily" and/or "weekly").
+        interval (int): seconds between polls of the JEM directory.
+
+    Returns:
+        None
+    """
+
+    def generate_reports(jem_df):
+        for report in reports:
+            try:
+                if report == "daily":
+                    last_bday, last_bday_str = generate_last_business_day()
+                    generate_daily_report(group, last_bday_str, jem_df.copy())
+                if report == "weekly":
+                    day_prev_monday, day_curr_sunday = generate_dates()
+                    generate_weekly_report(group, day_prev_monday, day_curr_sunday, jem_df.copy())
+            except SystemExit as e:
+                # (No data for the report dates yet, keep watching)
+                print(e.code)
+
+    watch(JemWatcher(group), generate_reports, interval)
@@ -21,7 +21,8 @@ import numpy as np
 import pathlib
 from datetime import date, datetime, timedelta
 # File imports
-from functions.lims_functions import get_lims_ephys, get_lims_sweep
+from functions.json_functions import load_json
+from functions.lims_functions import get_lims_ephys, get_lims_sweeps, submit_lims_query
 # import zmq
 # Test imports
 import time # To measure program execution time
@@ -57,8 +58,10 @@ df.columns = df.columns.astype("str")
 df['recording_date'] = df['recording_date'].dt.strftime('%Y-%m-%d')
 
 
-df['created_date'] = pd.to_datetime(df['created_date'])
+# (created_date is decoded as datetime64 by get_lims_ephys)
 df = df[df['created_date'] >= start_date]
+# Sweeps of every cell, queried while the QC output files are read
+sweep_future = submit_lims_query(get_lims_sweeps, cell_names=list(df['cell_name']))
 
 store_dirs = list(df['storage_dir'])
 storage_dirs  = ['/'+x for x in store_dirs]
@@ -78,8 +81,7 @@ for directory in storage_dirs:
             
             if fil.endswith('EPHYS_QC_V3_QUEUE_' + roi_id + '_output.json'):
                 
-                with open(directory + fil) as f:
-                    ephysqc_data = json.load(f)
+                ephysqc_data = load_json(directory + fil)
                 
                 qc_fail_tags = ephysqc_data["cell_state"]["fail_tags"]
                 failed_qc= ephysqc_data["cell_state"]["failed_qc"]
@@ -137,8 +139,7 @@ for directory in storage_dirs:
                 missing_stim_epoch = []
                 missing_exp_epoch = []
 
-                with open(directory + fil) as f:
-                    stimsum_data = json.load(f) 
+                stimsum_data = load_json(directory + fil)
 
                 cell_tags = stimsum_data['cell_tags']
                 sweep_features = stimsum_data['sweep_features']
@@ -173,8 +174,7 @@ for directory in storage_dirs:
             elif fil.endswith('EPHYS_FEATURE_EXTRACTION_V3_QUEUE_' + roi_id + '_output.json'):
                 
                 try:
-                    with open(directory + fil) as f:
-                        features_data = json.load(f)
+                    features_data = load_json(directory + fil)
                 except json.decoder.JSONDecodeError as e:
                     print(roi_id)
                 
@@ -249,23 +249,17 @@ core1_stims = ['X1PS_SubThresh', 'X3LP_Rheo', 'X4PS_SupraThresh', 'X4PS_SupraThr
 sweep_qc_df = pd.DataFrame(columns=['cell_name'] + core1_stims)
 sweep_qc_df['cell_name'] = cell_list
 
-for cell_name in cell_list:
-   # Add lims_df
-    df = get_lims_sweep(cell_name)
+# Sweeps of every cell (batched), and the workflow state of the last sweep of each stimulus per cell
+sweep_df = sweep_future.result()
+sweep_df = sweep_df.sort_values(by=['sweep_number'], kind='mergesort')
+# (Only the first row of a repeated cell name is filled)
+first_cells = ~sweep_qc_df['cell_name'].duplicated()
 
-    if len(df) > 0:
+for stim in core1_stims:
 
-        for stim in core1_stims:
-
-            stim_df = df[df['description'].str.startswith(stim)].copy()
-            stim_df.sort_values(by=['sweep_number'], inplace=True)
-
-            if len(stim_df) > 0:
-                max_idx = int(len(stim_df))
-                wfs = stim_df.iloc[(max_idx-1), stim_df.columns.get_loc('workflow_state')]
-
-                cell_loc = sweep_qc_df.loc[sweep_qc_df['cell_name'] == cell_name].index[0]
-                sweep_qc_df.loc[cell_loc, stim] = wfs
+    stim_df = sweep_df[sweep_df['description'].str.startswith(stim, na=False)]
+    last_wfs = stim_df.drop_duplicates(subset=['cell_name'], keep='last').set_index('cell_name')['workflow_state']
+    sweep_qc_df.loc[first_cells, stim] = sweep_qc_df.loc[first_cells, 'cell_name'].map(last_wfs)
 
 full_dash_data = dash_data.merge(sweep_qc_df, left_on="cell_name", right_on="cell_name")
 new_file_name = "electrophysiology_pipeline_stim_metrics_" + start_date + "_" + end_date + ".csv"
@@ -5,8 +5,8 @@ Maintainer: Ramkumar Rajanbabu
 -----------------------------------------------------------------------
 Author: Ramkumar Rajanbabu
 Date/time created: 11/14/2022
-Description: Template for generating jem_metadata.csv,
-jem_metadata_wFAILURE.csv, and NA_jem_metadata.csv
+Description: Template for generating the JEM metadata warehouse (and
+optionally jem_metadata.csv, jem_metadata_wFAILURE.csv, and NA_jem_metadata.csv)
 -----------------------------------------------------------------------
 """
 
@@ -19,20 +19,27 @@ import pandas as pd
 from datetime import datetime, date, timedelta
 # File imports
 from functions.file_functions import get_jsons
+from functions.jem_cache import JemCache
 from functions.jem_functions import flatten_jem_data
+from functions.jem_warehouse import JEM_WAREHOUSE_DIR, get_jem_splits, write_jem_warehouse
 from functions.lims_functions import get_lims
 # Test imports
 import time # To measure program execution time
 
 
-def generate_jem_raw_data():
+def generate_jem_raw_data(processes=None, validation_mode="off", sample_every=None, export_csv=False):
 	"""
 	Generates the complied jem data raw?
 
 	Parameters:
-	    None?
+	    processes (int): number of worker processes used to flatten JEM files (None uses every core).
+	    validation_mode (string): "off" (default), "sampled" or "full" validation of the JEM files,
+	        errors are saved to jem_validation_errors.csv in the output directory.
+	    sample_every (int): in "sampled" mode, validates every Nth JEM file.
+	    export_csv (boolean): True to also save the 3 csvs (the warehouse is always written).
 
 	Returns:
+	    JEM metadata warehouse (partitioned by experiment year/month)
 	    3 csvs?
 	final_tube_df : pandas dataframe
 	    Metadata for samples with tubes
@@ -60,21 +67,26 @@ def generate_jem_raw_data():
 	delta_mod_date = (date_today - date_ivscc_pipeline_start).days + 3
 	jem_paths = get_jsons(dirname=json_dir, expt="PS", delta_days=delta_mod_date)
 	# Flatten JSON files (previous 30 day information) to pandas dataframe jem_df)
-	jem_df = flatten_jem_data(jem_paths, day_ivscc_pipeline_start, day_today)
-	jem_df.sort_values(by="date").to_csv(os.path.join(output_dir, "%s_wFAILURE.csv" %file_name), encoding='utf-8-sig', index=False, date_format="%Y-%m-%d")
-	jem_df.sort_values(by=["date"], ascending=False, inplace=True)
+	jem_df = flatten_jem_data(jem_paths, day_ivscc_pipeline_start, day_today, processes=processes, cache=JemCache(),
+	                          validation_mode=validation_mode, sample_every=sample_every,
+	                          validation_path=os.path.join(output_dir, "jem_validation_errors.csv"))
+	n_partitions = write_jem_warehouse(jem_df, JEM_WAREHOUSE_DIR)
+	print("JEM warehouse: %s attempts saved in %s year/month partitions." %(len(jem_df), n_partitions))
 
-	success_df = jem_df[jem_df["status"].str.contains("SUCCESS")]
-	success_df["container"].fillna(value="NA", inplace=True)
-	tube_df = success_df[~(success_df["container"].isin(["NA", "na", "N/A", "n/a"]))]
-	na_df = success_df[success_df["container"].isin(["NA", "na", "N/A", "n/a"])]
+	jem_df.sort_values(by=["date"], ascending=False, inplace=True)
+	splits = get_jem_splits(jem_df)
+	tube_df = jem_df[splits == "tube"]
+	na_df = jem_df[splits == "na"].copy()
+	na_df["container"].fillna(value="NA", inplace=True)
 
-	for data, data_file_name in zip([tube_df, na_df], [file_name, "NA_jem_metadata"]):
-		if len(data) > 0:
-			try:
-				data.sort_values(by="date").to_csv(os.path.join(output_dir, "%s.csv" %data_file_name), encoding='utf-8-sig', index=False, date_format="%Y-%m-%d")
-			except IOError:
-				print("\nOh no! Unable to save spreadsheet :(\nMake sure you don't already have a file with the same name opened.")
+	if export_csv:
+		jem_df.sort_values(by="date").to_csv(os.path.join(output_dir, "%s_wFAILURE.csv" %file_name), encoding='utf-8-sig', index=False, date_format="%Y-%m-%d")
+		for data, data_file_name in zip([tube_df, na_df], [file_name, "NA_jem_metadata"]):
+			if len(data) > 0:
+				try:
+					data.sort_values(by="date").to_csv(os.path.join(output_dir, "%s.csv" %data_file_name), encoding='utf-8-sig', index=False, date_format="%Y-%m-%d")
+				except IOError:
+					print("\nOh no! Unable to save spreadsheet :(\nMake sure you don't already have a file with the same name opened.")
 
 	return tube_df, na_df
 
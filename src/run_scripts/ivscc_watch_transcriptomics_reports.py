@@ -0,0 +1,20 @@
+"""
+-------------------------------------------------------------------------
+File name: ivscc_watch_transcriptomics_reports.py
+Maintainer: Ramkumar Rajanbabu
+-------------------------------------------------------------------------
+Author: Ramkumar Rajanbabu
+Date/time created: 10/18/2026
+Description: Watch the IVSCC JEM directory and regenerate the daily and
+weekly transcriptomics reports (excel documents) when JEM files change
+-------------------------------------------------------------------------
+"""
+
+
+#-----Imports-----#
+# File imports
+from functions.transcriptomics_functions import watch_transcriptomics_reports
+
+
+if __name__ == "__main__":
+	watch_transcriptomics_reports("ivscc")